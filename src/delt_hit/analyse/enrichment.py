@@ -0,0 +1,371 @@
+from pathlib import Path
+from typing import Iterable
+
+import numpy as np
+import pandas as pd
+from loguru import logger
+from scipy import sparse, stats
+
+
+def counts_matrix(samples: Iterable[tuple[str, pd.DataFrame]]) -> tuple[pd.DataFrame, sparse.csc_array, list[str]]:
+    """Assemble per-selection count tables into a sparse compounds x samples matrix.
+
+    Code tuples are encoded as mixed-radix integer keys so that the union over all samples is a single
+    ``np.unique`` over integers instead of a join on multiple columns.
+
+    Args:
+        samples: Iterable of ``(name, counts)`` pairs where ``counts`` has ``code_*`` and ``count`` columns.
+
+    Returns:
+        Tuple of the code tuples per row, the sparse count matrix and the sample names.
+    """
+    names, codes, values = [], [], []
+    code_cols = None
+    for name, df in samples:
+        cols = sorted(filter(lambda x: x.startswith('code_'), df.columns), key=lambda x: int(x.split('_')[-1]))
+        assert code_cols is None or cols == code_cols, f'Selection {name} has code columns {cols}, expected {code_cols}'
+        code_cols = cols
+        names.append(name)
+        codes.append(df[code_cols].to_numpy(dtype=np.int64))
+        values.append(df['count'].to_numpy(dtype=np.float64))
+
+    assert names, 'No samples provided'
+
+    radices = np.max([c.max(axis=0) + 1 if len(c) else np.ones(len(code_cols), dtype=np.int64) for c in codes], axis=0)
+    strides = np.ones(len(radices), dtype=np.int64)
+    strides[:-1] = np.cumprod(radices[::-1])[::-1][1:]
+
+    keys = np.concatenate([c @ strides for c in codes])
+    cols = np.repeat(np.arange(len(names)), [len(c) for c in codes])
+    unique_keys, rows = np.unique(keys, return_inverse=True)
+
+    matrix = sparse.csc_array((np.concatenate(values), (rows, cols)), shape=(len(unique_keys), len(names)))
+    matrix.sum_duplicates()
+
+    unique_codes = (unique_keys[:, None] // strides) % radices
+    unique_codes = pd.DataFrame(unique_codes, columns=code_cols)
+    return unique_codes, matrix, names
+
+
+def lib_sizes(counts: sparse.sparray) -> np.ndarray:
+    """Compute library sizes (column sums).
+
+    Args:
+        counts: Sparse compounds x samples count matrix.
+
+    Returns:
+        Library size per sample.
+    """
+    return np.asarray(counts.sum(axis=0)).ravel()
+
+
+def cpm(counts: sparse.sparray, norm_factors: np.ndarray | None = None, log: bool = False,
+        prior_count: float = 0.5) -> sparse.sparray | np.ndarray:
+    """Compute counts per million.
+
+    Mirrors ``edgeR::cpm``: effective library sizes are ``lib_size * norm_factors``. The non-log result stays sparse,
+    the log result is dense since ``log2(prior)`` is non-zero for every entry.
+
+    Args:
+        counts: Sparse compounds x samples count matrix.
+        norm_factors: Optional normalization factors per sample.
+        log: Whether to return log2-CPM.
+        prior_count: Prior count added before taking the log.
+
+    Returns:
+        CPM matrix.
+    """
+    sizes = lib_sizes(counts)
+    if norm_factors is not None:
+        sizes = sizes * norm_factors
+
+    if not log:
+        return sparse.csc_array(counts @ sparse.diags_array(1e6 / sizes))
+
+    # NOTE: edgeR scales the prior count by the relative library size and adds twice the prior to the library size
+    prior = prior_count * sizes / sizes.mean()
+    sizes = sizes + 2 * prior
+    return np.log2((counts.toarray() + prior) / sizes * 1e6)
+
+
+def _sparse_quantile(values: np.ndarray, n: int, q: float) -> float:
+    """Quantile of a vector with ``n`` entries of which only the non-zero ``values`` are stored.
+
+    Args:
+        values: Non-zero, non-negative entries.
+        n: Total length of the vector including zeros.
+        q: Quantile in ``[0, 1]``.
+
+    Returns:
+        The quantile with linear interpolation (R type 7).
+    """
+    values = np.sort(values)
+    num_zeros = n - len(values)
+
+    def at(k):
+        return 0.0 if k < num_zeros else values[k - num_zeros]
+
+    h = (n - 1) * q
+    lo = int(np.floor(h))
+    hi = min(lo + 1, n - 1)
+    return at(lo) + (h - lo) * (at(hi) - at(lo))
+
+
+def calc_norm_factors(counts: sparse.sparray, ref_column: int | None = None, logratio_trim: float = 0.3,
+                      sum_trim: float = 0.05) -> np.ndarray:
+    """Compute TMM normalization factors.
+
+    Follows ``edgeR::calcNormFactors(method='TMM')`` with precision weighting. Only compounds observed in both the
+    sample and the reference contribute, so the computation touches the non-zero entries only.
+
+    Args:
+        counts: Sparse compounds x samples count matrix.
+        ref_column: Reference sample index. Defaults to the sample whose upper quartile is closest to the mean.
+        logratio_trim: Fraction trimmed from both ends of the log-ratios.
+        sum_trim: Fraction trimmed from both ends of the mean log-expression.
+
+    Returns:
+        Normalization factors per sample, scaled to a geometric mean of 1.
+    """
+    counts = sparse.csc_array(counts)
+    n_rows, n_cols = counts.shape
+    sizes = lib_sizes(counts)
+
+    def column(j):
+        start, end = counts.indptr[j], counts.indptr[j + 1]
+        return counts.indices[start:end], counts.data[start:end]
+
+    if ref_column is None:
+        upper_quartiles = np.array([_sparse_quantile(column(j)[1], n_rows, 0.75) for j in range(n_cols)]) / sizes
+        ref_column = int(np.argmin(np.abs(upper_quartiles - upper_quartiles.mean())))
+
+    ref_idx, ref_val = column(ref_column)
+    factors = np.ones(n_cols)
+    for j in range(n_cols):
+        obs_idx, obs_val = column(j)
+        _, i_obs, i_ref = np.intersect1d(obs_idx, ref_idx, assume_unique=True, return_indices=True)
+        obs, ref = obs_val[i_obs], ref_val[i_ref]
+        n_obs, n_ref = sizes[j], sizes[ref_column]
+
+        log_r = np.log2((obs / n_obs) / (ref / n_ref))
+        abs_e = (np.log2(obs / n_obs) + np.log2(ref / n_ref)) / 2
+        v = (n_obs - obs) / n_obs / obs + (n_ref - ref) / n_ref / ref
+
+        n = len(log_r)
+        if n == 0:
+            continue
+
+        lo_l, lo_s = np.floor(n * logratio_trim) + 1, np.floor(n * sum_trim) + 1
+        hi_l, hi_s = n + 1 - lo_l, n + 1 - lo_s
+        rank_r = stats.rankdata(log_r)
+        rank_e = stats.rankdata(abs_e)
+        keep = (rank_r >= lo_l) & (rank_r <= hi_l) & (rank_e >= lo_s) & (rank_e <= hi_s)
+
+        if keep.any() and (v[keep] > 0).all():
+            factors[j] = 2 ** (np.sum(log_r[keep] / v[keep]) / np.sum(1 / v[keep]))
+
+    return factors / np.exp(np.mean(np.log(factors)))
+
+
+def group_means(values: sparse.sparray | np.ndarray,
+                groups: list[str]) -> tuple[sparse.sparray | np.ndarray, list[str]]:
+    """Average replicate columns per group.
+
+    Args:
+        values: Compounds x samples matrix.
+        groups: Group label per sample.
+
+    Returns:
+        Tuple of the compounds x groups matrix of means and the group labels.
+    """
+    levels = list(dict.fromkeys(groups))
+    design = np.zeros((len(groups), len(levels)))
+    for i, grp in enumerate(groups):
+        design[i, levels.index(grp)] = 1
+    design /= design.sum(axis=0)
+    return values @ design, levels
+
+
+def estimate_dispersion(counts: sparse.sparray, groups: list[str], norm_factors: np.ndarray | None = None) -> float:
+    """Estimate a common negative binomial dispersion by the method of moments.
+
+    Counts are scaled to the mean effective library size and the per-compound, per-group excess variance
+    ``(s^2 - m) / m^2`` is averaged over all groups with at least two replicates.
+
+    Args:
+        counts: Sparse compounds x samples count matrix.
+        groups: Group label per sample.
+        norm_factors: Optional normalization factors per sample.
+
+    Returns:
+        Common dispersion, 0 if no group has replicates.
+    """
+    sizes = lib_sizes(counts) * (1 if norm_factors is None else norm_factors)
+    scaled = sparse.csc_array(counts @ sparse.diags_array(sizes.mean() / sizes))
+    groups = np.asarray(groups)
+
+    numerator, denominator = 0.0, 0
+    for grp in dict.fromkeys(groups):
+        idx = np.flatnonzero(groups == grp)
+        if len(idx) < 2:
+            continue
+        sub = scaled[:, idx]
+        mean = np.asarray(sub.mean(axis=1)).ravel()
+        sq_mean = np.asarray(sub.multiply(sub).mean(axis=1)).ravel()
+        var = (sq_mean - mean ** 2) * len(idx) / (len(idx) - 1)
+        observed = mean > 0
+        numerator += np.sum((var[observed] - mean[observed]) / mean[observed] ** 2)
+        denominator += observed.sum()
+
+    return max(numerator / denominator, 0.0) if denominator else 0.0
+
+
+def p_adjust_bh(p_values: np.ndarray) -> np.ndarray:
+    """Benjamini-Hochberg adjusted p-values.
+
+    Args:
+        p_values: Raw p-values.
+
+    Returns:
+        FDR-adjusted p-values in the input order.
+    """
+    p_values = np.asarray(p_values, dtype=float)
+    n = len(p_values)
+    order = np.argsort(p_values)[::-1]
+    adjusted = p_values[order] * n / np.arange(n, 0, -1)
+    adjusted = np.minimum.accumulate(adjusted)
+    out = np.empty(n)
+    out[order] = np.minimum(adjusted, 1)
+    return out
+
+
+def enrichment_test(counts: sparse.sparray, groups: list[str], treatment: str, control: str,
+                    norm_factors: np.ndarray | None = None, test: str = 'nb',
+                    dispersion: float | None = None) -> pd.DataFrame:
+    """Test every compound for enrichment of ``treatment`` over ``control``.
+
+    ``test='poisson'`` conditions on the compound total, under which the treatment count is binomial with success
+    probability given by the effective library sizes. ``test='nb'`` uses a Wald test on the log fold change with the
+    negative binomial variance ``1 / mu + phi / k`` of the log group totals.
+
+    Args:
+        counts: Sparse compounds x samples count matrix.
+        groups: Group label per sample.
+        treatment: Group label of the treatment (e.g. ``protein``).
+        control: Group label of the control (e.g. ``no_protein``).
+        norm_factors: Optional normalization factors per sample.
+        test: Test to run ('nb' or 'poisson').
+        dispersion: Common dispersion for the 'nb' test, estimated from replicates if not provided.
+
+    Returns:
+        DataFrame with ``logFC``, ``logCPM``, ``PValue`` and ``FDR`` per compound (one-sided, enrichment).
+    """
+    groups = np.asarray(groups)
+    assert treatment in groups, f'Group {treatment} not found in samples'
+    assert control in groups, f'Group {control} not found in samples'
+
+    sizes = lib_sizes(counts) * (1 if norm_factors is None else norm_factors)
+    counts = sparse.csc_array(counts)
+
+    is_trt, is_ctl = groups == treatment, groups == control
+    y_trt = np.asarray(counts[:, np.flatnonzero(is_trt)].sum(axis=1)).ravel()
+    y_ctl = np.asarray(counts[:, np.flatnonzero(is_ctl)].sum(axis=1)).ravel()
+    n_trt, n_ctl = sizes[is_trt].sum(), sizes[is_ctl].sum()
+
+    prior = 0.125
+    log_fc = np.log2((y_trt + prior) / n_trt) - np.log2((y_ctl + prior) / n_ctl)
+    log_cpm = np.log2((y_trt + y_ctl + prior) / (n_trt + n_ctl) * 1e6)
+
+    match test:
+        case 'poisson':
+            total = y_trt + y_ctl
+            p_values = stats.binom.sf(y_trt - 1, total, n_trt / (n_trt + n_ctl))
+        case 'nb':
+            if dispersion is None:
+                dispersion = estimate_dispersion(counts, groups.tolist(), norm_factors=norm_factors)
+            logger.info(f'Using common dispersion {dispersion:.4f}')
+            var = (1 / (y_trt + 0.5) + dispersion / is_trt.sum()) + (1 / (y_ctl + 0.5) + dispersion / is_ctl.sum())
+            z = (np.log((y_trt + 0.5) / n_trt) - np.log((y_ctl + 0.5) / n_ctl)) / np.sqrt(var)
+            p_values = stats.norm.sf(z)
+        case _:
+            raise ValueError(f'Unknown test: {test}')
+
+    return pd.DataFrame({'logFC': log_fc, 'logCPM': log_cpm, 'PValue': p_values, 'FDR': p_adjust_bh(p_values)})
+
+
+def read_selection_counts(selections: list[dict]) -> Iterable[tuple[str, pd.DataFrame]]:
+    """Read the ``counts.txt`` table of each selection.
+
+    Args:
+        selections: Selection entries with ``name`` and ``counts_path``.
+
+    Yields:
+        ``(name, counts)`` pairs.
+    """
+    for sel in selections:
+        counts_path = Path(sel['counts_path']).expanduser().resolve()
+        assert counts_path.exists(), f"Counts file for selection {sel} not found at {counts_path}"
+        counts = pd.read_csv(counts_path, delimiter='\t')
+        yield sel['name'], counts.drop(columns=['id'], errors='ignore')
+
+
+def run_enrichment(*, selections: list[dict], save_dir: Path, method: str = 'edgeR', test: str = 'nb',
+                   treatment: str = 'protein', control: str = 'no_protein', cpm_counts: bool = False,
+                   log: bool = False, fdr: float = 0.05, top_k: int = 100) -> None:
+    """Run an in-process enrichment analysis and write its result tables.
+
+    Args:
+        selections: Selection entries with ``name``, ``group`` and ``counts_path``.
+        save_dir: Directory to write the results into.
+        method: 'counts' for replicate averaged differences, 'edgeR' for TMM normalization and a statistical test.
+        test: Test used by the 'edgeR' method ('nb' or 'poisson').
+        treatment: Group label of the treatment.
+        control: Group label of the control.
+        cpm_counts: Whether the 'counts' method averages CPM instead of raw counts.
+        log: Whether exported normalized counts are log2-CPM.
+        fdr: FDR threshold for hits of the 'edgeR' method.
+        top_k: Number of hits exported by the 'counts' method.
+    """
+    codes, counts, names = counts_matrix(read_selection_counts(selections))
+    group_by_name = {sel['name']: sel['group'] for sel in selections}
+    groups = [group_by_name[n] for n in names]
+    logger.info(f'Loaded {counts.shape[0]} compounds x {counts.shape[1]} selections ({counts.nnz} non-zero)')
+
+    save_dir.mkdir(parents=True, exist_ok=True)
+
+    match method:
+        case 'counts':
+            values = cpm(counts) if cpm_counts else counts
+            means, levels = group_means(values, groups)
+            means = means.toarray() if sparse.issparse(means) else means
+            result = pd.concat([codes, pd.DataFrame(means, columns=levels)], axis=1)
+            if treatment in levels and control in levels:
+                result['enrichment'] = result[treatment] - result[control]
+                hits = result.sort_values('enrichment', ascending=False).head(top_k)
+                hits.to_csv(save_dir / 'hits.csv', index=False)
+            result.to_csv(save_dir / 'stats.csv', index=False)
+            for grp in levels:
+                result[[*codes.columns, grp]].rename(columns={grp: 'count'}).to_csv(save_dir / f'{grp}.csv',
+                                                                                   index=False)
+
+        case 'edgeR':
+            norm_factors = calc_norm_factors(counts)
+            logger.info(f'TMM normalization factors: {dict(zip(names, np.round(norm_factors, 4).tolist()))}')
+
+            stats_ = enrichment_test(counts, groups, treatment=treatment, control=control,
+                                     norm_factors=norm_factors, test=test)
+            stats_ = pd.concat([codes, stats_], axis=1)
+            stats_.to_csv(save_dir / 'enrichment_stats.csv', index=False)
+
+            hits = stats_[(stats_.FDR < fdr) & (stats_.logFC > 0)].sort_values(['logFC', 'FDR'],
+                                                                             ascending=[False, True])
+            hits.to_csv(save_dir / 'enrichment_hits.csv', index=False)
+
+            norm = cpm(counts, norm_factors=norm_factors, log=log)
+            norm = norm.toarray() if sparse.issparse(norm) else norm
+            pd.concat([codes, pd.DataFrame(norm, columns=names)], axis=1).to_parquet(save_dir / 'cpm.parquet',
+                                                                                     index=False)
+        case _:
+            raise ValueError(f'Unknown method: {method}')
+
+    logger.info(f'Saved enrichment results to {save_dir}')
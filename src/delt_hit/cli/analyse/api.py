@@ -1,44 +1,75 @@
+import shutil
 from pathlib import Path
 from textwrap import dedent
 from loguru import logger
 import pandas as pd
 
-from delt_hit.utils import read_yaml
+from delt_hit.utils import read_config
 
 class Analyse:
 
-    def prepare(self, config_path: Path, name: str):
+    def prepare(self, config_path: Path, name: str, output_format: str = 'csv'):
         """Prepare input data for enrichment analysis.
 
         Args:
             config_path: Path to the YAML config file.
             name: Experiment name to prepare.
+            output_format: 'csv' for a single concatenated CSV, 'parquet' to stream selections into a
+                Parquet dataset partitioned by ``name`` and ``group``.
 
         Returns:
             Tuple of data path, samples path, and save directory.
         """
-        cfg = read_yaml(config_path)
+        cfg = read_config(config_path)
         assert name in list(map(lambda x: x['name'], cfg['experiments'])), f'Experiment {name} not found in config.'
 
         exp, = list(filter(lambda x: x['name'] == name, cfg['experiments']))
         save_dir = Path(exp['save_dir']).expanduser().resolve() / exp['name']
 
-        data_path = save_dir / 'data.csv'
-        samples_path = save_dir / 'samples.csv'
+        match output_format:
+            case 'csv':
+                data_path = save_dir / 'data.csv'
+                samples_path = save_dir / 'samples.csv'
+                prepare_data(exp=exp, data_path=data_path, samples_path=samples_path)
+            case 'parquet':
+                data_path = save_dir / 'data'
+                samples_path = save_dir / 'samples.parquet'
+                prepare_dataset(exp=exp, data_dir=data_path, samples_path=samples_path)
+            case _:
+                raise ValueError(f'Unknown format: {output_format}')
 
-        prepare_data(exp=exp, data_path=data_path, samples_path=samples_path)
         logger.info(f'Prepared data at {data_path} and samples at {samples_path}')
         return data_path, samples_path, save_dir
 
-    def enrichment(self, *, config_path: Path, name: str, method: str = 'counts'):
-        """Generate enrichment analysis scripts for an experiment.
+    def enrichment(self, *, config_path: Path, name: str, method: str = 'counts', engine: str = 'python',
+                   test: str = 'nb', treatment: str = 'protein', control: str = 'no_protein',
+                   output_format: str = 'csv'):
+        """Run or generate an enrichment analysis for an experiment.
 
         Args:
             config_path: Path to the YAML config file.
             name: Experiment name to analyze.
             method: Analysis method ('counts' or 'edgeR').
+            engine: 'python' to run the analysis in-process, 'R' to generate R scripts.
+            test: Statistical test of the Python 'edgeR' method ('nb' or 'poisson').
+            treatment: Group label of the treatment selections.
+            control: Group label of the control selections.
+            output_format: Data format prepared for the R engine ('csv' or 'parquet').
         """
-        data_path, samples_path, save_dir = self.prepare(config_path=config_path, name=name)
+        if engine == 'python':
+            from delt_hit.analyse.enrichment import run_enrichment
+
+            cfg = read_config(config_path)
+            assert name in list(map(lambda x: x['name'], cfg['experiments'])), f'Experiment {name} not found in config.'
+            exp, = list(filter(lambda x: x['name'] == name, cfg['experiments']))
+            save_dir = Path(exp['save_dir']).expanduser().resolve() / exp['name']
+
+            run_enrichment(selections=exp['selections'], save_dir=save_dir / method, method=method, test=test,
+                           treatment=treatment, control=control)
+            return
+
+        data_path, samples_path, save_dir = self.prepare(config_path=config_path, name=name,
+                                                         output_format=output_format)
 
         match method:
             case 'counts':
@@ -59,12 +90,32 @@ class Analyse:
         pass
 
 
+def r_read(path: Path, var: str) -> str:
+    """Return the R expression that loads prepared data from ``path``.
+
+    Args:
+        path: Path to a CSV file, a Parquet file or a partitioned Parquet dataset directory.
+        var: R variable holding the path.
+
+    Returns:
+        R code reading the data into a data frame.
+    """
+    match path.suffix:
+        case '.csv':
+            return f'readr::read_csv({var}, show_col_types = FALSE)'
+        case '.parquet':
+            return f'arrow::read_parquet({var})'
+        case _:
+            # NOTE: `group` is a partition key of the dataset and is joined from the samples table instead
+            return f'arrow::open_dataset({var}) |> dplyr::select(-dplyr::any_of("group")) |> dplyr::collect()'
+
+
 def correlation_rscript(*, data_path: Path, samples_path: Path, cpm, save_dir: Path):
     """Create an R script for correlation plots (placeholder).
 
     Args:
-        data_path: Path to the counts CSV.
-        samples_path: Path to the samples CSV.
+        data_path: Path to the counts CSV or Parquet dataset.
+        samples_path: Path to the samples CSV or Parquet file.
         cpm: Whether to use counts per million.
         save_dir: Directory to save the script.
     """
@@ -75,8 +126,8 @@ def edgeR_rscript(*, data_path: Path, samples_path: Path, log: bool = False, sav
     """Generate an edgeR analysis R script.
 
     Args:
-        data_path: Path to the counts CSV.
-        samples_path: Path to the samples CSV.
+        data_path: Path to the counts CSV or Parquet dataset.
+        samples_path: Path to the samples CSV or Parquet file.
         log: Whether to log-transform CPM values.
         save_dir: Directory to write the script into.
     """
@@ -190,8 +241,8 @@ def edgeR_rscript(*, data_path: Path, samples_path: Path, log: bool = False, sav
         }}
 
         # ---- Load data ----
-        data    <- read_csv(args$data_path,    show_col_types = FALSE)
-        samples <- read_csv(args$samples_path, show_col_types = FALSE)
+        data    <- {r_read(data_path, 'args$data_path')}
+        samples <- {r_read(samples_path, 'args$samples_path')}
 
         grp_by_name <- setNames(samples$group, samples$name)
         get_group_from_name <- function(name) grp_by_name[[name]]
@@ -259,8 +310,8 @@ def counts_rscript(*, data_path: Path, samples_path: Path, cpm, save_dir: Path):
     """Generate a simple counts-based analysis R script.
 
     Args:
-        data_path: Path to the counts CSV.
-        samples_path: Path to the samples CSV.
+        data_path: Path to the counts CSV or Parquet dataset.
+        samples_path: Path to the samples CSV or Parquet file.
         cpm: Whether to convert counts to CPM.
         save_dir: Directory to write the script into.
     """
@@ -299,8 +350,8 @@ def counts_rscript(*, data_path: Path, samples_path: Path, cpm, save_dir: Path):
         }}
 
         # ---- Load data ----
-        data <- readr::read_csv(args$data_path, show_col_types = FALSE)
-        samples <- readr::read_csv(args$samples_path, show_col_types = FALSE)
+        data <- {r_read(data_path, 'args$data_path')}
+        samples <- {r_read(samples_path, 'args$samples_path')}
         
         data = data |>
             dplyr::inner_join(samples, by = "name")
@@ -386,3 +437,45 @@ def prepare_data(exp: dict, data_path: Path, samples_path: Path):
     data = pd.concat(data, axis=0)
     data_path.parent.mkdir(parents=True, exist_ok=True)
     data.to_csv(data_path, index=False)
+
+
+def prepare_dataset(exp: dict, data_dir: Path, samples_path: Path, block_size: int = 1 << 26):
+    """Stream counts into a Parquet dataset partitioned by selection name and group.
+
+    Each selection's ``counts.txt`` is read in blocks of ``block_size`` bytes and appended to
+    ``<data_dir>/name=<name>/group=<group>/part-0.parquet``, so at most one block is held in memory. The dataset is
+    written to a temporary directory that replaces ``data_dir`` at the end, so no partitions of a previous run remain.
+
+    Args:
+        exp: Experiment config dict with selections.
+        data_dir: Directory of the partitioned dataset.
+        samples_path: Path to write the samples Parquet file.
+        block_size: Number of bytes parsed per CSV block.
+    """
+    import pyarrow.csv as pacsv
+    import pyarrow.parquet as pq
+
+    selections = exp['selections']
+    samples = pd.DataFrame(selections)[['name', 'group']]
+    samples_path.parent.mkdir(parents=True, exist_ok=True)
+    samples.to_parquet(samples_path, index=False)
+
+    tmp_dir = data_dir.with_name(f'.{data_dir.name}.tmp')
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    for sel in selections:
+        counts_path = Path(sel['counts_path']).expanduser().resolve()
+        assert counts_path.exists(), f"Counts file for selection {sel} not found at {counts_path}"
+
+        part_dir = tmp_dir / f"name={sel['name']}" / f"group={sel['group']}"
+        part_dir.mkdir(parents=True, exist_ok=True)
+
+        reader = pacsv.open_csv(counts_path,
+                                read_options=pacsv.ReadOptions(block_size=block_size),
+                                parse_options=pacsv.ParseOptions(delimiter='\t'))
+        with pq.ParquetWriter(part_dir / 'part-0.parquet', reader.schema) as writer:
+            for batch in reader:
+                writer.write_batch(batch)
+
+    shutil.rmtree(data_dir, ignore_errors=True)
+    tmp_dir.mkdir(parents=True, exist_ok=True)
+    tmp_dir.rename(data_dir)
@@ -1,4 +1,3 @@
-import re
 from pathlib import Path
 
 import dash
@@ -8,7 +7,12 @@ import plotly.graph_objects as go
 import yaml
 from dash import dcc, html, Input, Output, State
 
-from delt_hit.utils import read_yaml
+from delt_hit.dashboard.cache import LRUCache, normalize_filters
+from delt_hit.dashboard.cubes import MarginalCubes
+from delt_hit.dashboard.downsample import downsample
+from delt_hit.dashboard.index import parse_code_intervals
+from delt_hit.dashboard.store import CountStore, find_selection_counts
+from delt_hit.utils import read_config
 
 
 def load_config(config_path):
@@ -48,119 +52,6 @@ def load_config(config_path):
         }
 
 
-def load_counts(counts_path):
-    """Load a counts table, falling back to a small demo dataset.
-
-    Args:
-        counts_path: Path to a TSV counts file.
-
-    Returns:
-        A pandas DataFrame of counts.
-    """
-    try:
-        return pd.read_csv(counts_path, sep='\t')
-    except FileNotFoundError:
-        return pd.DataFrame({
-            'code_1': [1, 1, 1, 6, 7, 8, 9, 10, 11, 12, 14, 16, 17, 20],
-            'code_2': [1, 3, 4, 6, 7, 8, 9, 10, 11, 12, 14, 16, 17, 20],
-            'count': [6, 3, 14, 15, 6, 6, 4, 15, 3, 2, 4, 8, 6, 3]
-        })
-
-
-def get_available_codes(df):
-    """List code columns available in a counts table.
-
-    Args:
-        df: Counts DataFrame.
-
-    Returns:
-        A list of column names starting with ``code_``.
-    """
-    return [col for col in df.columns if col.startswith('code_')]
-
-
-def marginalize_counts(df, selected_codes):
-    """Aggregate counts by selected code columns.
-
-    Args:
-        df: Counts DataFrame.
-        selected_codes: Columns to group by.
-
-    Returns:
-        Aggregated counts DataFrame.
-    """
-    if not selected_codes:
-        return df
-    codes_to_use = selected_codes[:3] if len(selected_codes) > 3 else selected_codes
-    grouped = df.groupby(codes_to_use, dropna=False)['count'].sum().reset_index()
-    return grouped
-
-
-def parse_code_ranges(range_str: str, code_cols: list[str]) -> dict:
-    """Parse a semicolon-delimited set of code filters.
-
-    Example input ``1-3;2-5,8-10;3-5`` yields:
-    ``{'code_1': {1,2,3}, 'code_2': {2,3,4,5,8,9,10}, 'code_3': {3,4,5}}``.
-
-    Args:
-        range_str: Filter string in ``code_1;code_2;...`` order.
-        code_cols: Code column names to map segments onto.
-
-    Returns:
-        A mapping of code columns to allowed integer values.
-    """
-    if not range_str or not isinstance(range_str, str):
-        return {}
-
-    segments = [seg.strip() for seg in range_str.split(';')]
-    filters = {}
-
-    for idx, seg in enumerate(segments):
-        if idx >= len(code_cols):
-            break
-        if not seg:
-            continue
-        allowed = set()
-        for part in seg.split(','):
-            part = part.strip()
-            if not part:
-                continue
-            m = re.match(r'^(-?\d+)\s*-\s*(-?\d+)$', part)
-            if m:
-                a, b = int(m.group(1)), int(m.group(2))
-                lo, hi = (a, b) if a <= b else (b, a)
-                allowed.update(range(lo, hi + 1))
-            else:
-                # single integer
-                try:
-                    allowed.add(int(part))
-                except ValueError:
-                    # ignore malformed tokens
-                    pass
-        if allowed:
-            filters[code_cols[idx]] = allowed
-    return filters
-
-
-def apply_code_filters(df: pd.DataFrame, filters: dict) -> pd.DataFrame:
-    """Filter counts rows by allowed codes.
-
-    Args:
-        df: Counts DataFrame.
-        filters: Mapping of code columns to allowed integer values.
-
-    Returns:
-        The filtered DataFrame.
-    """
-    if not filters:
-        return df
-    mask = pd.Series(True, index=df.index)
-    for col, allowed in filters.items():
-        if col in df.columns:
-            mask &= df[col].isin(allowed)
-    return df.loc[mask]
-
-
 def create_config_cards(config):
     """Build dashboard cards for config sections.
 
@@ -197,30 +88,73 @@ def create_config_cards(config):
     return cards
 
 
-def dashboard(*, config_path: Path, counts_path: Path, selection_name: str | None = None):
+def dashboard(*, config_path: Path, counts_path: Path | None = None, selection_name: str | None = None,
+              selections_dir: Path | None = None, cache_cubes: bool = True, max_points: int = 50_000,
+              cache_entries: int = 64, cache_mb: int = 256):
     """Start the interactive dashboard server.
 
+    With ``counts_path`` a single selection is shown. Otherwise all selections in ``selections_dir`` (defaults to
+    the experiment's ``selections`` directory) are opened at once from a memory-mapped count store and can be
+    switched or overlaid in the UI.
+
     Args:
         config_path: Path to the YAML config file.
-        counts_path: Path to the TSV counts file.
+        counts_path: Optional path to the TSV counts file of a single selection.
         selection_name: Optional selection name override for display.
+        selections_dir: Optional directory with the counts of all selections.
+        cache_cubes: Whether to cache the pre-aggregated marginal cubes next to the counts file.
+        max_points: Default maximum number of scatter points sent to the browser when downsampling.
+        cache_entries: Maximum number of aggregated frames and figures kept for recently shown views.
+        cache_mb: Memory budget of the view cache in MiB.
     """
     # Load data
-    config = read_yaml(config_path)
-    counts_df = pd.read_csv(counts_path, sep='\t')
+    config = read_config(config_path)
+
+    if counts_path is not None:
+        selection_name = selection_name or counts_path.parent.name
+        sources = {selection_name: counts_path}
+        # Prefer the experiment-wide store written by `demultiplex process` over parsing the TSV
+        shared = [counts_path.parent / 'counts.arrow', counts_path.parent.parent / 'counts.arrow']
+        store_path = next((path for path in shared if CountStore.is_fresh(path, sources)),
+                          counts_path.with_suffix('.arrow'))
+    else:
+        save_dir = Path(config['experiment']['save_dir']).expanduser().resolve()
+        selections_dir = selections_dir or save_dir / config['experiment']['name'] / 'selections'
+        sources = find_selection_counts(selections_dir)
+        assert sources, f'No counts found in {selections_dir}'
+        store_path = selections_dir / 'counts.arrow'
+
+    store = CountStore.open_or_build(sources, store_path)
+    assert store is not None, f'All counts tables in {store_path.parent} are empty'
+    available_selections = list(sources)
+    selection_name = selection_name or available_selections[0]
+    config['selections'] = {k: v for k, v in config['selections'].items() if k in available_selections}
+
+    available_codes = store.code_cols
+    cubes = {}
+    view_cache = LRUCache(max_entries=cache_entries, max_bytes=cache_mb * 2 ** 20)
 
-    selection_name = selection_name or counts_path.parent.name
-    (_, selection), = list(filter(lambda x: x[0] == selection_name, config['selections'].items()))
-    config['selections'] = {selection_name: selection}
+    def get_cubes(name):
+        """Return the marginal cubes of a selection, building them on first use.
 
-    available_codes = get_available_codes(counts_df)
+        Args:
+            name: Selection name.
+
+        Returns:
+            The selection's MarginalCubes.
+        """
+        if name not in cubes:
+            cubes[name] = MarginalCubes.from_counts(store.sources[name], store.frame(name), available_codes,
+                                                    cache=cache_cubes)
+        return cubes[name]
+
+    get_cubes(selection_name)
 
     # Defaults for filters
-    def default_code_range_string(df, code_cols):
+    def default_code_range_string(code_cols):
         """Build a default filter string from min/max values.
 
         Args:
-            df: Counts DataFrame.
             code_cols: Code columns to include.
 
         Returns:
@@ -228,16 +162,12 @@ def dashboard(*, config_path: Path, counts_path: Path, selection_name: str | Non
         """
         segs = []
         for c in code_cols:
-            if c in df and df[c].notna().any():
-                try:
-                    mn, mx = int(df[c].min()), int(df[c].max())
-                    segs.append(f"{mn}-{mx}")
-                except Exception:
-                    segs.append("")  # non-integer codes: leave blank
-            else:
-                segs.append("")
+            value_range = store.value_range(c)
+            segs.append(f"{value_range[0]}-{value_range[1]}" if value_range else "")
         return ';'.join(segs) if segs else ""
 
+    count_range = store.value_range('count') or (0, 0)
+
     # Initialize Dash app
     app = dash.Dash(__name__)
 
@@ -268,6 +198,16 @@ def dashboard(*, config_path: Path, counts_path: Path, selection_name: str | Non
         # Controls
         html.Div([
             html.H2("Counts Analysis", className="text-2xl font-bold mb-4"),
+            html.Div([
+                html.Label("Selections (select several to overlay):", className="font-semibold mb-2 block"),
+                dcc.Dropdown(
+                    id='selection-selector',
+                    options=[{'label': n, 'value': n} for n in available_selections],
+                    value=[selection_name],
+                    multi=True,
+                    clearable=False
+                )
+            ], className="bg-white p-4 rounded-lg shadow mb-4"),
             html.Div([
                 html.Div([
                     html.Label("X-axis:", className="font-semibold mb-2 block"),
@@ -314,6 +254,23 @@ def dashboard(*, config_path: Path, counts_path: Path, selection_name: str | Non
                         inputStyle={"margin-right": "6px"},
                         style={"margin-top": "8px"}
                     ),
+                    dcc.Checklist(
+                        id='downsample',
+                        options=[{'label': 'Downsample large plots', 'value': 'on'}],
+                        value=['on'],
+                        inputStyle={"margin-right": "6px"},
+                        style={"margin-top": "8px"}
+                    ),
+                    dcc.Input(
+                        id='max-points',
+                        type='number',
+                        value=max_points,
+                        min=1,
+                        step=1000,
+                        placeholder="Max points",
+                        style={'width': '100%', "margin-top": "8px"},
+                        className="border border-gray-300 rounded-md px-2 py-1"
+                    ),
                 ], className="w-1/4 pl-2"),
             ], className="flex bg-white p-4 rounded-lg shadow mb-4")
         ]),
@@ -328,7 +285,9 @@ def dashboard(*, config_path: Path, counts_path: Path, selection_name: str | Non
                             "Code Ranges (e.g. '1-3;2-5,8-10;3-5')",
                             html.Span(
                                 " ⓘ",
-                                title="Separate indices with commas (1,2,7), use dashes for ranges (3-10), combine them (1-3,8,10-12), and use semicolons between code columns. Example: 1-3;2-5,8-10;3-5",
+                                title="Separate indices with commas (1,2,7), use dashes for ranges (3-10), combine "
+                                      "them (1-3,8,10-12), leave the end of a range open (100-), and use semicolons "
+                                      "between code columns. Example: 1-3;2-5,8-10;3-5",
                                 style={
                                     "cursor": "help",
                                     "marginLeft": "6px",
@@ -346,7 +305,7 @@ def dashboard(*, config_path: Path, counts_path: Path, selection_name: str | Non
                     dcc.Input(
                         id='filter-codes',
                         type='text',
-                        value=default_code_range_string(counts_df, available_codes),
+                        value=default_code_range_string(available_codes),
                         style={'width': '100%'},
                         className="mb-2 border border-gray-300 rounded-md px-2 py-1 "
                                   "focus:outline-none focus:ring-1 focus:ring-blue-600"
@@ -359,7 +318,7 @@ def dashboard(*, config_path: Path, counts_path: Path, selection_name: str | Non
                     dcc.Input(
                         id='filter-min-count',
                         type='number',
-                        value=int(counts_df['count'].min()) if not counts_df.empty else 0,
+                        value=count_range[0],
                         step=1,
                         style={'width': '100%'},
                         className="mb-2 border border-gray-300 rounded-md px-2 py-1 "
@@ -373,7 +332,7 @@ def dashboard(*, config_path: Path, counts_path: Path, selection_name: str | Non
                     dcc.Input(
                         id='filter-max-count',
                         type='number',
-                        value=int(counts_df['count'].max()) if not counts_df.empty else 0,
+                        value=count_range[1],
                         step=1,
                         style={'width': '100%'},
                         className="mb-2 border border-gray-300 rounded-md px-2 py-1 "
@@ -421,35 +380,41 @@ def dashboard(*, config_path: Path, counts_path: Path, selection_name: str | Non
         if not n_clicks:
             raise dash.exceptions.PreventUpdate
         return (
-            default_code_range_string(counts_df, available_codes),
-            int(counts_df['count'].min()) if not counts_df.empty else 0,
-            int(counts_df['count'].max()) if not counts_df.empty else 0
+            default_code_range_string(available_codes),
+            count_range[0],
+            count_range[1]
         )
 
     @app.callback(
         [Output('counts-plot', 'figure'),
          Output('stats-display', 'children')],
-        [Input('x-axis-selector', 'value'),
+        [Input('selection-selector', 'value'),
+         Input('x-axis-selector', 'value'),
          Input('y-axis-selector', 'value'),
          Input('z-axis-selector', 'value'),
          Input('color-by-count', 'value'),
          Input('size-by-count', 'value'),
+         Input('downsample', 'value'),
+         Input('max-points', 'value'),
          Input('filter-button', 'n_clicks')],
         [State('filter-codes', 'value'),
          State('filter-min-count', 'value'),
          State('filter-max-count', 'value')],
         prevent_initial_call=False
     )
-    def update_plot_and_stats(x_axis, y_axis, z_axis, color_by_count, size_by_count,
-                              n_clicks_filter, range_str, min_count, max_count):
+    def update_plot_and_stats(selection_names, x_axis, y_axis, z_axis, color_by_count, size_by_count, downsample_on,
+                              max_points, n_clicks_filter, range_str, min_count, max_count):
         """Update the plot and stats panel based on UI inputs.
 
         Args:
+            selection_names: Selections to show, overlaid if several.
             x_axis: Selected X-axis column.
             y_axis: Selected Y-axis column.
             z_axis: Selected Z-axis column (3D only).
             color_by_count: Toggle to color by count.
             size_by_count: Toggle to size by count.
+            downsample_on: Toggle to downsample scatter plots.
+            max_points: Maximum number of scatter points when downsampling.
             n_clicks_filter: Click count from filter button.
             range_str: Code range filter string.
             min_count: Minimum count filter.
@@ -466,28 +431,43 @@ def dashboard(*, config_path: Path, counts_path: Path, selection_name: str | Non
                                      showarrow=False, font_size=16)
             return empty_fig, "No axes selected"
 
-        # 1) Apply code range filtering on the raw data
-        code_filters = parse_code_ranges(range_str, available_codes)
-        df_filtered = apply_code_filters(counts_df, code_filters)
+        # 1) Parse code range filters
+        code_filters = parse_code_intervals(range_str, available_codes)
 
         # 2) Collect selected code columns (from axes) to aggregate
         selected_codes = []
         for axis in (x_axis, y_axis, z_axis):
             if axis not in ('None', 'count') and axis is not None:
                 selected_codes.append(axis)
-        selected_codes = list(dict.fromkeys(selected_codes))
+        selected_codes = list(dict.fromkeys(selected_codes))[:3]
+
+        # 3) Filter and aggregate/marginalize on the smallest pre-aggregated cube of each selection
+        selection_names = selection_names or [selection_name]
+        overlay = len(selection_names) > 1
+        min_count = int(min_count) if min_count is not None else None
+        max_count = int(max_count) if max_count is not None else None
 
-        # 3) Aggregate/marginalize
-        if selected_codes:
-            plot_data = marginalize_counts(df_filtered, selected_codes)
-        else:
-            plot_data = pd.DataFrame({'count': [df_filtered['count'].sum()]})
+        def aggregate():
+            """Query the cubes of all shown selections and apply the min/max count filters.
 
-        # 4) Apply min/max count filters on aggregated data (if provided)
-        if min_count is not None:
-            plot_data = plot_data.loc[plot_data['count'] >= int(min_count)]
-        if max_count is not None:
-            plot_data = plot_data.loc[plot_data['count'] <= int(max_count)]
+            Returns:
+                Aggregated plot data with a ``selection`` column.
+            """
+            data = pd.concat([get_cubes(n).query(selected_codes, code_filters).assign(selection=n)
+                              for n in selection_names], ignore_index=True)
+
+            # 4) Apply min/max count filters on aggregated data (if provided)
+            if min_count is not None:
+                data = data.loc[data['count'] >= min_count]
+            if max_count is not None:
+                data = data.loc[data['count'] <= max_count]
+            return data
+
+        # Views are cached on the normalized inputs, so toggling back to a previous view skips all recomputation.
+        # Filters that keep every code of a selection are dropped from the key.
+        data_key = ('data', tuple((n, normalize_filters(get_cubes(n).effective_filters(code_filters)))
+                                  for n in selection_names), tuple(selected_codes), min_count, max_count)
+        plot_data = view_cache.get_or_compute(data_key, aggregate)
 
         # Compute stats
         total_entries = len(plot_data)
@@ -498,6 +478,7 @@ def dashboard(*, config_path: Path, counts_path: Path, selection_name: str | Non
         codes_used_text = f"Codes used (grouped): {', '.join(selected_codes)}" if selected_codes else "No codes (total aggregation)"
 
         stats = html.Div([
+            html.P(f"Selections: {', '.join(selection_names)}"),
             html.P(codes_used_text),
             html.P(f"Data points (after filters): {total_entries}"),
             html.P(f"Total counts (after filters): {total_counts:,}"),
@@ -508,167 +489,204 @@ def dashboard(*, config_path: Path, counts_path: Path, selection_name: str | Non
                 f"Min/Max count filters: {min_count if min_count is not None else '-'} / {max_count if max_count is not None else '-'}")
         ])
 
-        # Visual encodings
-        color_dim = 'count' if ('on' in (color_by_count or [])) else None
-        size_dim = 'count' if ('on' in (size_by_count or [])) else None
-
-        use_3d = (z_axis != 'None')
-
-        def labels_for(x=None, y=None, z=None):
-            """Build Plotly axis labels for selected dimensions.
-
-            Args:
-                x: X-axis column name.
-                y: Y-axis column name.
-                z: Z-axis column name.
+        def build_figure():
+            """Build the figure of the current view.
 
             Returns:
-                Label mapping for Plotly.
+                The figure as a plain dictionary.
             """
-            lab = {}
-            if x: lab[x] = x
-            if y: lab[y] = y
-            if z: lab[z] = z
-            lab['count'] = 'Count'
-            return lab
-
-        fig = go.Figure()
-
-        # 3D plot
-        if use_3d:
-            if x_axis == 'None' or y_axis == 'None':
-                fig.add_annotation(text="For 3D, please select X, Y, and Z.",
-                                   xref="paper", yref="paper", x=0.5, y=0.5,
-                                   showarrow=False, font_size=16)
-            else:
-                fig = px.scatter_3d(
-                    plot_data,
-                    x=x_axis if x_axis != 'None' else None,
-                    y=y_axis if y_axis != 'None' else None,
-                    z=z_axis if z_axis != 'None' else None,
-                    color=color_dim,
-                    size=size_dim,
-                    labels=labels_for(x_axis, y_axis, z_axis),
-                    title=f"3D: {x_axis} vs {y_axis} vs {z_axis}"
-                          f"{' • color=count' if color_dim else ''}"
-                          f"{' • size=count' if size_dim else ''}"
-                )
-
-                # Make 3D fill space better and avoid a squashed z axis
-                fig.update_layout(
-                    scene=dict(
-                        aspectmode='cube',  # equal on-screen scale for x/y/z
-                        xaxis=dict(zeroline=False),
-                        yaxis=dict(zeroline=False),
-                        zaxis=dict(zeroline=False),
-                        domain=dict(x=[0.0, 1.0], y=[0.0, 1.0])  # occupy full area
-                    )
-                )
-
-                # Make sized points more visible in 3D
-                # fig.update_traces(
-                #     marker=dict(
-                #         sizemode='diameter',
-                #         sizeref=None,  # let Plotly auto-compute
-                #     ),
-                #     selector=dict(type='scatter3d')
-                # )
-
-                # If not sizing by count, set a comfortable fixed size in 3D
-                if size_dim is None:
-                    fig.update_traces(marker=dict(size=3), selector=dict(type='scatter3d'))
-        else:
-            # 2D cases
-            if x_axis == 'None' or y_axis == 'None':
-                if x_axis != 'None':
-                    if x_axis == 'count':
-                        fig = px.histogram(
-                            plot_data, x='count',
-                            title='Distribution of Counts',
-                            labels={'count': 'Count', 'count_count': 'Frequency'}
-                        )
-                    else:
-                        fig = px.bar(
-                            plot_data, x=x_axis, y='count',
-                            title=f'Counts by {x_axis}',
-                            labels={'count': 'Count', x_axis: x_axis}
-                        )
-                elif y_axis != 'None':
-                    if y_axis == 'count':
-                        fig = px.bar(x=['Total'], y=[total_counts],
-                                     title='Total Counts')
-                    else:
-                        fig = px.bar(
-                            plot_data, y=y_axis, x='count',
-                            orientation='h',
-                            title=f'Counts by {y_axis}',
-                            labels={'count': 'Count', y_axis: y_axis}
-                        )
-            else:
-                if x_axis == 'count' and y_axis == 'count':
-                    fig.add_annotation(text="Cannot plot count vs count",
+            # Visual encodings
+            color_dim = 'count' if ('on' in (color_by_count or [])) else None
+            size_dim = 'count' if ('on' in (size_by_count or [])) else None
+            group_dim = 'selection' if overlay else None
+
+            use_3d = (z_axis != 'None')
+
+            # Cap the points sent to the browser; narrowing the code ranges below the cap shows full resolution
+            scatter_data = plot_data
+            if 'on' in (downsample_on or []) and max_points and not plot_data.empty:
+                axes = list(dict.fromkeys(a for a in (x_axis, y_axis, z_axis) if a not in ('None', None)))
+                budget = max(int(max_points) // len(selection_names), 1)
+                scatter_data = pd.concat([downsample(grp, axes=axes, max_points=budget).assign(selection=n)
+                                          for n, grp in plot_data.groupby('selection', sort=False)], ignore_index=True)
+            downsample_text = f" • showing {len(scatter_data):,} of {total_entries:,} points" \
+                if len(scatter_data) < total_entries else ''
+            hover_data = ['n_points'] if 'n_points' in scatter_data else None
+
+            def labels_for(x=None, y=None, z=None):
+                """Build Plotly axis labels for selected dimensions.
+
+                Args:
+                    x: X-axis column name.
+                    y: Y-axis column name.
+                    z: Z-axis column name.
+
+                Returns:
+                    Label mapping for Plotly.
+                """
+                lab = {}
+                if x: lab[x] = x
+                if y: lab[y] = y
+                if z: lab[z] = z
+                lab['count'] = 'Count'
+                return lab
+
+            fig = go.Figure()
+
+            # 3D plot
+            if use_3d:
+                if x_axis == 'None' or y_axis == 'None':
+                    fig.add_annotation(text="For 3D, please select X, Y, and Z.",
                                        xref="paper", yref="paper", x=0.5, y=0.5,
                                        showarrow=False, font_size=16)
-                elif x_axis == 'count':
-                    fig = px.scatter(
-                        plot_data, x='count', y=y_axis,
-                        color=color_dim, size=size_dim,
-                        title=f'Count vs {y_axis}'
+                else:
+                    fig = px.scatter_3d(
+                        scatter_data,
+                        x=x_axis if x_axis != 'None' else None,
+                        y=y_axis if y_axis != 'None' else None,
+                        z=z_axis if z_axis != 'None' else None,
+                        color=color_dim or group_dim,
+                        size=size_dim,
+                        hover_data=hover_data,
+                        labels=labels_for(x_axis, y_axis, z_axis),
+                        title=f"3D: {x_axis} vs {y_axis} vs {z_axis}"
                               f"{' • color=count' if color_dim else ''}"
-                              f"{' • size=count' if size_dim else ''}",
-                        labels={'count': 'Count', y_axis: y_axis}
+                              f"{' • size=count' if size_dim else ''}"
+                              f"{downsample_text}"
                     )
-                elif y_axis == 'count':
-                    if len(plot_data) < 20 and not size_dim:
-                        fig = px.bar(
-                            plot_data, x=x_axis, y='count',
-                            title=f'Counts by {x_axis}',
-                            labels={'count': 'Count', x_axis: x_axis}
+
+                    # Make 3D fill space better and avoid a squashed z axis
+                    fig.update_layout(
+                        scene=dict(
+                            aspectmode='cube',  # equal on-screen scale for x/y/z
+                            xaxis=dict(zeroline=False),
+                            yaxis=dict(zeroline=False),
+                            zaxis=dict(zeroline=False),
+                            domain=dict(x=[0.0, 1.0], y=[0.0, 1.0])  # occupy full area
+                        )
+                    )
+
+                    # Make sized points more visible in 3D
+                    # fig.update_traces(
+                    #     marker=dict(
+                    #         sizemode='diameter',
+                    #         sizeref=None,  # let Plotly auto-compute
+                    #     ),
+                    #     selector=dict(type='scatter3d')
+                    # )
+
+                    # If not sizing by count, set a comfortable fixed size in 3D
+                    if size_dim is None:
+                        fig.update_traces(marker=dict(size=3), selector=dict(type='scatter3d'))
+            else:
+                # 2D cases
+                if x_axis == 'None' or y_axis == 'None':
+                    if x_axis != 'None':
+                        if x_axis == 'count':
+                            fig = px.histogram(
+                                plot_data, color=group_dim, x='count',
+                                title='Distribution of Counts',
+                                labels={'count': 'Count', 'count_count': 'Frequency'}
+                            )
+                        else:
+                            fig = px.bar(
+                                plot_data, color=group_dim, x=x_axis, y='count',
+                                title=f'Counts by {x_axis}',
+                                labels={'count': 'Count', x_axis: x_axis}
+                            )
+                    elif y_axis != 'None':
+                        if y_axis == 'count':
+                            fig = px.bar(x=['Total'], y=[total_counts],
+                                         title='Total Counts')
+                        else:
+                            fig = px.bar(
+                                plot_data, color=group_dim, y=y_axis, x='count',
+                                orientation='h',
+                                title=f'Counts by {y_axis}',
+                                labels={'count': 'Count', y_axis: y_axis}
+                            )
+                else:
+                    if x_axis == 'count' and y_axis == 'count':
+                        fig.add_annotation(text="Cannot plot count vs count",
+                                           xref="paper", yref="paper", x=0.5, y=0.5,
+                                           showarrow=False, font_size=16)
+                    elif x_axis == 'count':
+                        fig = px.scatter(
+                            scatter_data, x='count', y=y_axis,
+                            color=color_dim or group_dim, size=size_dim,
+                            hover_data=hover_data, render_mode='webgl',
+                            title=f'Count vs {y_axis}'
+                                  f"{' • color=count' if color_dim else ''}"
+                                  f"{' • size=count' if size_dim else ''}"
+                                  f"{downsample_text}",
+                            labels={'count': 'Count', y_axis: y_axis}
                         )
+                    elif y_axis == 'count':
+                        if len(plot_data) < 20 and not size_dim:
+                            fig = px.bar(
+                                plot_data, color=group_dim, x=x_axis, y='count',
+                                title=f'Counts by {x_axis}',
+                                labels={'count': 'Count', x_axis: x_axis}
+                            )
+                        else:
+                            fig = px.scatter(
+                                scatter_data, x=x_axis, y='count',
+                                color=color_dim or group_dim, size=size_dim,
+                                hover_data=hover_data, render_mode='webgl',
+                                title=f'Counts by {x_axis}'
+                                      f"{' • color=count' if color_dim else ''}"
+                                      f"{' • size=count' if size_dim else ''}"
+                                      f"{downsample_text}",
+                                labels={'count': 'Count', x_axis: x_axis}
+                            )
                     else:
                         fig = px.scatter(
-                            plot_data, x=x_axis, y='count',
-                            color=color_dim, size=size_dim,
-                            title=f'Counts by {x_axis}'
+                            scatter_data, x=x_axis, y=y_axis,
+                            color=color_dim or group_dim, size=size_dim,
+                            hover_data=hover_data, render_mode='webgl',
+                            title=f'{y_axis} vs {x_axis}'
                                   f"{' • color=count' if color_dim else ''}"
-                                  f"{' • size=count' if size_dim else ''}",
-                            labels={'count': 'Count', x_axis: x_axis}
+                                  f"{' • size=count' if size_dim else ''}"
+                                  f"{downsample_text}",
+                            labels={x_axis: x_axis, y_axis: y_axis}
                         )
-                else:
-                    fig = px.scatter(
-                        plot_data, x=x_axis, y=y_axis,
-                        color=color_dim, size=size_dim,
-                        title=f'{y_axis} vs {x_axis}'
-                              f"{' • color=count' if color_dim else ''}"
-                              f"{' • size=count' if size_dim else ''}",
-                        labels={x_axis: x_axis, y_axis: y_axis}
-                    )
 
-        fig.update_layout(
-            plot_bgcolor='white',
-            paper_bgcolor='white',
-            font=dict(size=12),
-            title_font_size=16,
-            showlegend=False,
-            height=800
-        )
-
-        # Remove white marker borders everywhere; give a default size if not scaling by count
-        fig.update_traces(
-            marker=dict(
-                line=dict(width=0),
-            ),
-            selector=dict(mode='markers')
-        )
-
-        # If not using size-by-count, ensure a readable default marker size
-        if size_dim is None:
-            fig.update_traces(marker=dict(size=2), selector=dict(mode='markers'))
-
-        # Tighten margins so the plot uses more space
-        fig.update_layout(
-            margin=dict(l=0, r=0, t=44, b=0),  # leave a little room for the title
-        )
+            fig.update_layout(
+                plot_bgcolor='white',
+                paper_bgcolor='white',
+                font=dict(size=12),
+                title_font_size=16,
+                showlegend=overlay,
+                height=800
+            )
+
+            # Remove white marker borders everywhere; give a default size if not scaling by count
+            fig.update_traces(
+                marker=dict(
+                    line=dict(width=0),
+                ),
+                selector=dict(mode='markers')
+            )
+
+            # If not using size-by-count, ensure a readable default marker size
+            if size_dim is None:
+                fig.update_traces(marker=dict(size=2), selector=dict(mode='markers'))
+
+            # Tighten margins so the plot uses more space
+            fig.update_layout(
+                margin=dict(l=0, r=0, t=44, b=0),  # leave a little room for the title
+            )
+
+            return fig.to_dict()
+
+        fig_key = ('figure', data_key, x_axis, y_axis, z_axis, 'on' in (color_by_count or []),
+                   'on' in (size_by_count or []), 'on' in (downsample_on or []), max_points)
+        fig = view_cache.get_or_compute(fig_key, build_figure)
+
+        cache_stats = view_cache.stats()
+        stats.children.append(html.P(
+            f"View cache: {cache_stats['hits']} hits / {cache_stats['misses']} misses, "
+            f"{cache_stats['entries']} entries ({cache_stats['bytes'] / 2 ** 20:.1f} MiB)"))
 
         return fig, stats
 
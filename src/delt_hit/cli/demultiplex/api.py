@@ -1,33 +1,65 @@
 import json
-import subprocess
 from pathlib import Path
 
-from delt_hit.demultiplex.postprocess import get_counts, save_counts
-from delt_hit.demultiplex.preprocess import generate_input_files
-from delt_hit.utils import read_yaml
+from delt_hit.demultiplex.postprocess import ReadStats, get_counts, save_counts
+from delt_hit.demultiplex.preprocess import generate_input_files, get_regions
+from delt_hit.demultiplex.read_store import ReadStoreWriter
+from delt_hit.demultiplex.sketch import TopKCounter
+from delt_hit.demultiplex.umi import UmiCounter
+from delt_hit.utils import read_config
 from loguru import logger
 
 class Demultiplex:
 
-    def prepare(self, *, config_path: Path, fast_dev_run: bool = False):
+    def prepare(self, *, config_path: Path, fast_dev_run: bool = False, sample: float | None = None, seed: int = 0):
         """Create demultiplex input files and scripts.
 
         Args:
             config_path: Path to the YAML config file.
-            fast_dev_run: Whether to use a small read subset.
+            fast_dev_run: Whether to use a random sample of 10,000 reads.
+            sample: Number (if at least 1) or fraction of reads to sample from the whole input, all reads if None.
+            seed: Random seed of the sample.
         """
-        exec_path = generate_input_files(config_path=config_path, fast_dev_run=fast_dev_run)
+        exec_path = generate_input_files(config_path=config_path, fast_dev_run=fast_dev_run, sample=sample, seed=seed)
         logger.info(f"Executable created at {exec_path}")
 
-    def process(self, *, config_path: Path, as_files: bool = False, sort_by_counts: bool = True):
+    def process(self, *, config_path: Path, as_files: bool = False, sort_by_counts: bool = True,
+                write_store: bool = True, write_read_stats: bool = True, umi_precision: int = 12,
+                collapse_umi_errors: bool = False, approximate: bool = False, top_k: int = 10000,
+                sketch_width: int = 2 ** 20, sketch_depth: int = 4, write_read_store: bool = False):
         """Count reads per selection and write output tables.
 
+        If the structure has ``umi`` regions, the ``count`` column holds the number of distinct UMIs (molecules) per
+        compound and the read counts are kept in a ``reads`` column.
+
+        With ``approximate`` the reads of all selections are counted in one count-min sketch and only the ``top_k``
+        most frequent compounds per selection are written, with their estimated counts, to ``selections_top_k``
+        instead of ``selections``. Memory is bounded by the sketch of ``8 * sketch_depth * sketch_width`` bytes
+        (32 MiB by default) plus ``top_k`` candidate compounds for every combination of selection IDs found in the
+        reads, estimates may overcount by about ``e / sketch_width`` of all reads. UMIs are not counted in this
+        mode.
+
+        With ``write_read_store`` the annotated read names are also written sorted by selection and compound to
+        ``demultiplex/read_store``, from where ``reads`` retrieves the reads of one compound.
+
         Args:
             config_path: Path to the YAML config file.
             as_files: Whether to store counts as flat files.
             sort_by_counts: Whether to sort counts descending.
+            write_store: Whether to also write the binary count store (``selections/counts.arrow``) the dashboard
+                loads instead of parsing the TSV files.
+            write_read_stats: Whether to collect per-region error, length shift and codon usage histograms while
+                counting and write them to ``qc/read_stats.parquet``.
+            umi_precision: Precision ``p`` of the HyperLogLog sketches that replace the exact UMI sets of compounds
+                with more than ``2 ** p / 8`` distinct UMIs, the relative error is about ``1.04 / sqrt(2 ** p)``.
+            collapse_umi_errors: Whether UMIs one substitution apart count as one molecule (exact sets only).
+            approximate: Whether to only estimate the counts of the most frequent compounds per selection.
+            top_k: Number of compounds per selection written in approximate mode.
+            sketch_width: Counters per row of the count-min sketch.
+            sketch_depth: Rows of the count-min sketch.
+            write_read_store: Whether to write the indexed read store.
         """
-        config = read_yaml(config_path)
+        config = read_config(config_path)
         save_dir = Path(config['experiment']['save_dir']).expanduser().resolve()
         name = config['experiment']['name']
 
@@ -38,52 +70,161 @@ class Demultiplex:
             sorted(output_dir.glob('*.cutadapt.json'))[-1]
         ))['read_counts']['output']
 
-        counts = get_counts(input_path=input_path, num_reads=num_reads)
-
+        regions = get_regions(config['structure'], config['whitelists'])
+        read_stats = ReadStats(regions) if write_read_stats else None
+        umi_length = sum(len(region.codons[0]) for region in regions if region.is_umi)
+        if approximate and umi_length:
+            logger.warning('UMIs are not counted in approximate mode, counts are reads')
+        umis = UmiCounter(umi_length, precision=umi_precision,
+                          collapse_errors=collapse_umi_errors) if umi_length and not approximate else None
+        sketch = TopKCounter(top_k, width=sketch_width, depth=sketch_depth) if approximate else None
         ids_to_name = {tuple(item['ids']): k for k, item in config['selections'].items()}
-        output_dir = save_dir / name / 'selections'
-        save_counts(counts, output_dir=output_dir, ids_to_name=ids_to_name,
-                    as_files=as_files, sort_by_counts=sort_by_counts)
+        read_store = ReadStoreWriter(save_dir / name / 'demultiplex' / 'read_store',
+                                     ids_to_name=ids_to_name) if write_read_store else None
+        counts = get_counts(input_path=input_path, num_reads=num_reads, read_stats=read_stats, umis=umis,
+                            top_k=sketch, read_store=read_store)
+        if read_store is not None:
+            read_store.write()
+        if sketch is not None:
+            logger.info(f'Estimated the top {top_k:,} compounds of {len(sketch.candidates)} selections in '
+                        f'a sketch of {sketch.nbytes / 2 ** 20:,.1f} MiB')
+        if read_stats is not None:
+            read_stats.save(save_dir / name / 'qc' / 'read_stats.parquet')
+        if umis is not None and umis.num_invalid:
+            logger.warning(f'{umis.num_invalid:,} reads have UMIs with other bases than ACGT or of wrong length and '
+                           f'are only counted as reads')
+
+        output_dir = save_dir / name / ('selections_top_k' if approximate else 'selections')
+        save_counts(counts, output_dir=output_dir, ids_to_name=ids_to_name, as_files=as_files,
+                    sort_by_counts=sort_by_counts, molecules=umis.counts() if umis is not None else None)
+
+        if write_store:
+            from delt_hit.dashboard.store import CountStore, find_selection_counts
+            try:
+                CountStore.build(find_selection_counts(output_dir), output_dir / 'counts.arrow')
+            except OSError as e:
+                logger.warning(f'Could not write count store to {output_dir}: {e}')
+
+    def reads(self, *, config_path: Path, selection: str, codes: str, limit: int | None = None):
+        """Print the reads supporting one compound of a selection from the read store written by ``process``.
+
+        Every read is printed as its name annotated with the matched sequence of every region.
+
+        Args:
+            config_path: Path to the YAML config file.
+            selection: Selection name, or the selection IDs joined by ``-`` for reads of unknown selections.
+            codes: Codes of the compound separated by commas (e.g. ``12,345``), as in the ``code_*`` columns of
+                the count tables.
+            limit: Maximum number of reads to print, all if None.
+        """
+        import time
+        from delt_hit.demultiplex.read_store import ReadStore
+
+        config = read_config(config_path)
+        save_dir = Path(config['experiment']['save_dir']).expanduser().resolve()
+        name = config['experiment']['name']
+
+        start = time.perf_counter()
+        codes = tuple(int(code) for code in str(codes).split(','))
+        reads = ReadStore(save_dir / name / 'demultiplex' / 'read_store').reads(selection, codes)
+        for read in reads[:limit]:
+            print(read)
+        logger.info(f'Found {len(reads):,} reads of {"_".join(map(str, codes))} in {selection} in '
+                    f'{(time.perf_counter() - start) * 1000:.1f} ms')
 
     def report(self, *, config_path: Path):
-        """Write a cutadapt summary report.
+        """Write a cutadapt summary report, including the read statistics written by ``process`` if present.
 
         Args:
             config_path: Path to the YAML config file.
         """
         from delt_hit.quality_control.report import print_report
-        config = read_yaml(config_path)
+        config = read_config(config_path)
         save_dir = Path(config['experiment']['save_dir']).expanduser().resolve()
         name = config['experiment']['name']
 
         output_dir = save_dir / name / 'demultiplex' / 'cutadapt_output_files'
         save_path = save_dir / name / 'qc' / 'report.txt'
         save_path.parent.mkdir(parents=True, exist_ok=True)
-        print_report(output_dir=output_dir, save_path=save_path)
+        print_report(output_dir=output_dir, save_path=save_path,
+                     read_stats_path=save_path.parent / 'read_stats.parquet')
 
     def qc(self, *, config_path: Path):
-        """Generate QC plots from cutadapt output.
+        """Generate QC plots from the read statistics written by ``process``, or from cutadapt output otherwise.
 
         Args:
             config_path: Path to the YAML config file.
         """
         from delt_hit.quality_control.plot_codon_hits import plot_hits
 
-        config = read_yaml(config_path)
+        config = read_config(config_path)
         save_dir = Path(config['experiment']['save_dir']).expanduser().resolve()
         name = config['experiment']['name']
 
         output_dir = save_dir / name / 'demultiplex' / 'cutadapt_output_files'
         save_dir = save_dir / name / 'qc'
         save_dir.mkdir(parents=True, exist_ok=True)
-        plot_hits(output_dir=output_dir, save_dir=save_dir)
+        plot_hits(output_dir=output_dir, save_dir=save_dir, read_stats_path=save_dir / 'read_stats.parquet')
+
+    def status(self, *, config_path: Path, run_id: str | None = None):
+        """Summarize the stages of a running or finished demultiplex run from its telemetry log.
+
+        Args:
+            config_path: Path to the YAML config file.
+            run_id: Run to summarize, the latest one if None.
+        """
+        from rich.console import Console
+        from delt_hit.demultiplex.telemetry import TELEMETRY_FILE, status_table, summarize
 
-    def run(self, *, config_path: Path, fast_dev_run: bool = False):
+        config = read_config(config_path)
+        save_dir = Path(config['experiment']['save_dir']).expanduser().resolve()
+        name = config['experiment']['name']
+
+        stages = summarize(save_dir / name / 'demultiplex' / TELEMETRY_FILE, run_id=run_id)
+        if not stages:
+            logger.warning(f'No telemetry found in {save_dir / name / "demultiplex"}')
+            return
+        Console().print(status_table(stages))
+
+        done = [s for s in stages if s['status'] != 'running']
+        if done:
+            slowest = max(done, key=lambda s: s['wall_seconds'])
+            total = sum(s['wall_seconds'] for s in stages)
+            logger.info(f"Slowest stage: {slowest['stage']} ({slowest['wall_seconds']:.1f}s, "
+                        f"{slowest['wall_seconds'] / total:.0%} of {total:.1f}s)")
+
+    def run(self, *, config_path: Path, fast_dev_run: bool = False, keep_intermediate: bool = False,
+            resume_from: str | None = None, with_processing: bool = False, scratch_dir: Path | None = None,
+            selections: list[str] | None = None, collapse: bool = False, collapse_memory_mb: int = 1024,
+            sample: float | None = None, seed: int = 0):
         """Run the full demultiplex pipeline.
 
+        The cutadapt steps of all regions run as concurrent processes connected by pipes, so no intermediate read
+        files are written (see ``delt_hit.demultiplex.runner.Runner``).
+
         Args:
             config_path: Path to the YAML config file.
-            fast_dev_run: Whether to use a small read subset.
+            fast_dev_run: Whether to use a random sample of 10,000 reads.
+            keep_intermediate: Whether to write the reads kept after every region, required to resume from a region.
+            resume_from: Stage to resume from, a region ID (e.g. ``2-B0``), ``collect`` or ``process``.
+            with_processing: Whether to count the reads (``process``) after demultiplexing.
+            scratch_dir: Local directory (e.g. NVMe or ``/dev/shm``) for files written while demultiplexing, moved
+                to ``save_dir`` at the end and removed unless ``keep_intermediate`` is set. Defaults to
+                ``scratch_dir`` of the experiment config, if set.
+            selections: Names of the selections to decode, reads of all other selections (or with unknown primers)
+                are dropped before decoding the building blocks. All selections if None.
+            collapse: Whether to decode every unique barcode prefix only once, the counts are weighted by the
+                number of reads sharing it. Cutadapt reports then count unique prefixes instead of reads.
+            collapse_memory_mb: Memory budget in MiB for collapsing, larger tables are spilled to disk.
+            sample: Number (if at least 1) or fraction of reads to sample from the whole input, all reads if None.
+                BGZF compressed input is sampled block-wise without decompressing the rest of the file.
+            seed: Random seed of the sample.
         """
-        exec_path = generate_input_files(config_path=config_path, fast_dev_run=fast_dev_run)
-        subprocess.run(['bash', exec_path])
+        from delt_hit.demultiplex.runner import Runner
+
+        config = read_config(config_path)
+        reads_path = Runner(config, config_path=config_path, scratch_dir=scratch_dir).run(
+            fast_dev_run=fast_dev_run, keep_intermediate=keep_intermediate, resume_from=resume_from,
+            with_processing=with_processing, selections=selections, collapse=collapse,
+            collapse_memory_mb=collapse_memory_mb, sample=sample, seed=seed)
+        logger.info(f'Demultiplexed reads written to {reads_path}')
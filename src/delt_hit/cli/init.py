@@ -3,7 +3,7 @@ from pathlib import Path
 from loguru import logger
 
 from delt_hit.demultiplex.parser import config_from_excel
-from delt_hit.utils import write_yaml
+from delt_hit.utils import write_config_tables, write_yaml
 
 def init(*, excel_path: Path):
     """Create a YAML config from an Excel workbook.
@@ -18,4 +18,5 @@ def init(*, excel_path: Path):
     save_path = save_dir / name / 'config.yaml'
     save_path.parent.mkdir(parents=True, exist_ok=True)
     write_yaml(config, save_path)
+    write_config_tables(config, save_path)
     logger.info(f'Configuration created at {save_path}')
@@ -16,7 +16,7 @@ from rdkit.Chem import rdChemReactions
 from scipy import sparse
 from tqdm import tqdm
 
-from delt_hit.utils import read_yaml
+from delt_hit.utils import read_config
 
 class Library:
 
@@ -29,7 +29,7 @@ class Library:
         Returns:
             Experiment directory path.
         """
-        cfg = read_yaml(config_path)
+        cfg = read_config(config_path)
         exp_dir = Path(cfg['experiment']['save_dir']).expanduser().resolve() / cfg['experiment']['name']
         return exp_dir
 
@@ -64,7 +64,7 @@ class Library:
             logger.info(f'Library {lib_path} exists')
             return
 
-        cfg = read_yaml(config_path)
+        cfg = read_config(config_path)
 
         building_block_edges = cfg['library']['bb_edges']
         other_edges = cfg['library']['other_edges']
@@ -309,6 +309,43 @@ class Library:
             case 'bert':
                 run_morgan(smiles, save_path=save_dir / 'bert.npz')
 
+    def annotate(self, *, config_path: Path, input_path: Path, save_path: Path | None = None,
+                 library_path: Path | None = None, with_properties: bool = True):
+        """Annotate a counts or hits table with library structures and properties.
+
+        Args:
+            config_path: Path to the YAML config file.
+            input_path: Table with ``code_1..code_n`` columns (TSV, CSV or parquet).
+            save_path: Optional output path, defaults to ``<input>_annotated.<suffix>``.
+            library_path: Optional library parquet override.
+            with_properties: Whether to attach ``prop_*`` columns if ``properties.parquet`` exists.
+        """
+        from delt_hit.library.lookup import CodeLookup
+
+        lib_path = library_path or self.get_library_path(config_path=config_path)
+        props_path = lib_path.parent / 'properties' / 'properties.parquet' if with_properties else None
+        lookup = CodeLookup.from_files(lib_path, properties_path=props_path)
+
+        match input_path.suffix:
+            case '.parquet':
+                df = pd.read_parquet(input_path)
+            case '.csv':
+                df = pd.read_csv(input_path)
+            case _:
+                df = pd.read_csv(input_path, sep='\t')
+
+        df = lookup.annotate(df)
+
+        save_path = save_path or input_path.with_name(f'{input_path.stem}_annotated{input_path.suffix}')
+        match save_path.suffix:
+            case '.parquet':
+                df.to_parquet(save_path, index=False)
+            case '.csv':
+                df.to_csv(save_path, index=False)
+            case _:
+                df.to_csv(save_path, index=False, sep='\t')
+        logger.info(f'Annotated table saved to {save_path}')
+
 
 # self = Library()
 
@@ -1,27 +1,49 @@
+import sys
+from importlib import import_module
+
 from jsonargparse import CLI
 
-from delt_hit.cli.init import init
-from delt_hit.cli.demultiplex.api import Demultiplex
-from delt_hit.cli.analyse.api import Analyse
-from delt_hit.cli.library.api import Library
-from delt_hit.cli.dashboard.api import dashboard
+# Groups are imported on demand so a subcommand only pays for its own dependencies (rdkit, dash, ...)
+COMMANDS = {
+    "init": "delt_hit.cli.init:init",
+    "validate": "delt_hit.cli.validate:validate",
+    "library": "delt_hit.cli.library.api:Library",
+    "demultiplex": "delt_hit.cli.demultiplex.api:Demultiplex",
+    "analyse": "delt_hit.cli.analyse.api:Analyse",
+    "dashboard": "delt_hit.cli.dashboard.api:dashboard",
+}
+
+
+def load_command(name: str):
+    """Import the implementation of a CLI group.
+
+    Args:
+        name: Group name, a key of ``COMMANDS``.
 
-def cli() -> None:
+    Returns:
+        The function or class implementing the group.
+    """
+    module, attr = COMMANDS[name].split(':')
+    return getattr(import_module(module), attr)
+
+
+def cli(args: list[str] | None = None) -> None:
     """Run the delt-hit CLI entrypoint.
 
-    The command tree is: ``delt-hit <group> <method> [--args]``.
+    The command tree is: ``delt-hit <group> <method> [--args]``. Only the invoked group is imported; all groups are
+    loaded when no group is given (e.g. for ``delt-hit --help``).
+
+    Args:
+        args: Command line arguments, defaults to ``sys.argv[1:]``.
     """
+    args = sys.argv[1:] if args is None else args
+    names = [args[0]] if args and args[0] in COMMANDS else list(COMMANDS)
     CLI(
-        {
-            "init": init,
-            "library": Library,
-            "demultiplex": Demultiplex,
-            "analyse": Analyse,
-            "dashboard": dashboard,
-        },
+        {name: load_command(name) for name in names},
         prog="delt-hit",
         description="DELT Hit toolkit",
         as_positional=False,
+        args=args,
     )
 
 if __name__ == "__main__":
@@ -0,0 +1,37 @@
+from pathlib import Path
+
+from loguru import logger
+
+from delt_hit.demultiplex.checks import run_checks, save_checks
+from delt_hit.utils import read_config
+
+def validate(*, config_path: Path, save_dir: Path | None = None, processes: int | None = None):
+    """Validate a config before demultiplexing and report all issues.
+
+    Checks whitelists (missing, invalid, duplicated and varying-length codons), the pairwise minimum Hamming or
+    Levenshtein distance of the codons of each region against its allowed number of errors, and the library
+    definition.
+
+    Args:
+        config_path: Path to the YAML config file.
+        save_dir: Directory for ``validation.tsv`` and ``codon_distances.tsv``, defaults to the experiment's
+            ``qc`` directory.
+        processes: Number of worker processes for Levenshtein distances, all CPUs if None.
+    """
+    config = read_config(config_path)
+    issues, summary = run_checks(config, processes=processes)
+
+    if save_dir is None:
+        save_dir = Path(config['experiment']['save_dir']).expanduser().resolve() / config['experiment']['name'] / 'qc'
+    save_checks(issues, summary, save_dir=save_dir)
+
+    for row in summary.itertuples():
+        logger.info(f'{row.region}: {row.num_codons} codons, min {row.metric} distance {row.min_distance}, '
+                    f'{row.max_errors} allowed errors, {row.num_conflicts} conflicts')
+    for issue in issues.itertuples():
+        log = logger.error if issue.level == 'error' else logger.warning
+        log(f'[{issue.section}] {issue.location}: {issue.message}')
+
+    num_errors = int((issues.level == 'error').sum())
+    logger.info(f'Found {num_errors} errors and {len(issues) - num_errors} warnings, see {save_dir / "validation.tsv"}')
+    assert num_errors == 0, f'Config {config_path} has {num_errors} errors'
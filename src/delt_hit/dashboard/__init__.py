@@ -0,0 +1,3 @@
+from .cache import LRUCache
+from .cubes import MarginalCubes
+from .index import CodeIndex, parse_code_intervals
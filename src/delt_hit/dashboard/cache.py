@@ -0,0 +1,144 @@
+import sys
+from collections import OrderedDict
+from collections.abc import Callable, Hashable
+from typing import Any
+
+import numpy as np
+import pandas as pd
+
+_missing = object()
+
+
+def normalize_filters(filters: dict[str, np.ndarray]) -> tuple:
+    """Turn parsed code intervals into a hashable cache key.
+
+    Args:
+        filters: Mapping of code columns to interval arrays (see ``parse_code_intervals``).
+
+    Returns:
+        Sorted tuple of ``(column, ((lo, hi), ...))`` pairs.
+    """
+    return tuple(sorted((col, tuple(map(tuple, intervals.tolist()))) for col, intervals in filters.items()))
+
+
+def estimate_size(obj: Any) -> int:
+    """Approximate the memory footprint of a cached value in bytes.
+
+    Args:
+        obj: DataFrame, array, figure dict or any nesting of containers thereof.
+
+    Returns:
+        Estimated size in bytes.
+    """
+    match obj:
+        case pd.DataFrame():
+            return int(obj.memory_usage(deep=True).sum())
+        case pd.Series():
+            return int(obj.memory_usage(deep=True))
+        case np.ndarray():
+            return obj.nbytes
+        case dict():
+            return sys.getsizeof(obj) + sum(estimate_size(k) + estimate_size(v) for k, v in obj.items())
+        case list() | tuple():
+            return sys.getsizeof(obj) + sum(estimate_size(v) for v in obj)
+        case _:
+            return sys.getsizeof(obj)
+
+
+class LRUCache:
+    """Least-recently-used cache bounded by number of entries and an estimated memory budget.
+
+    Used by the dashboard to keep aggregated frames and figures of recently shown views, so switching back to a
+    previous axis or filter combination does not recompute them.
+    """
+
+    def __init__(self, max_entries: int = 64, max_bytes: int = 256 * 2 ** 20):
+        """Create an empty cache.
+
+        Args:
+            max_entries: Maximum number of entries.
+            max_bytes: Maximum estimated size of all entries in bytes. Larger single values are not cached.
+        """
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()
+        self.num_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self.entries
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        """Look up ``key`` and mark it as most recently used.
+
+        Args:
+            key: Hashable cache key.
+            default: Value returned on a miss.
+
+        Returns:
+            The cached value or ``default``.
+        """
+        if key not in self.entries:
+            self.misses += 1
+            return default
+        self.hits += 1
+        self.entries.move_to_end(key)
+        return self.entries[key][0]
+
+    def get_or_compute(self, key: Hashable, compute: Callable[[], Any]) -> Any:
+        """Return the cached value for ``key`` or compute, store and return it.
+
+        Args:
+            key: Hashable cache key.
+            compute: Function computing the value on a miss.
+
+        Returns:
+            The cached or newly computed value.
+        """
+        value = self.get(key, _missing)
+        if value is _missing:
+            value = compute()
+            self.put(key, value)
+        return value
+
+    def put(self, key: Hashable, value: Any):
+        """Store a value and evict least recently used entries beyond the limits.
+
+        A value larger than the memory budget is not stored and removes a previous value of the same key.
+
+        Args:
+            key: Hashable cache key.
+            value: Value to store.
+        """
+        size = estimate_size(value)
+        if key in self.entries:
+            self.num_bytes -= self.entries.pop(key)[1]
+        if size > self.max_bytes or self.max_entries < 1:
+            # the previous value of the key is dropped anyway, it is stale
+            return
+        self.entries[key] = (value, size)
+        self.num_bytes += size
+        while len(self.entries) > self.max_entries or self.num_bytes > self.max_bytes:
+            _, (_, evicted) = self.entries.popitem(last=False)
+            self.num_bytes -= evicted
+            self.evictions += 1
+
+    def clear(self):
+        """Drop all entries, keeping the statistics."""
+        self.entries.clear()
+        self.num_bytes = 0
+
+    def stats(self) -> dict:
+        """Hit/miss statistics of the cache.
+
+        Returns:
+            Dictionary with hits, misses, hit rate, evictions, number of entries and estimated size in bytes.
+        """
+        lookups = self.hits + self.misses
+        return {'hits': self.hits, 'misses': self.misses, 'hit_rate': self.hits / lookups if lookups else 0.0,
+                'evictions': self.evictions, 'entries': len(self.entries), 'bytes': self.num_bytes}
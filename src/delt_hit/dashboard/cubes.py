@@ -0,0 +1,171 @@
+import json
+from itertools import combinations
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+from loguru import logger
+
+from delt_hit.dashboard.index import CodeIndex, in_intervals
+
+
+class MarginalCubes:
+    """Pre-aggregated marginal count tables over all combinations of up to ``max_dim`` code columns.
+
+    Queries are answered from the smallest cube that contains every grouped and filtered column, so interactive
+    re-aggregation touches the (usually much smaller) cube instead of the raw counts table. Tables with more than
+    ``index_min_rows`` rows are filtered through a ``CodeIndex`` instead of a full scan.
+    """
+
+    index_min_rows = 1_000_000
+
+    def __init__(self, counts: pd.DataFrame, code_cols: list[str], cubes: dict[tuple[str, ...], pd.DataFrame]):
+        """Wrap pre-computed cubes.
+
+        Args:
+            counts: Raw counts table, used when no cube answers a query.
+            code_cols: Code columns of the counts table.
+            cubes: Mapping of sorted code column tuples to aggregated counts.
+        """
+        self.counts = counts
+        self.code_cols = code_cols
+        self.cubes = cubes
+        self.values = {col: cubes[(col,)][col].to_numpy() for col in code_cols if (col,) in cubes}
+        self.indexes = {}
+
+    @classmethod
+    def build(cls, counts: pd.DataFrame, code_cols: list[str], max_dim: int = 3) -> 'MarginalCubes':
+        """Aggregate all 1-D up to ``max_dim``-D marginals.
+
+        Higher dimensional cubes are computed first and lower dimensional ones are derived from the smallest
+        already computed parent. The cube over all code columns would be a copy of the counts table, it is skipped
+        and such queries are answered from the counts table itself.
+
+        Args:
+            counts: Raw counts table.
+            code_cols: Code columns to aggregate over.
+            max_dim: Maximum cube dimensionality.
+
+        Returns:
+            The cubes.
+        """
+        cubes = {}
+        for dim in range(min(max_dim, len(code_cols)), 0, -1):
+            for cols in combinations(code_cols, dim):
+                if len(cols) == len(code_cols):
+                    continue
+                parents = [cube for key, cube in cubes.items() if set(cols) < set(key)]
+                source = min(parents, key=len) if parents else counts
+                cubes[cols] = source.groupby(list(cols), dropna=False)['count'].sum().reset_index()
+        return cls(counts, code_cols, cubes)
+
+    @classmethod
+    def from_counts(cls, counts_path: Path, counts: pd.DataFrame, code_cols: list[str], max_dim: int = 3,
+                    cache: bool = True) -> 'MarginalCubes':
+        """Load cubes from the sidecar next to ``counts_path`` or build and cache them.
+
+        The sidecar ``<counts_stem>.cubes/`` is reused as long as the size and modification time of the counts
+        file, the code columns and ``max_dim`` match the ones recorded at build time.
+
+        Args:
+            counts_path: Path to the counts file.
+            counts: Raw counts table loaded from ``counts_path``.
+            code_cols: Code columns to aggregate over.
+            max_dim: Maximum cube dimensionality.
+            cache: Whether to read and write the sidecar.
+
+        Returns:
+            The cubes.
+        """
+        sidecar = counts_path.parent / f'{counts_path.stem}.cubes'
+        meta_path = sidecar / 'meta.json'
+        stat = counts_path.stat() if counts_path.exists() else None
+        meta = {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns, 'max_dim': max_dim,
+                'code_cols': code_cols} if stat else None
+
+        if cache and meta and meta_path.exists() and json.loads(meta_path.read_text()) == meta:
+            cubes = {tuple(path.stem.split('-')): pd.read_parquet(path) for path in sidecar.glob('*.parquet')}
+            logger.info(f'Loaded {len(cubes)} marginal cubes from {sidecar}')
+            return cls(counts, code_cols, cubes)
+
+        self = cls.build(counts, code_cols, max_dim=max_dim)
+        if cache and meta:
+            try:
+                sidecar.mkdir(parents=True, exist_ok=True)
+                # cubes of a build with other columns or dimensions must not be loaded with these
+                meta_path.unlink(missing_ok=True)
+                for path in sidecar.glob('*.parquet'):
+                    path.unlink()
+                for key, cube in self.cubes.items():
+                    cube.to_parquet(sidecar / f'{"-".join(key)}.parquet', index=False)
+                meta_path.write_text(json.dumps(meta))
+                logger.info(f'Saved {len(self.cubes)} marginal cubes to {sidecar}')
+            except OSError as e:
+                logger.warning(f'Could not write marginal cubes to {sidecar}: {e}')
+        return self
+
+    def effective_filters(self, filters: dict) -> dict:
+        """Drop filters that keep every value present in their column.
+
+        Args:
+            filters: Mapping of code columns to interval arrays (see ``parse_code_intervals``).
+
+        Returns:
+            The filters that actually restrict the data.
+        """
+        return {col: intervals for col, intervals in filters.items() if col in self.code_cols
+                and not (col in self.values and in_intervals(self.values[col], intervals).all())}
+
+    def apply_filters(self, data: pd.DataFrame, filters: dict) -> pd.DataFrame:
+        """Filter a cube or the raw counts table by code intervals.
+
+        Args:
+            data: Table to filter.
+            filters: Mapping of code columns to interval arrays.
+
+        Returns:
+            The filtered table.
+        """
+        if not filters:
+            return data
+
+        if len(data) > self.index_min_rows:
+            index = self.indexes.setdefault(id(data), CodeIndex(data))
+            return index.filter(filters)
+
+        mask = np.ones(len(data), dtype=bool)
+        for col, intervals in filters.items():
+            mask &= in_intervals(data[col].to_numpy(), intervals)
+        return data.loc[mask]
+
+    def source_for(self, cols: list[str]) -> pd.DataFrame:
+        """Return the smallest table that contains all ``cols``.
+
+        Args:
+            cols: Required code columns.
+
+        Returns:
+            A cube, or the raw counts table if no cube contains all columns.
+        """
+        candidates = [cube for key, cube in self.cubes.items() if set(cols) <= set(key)]
+        return min(candidates, key=len) if candidates else self.counts
+
+    def query(self, selected_codes: list[str], filters: dict) -> pd.DataFrame:
+        """Aggregate counts by ``selected_codes`` after applying code filters.
+
+        Args:
+            selected_codes: Columns to group by, empty for the total count.
+            filters: Mapping of code columns to interval arrays (see ``parse_code_intervals``).
+
+        Returns:
+            Aggregated counts DataFrame.
+        """
+        filters = self.effective_filters(filters)
+        data = self.apply_filters(self.source_for([*selected_codes, *filters]), filters)
+
+        if not selected_codes:
+            return pd.DataFrame({'count': [data['count'].sum()]})
+        if set(data.columns) == {*selected_codes, 'count'}:
+            # already at the requested resolution, the raw counts table is returned as is instead of copied
+            return data
+        return data.groupby(selected_codes, dropna=False)['count'].sum().reset_index()
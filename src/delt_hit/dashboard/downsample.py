@@ -0,0 +1,45 @@
+import numpy as np
+import pandas as pd
+
+
+def downsample(data: pd.DataFrame, axes: list[str], max_points: int = 50_000,
+               top_fraction: float = 0.5) -> pd.DataFrame:
+    """Cap the number of points sent to the browser with density-aware downsampling.
+
+    The ``top_fraction * max_points`` rows with the highest counts are kept as they are. The remaining rows are
+    binned on a regular grid over ``axes`` and each non-empty bin is replaced by a single point at the mean position
+    of its members with their mean count. Dense regions are thereby thinned out while sparse regions and all
+    high-count compounds stay visible.
+
+    Args:
+        data: Aggregated plot data with a ``count`` column.
+        axes: Plotted columns (may include ``count``).
+        max_points: Maximum number of points to return.
+        top_fraction: Fraction of the budget reserved for the highest count rows.
+
+    Returns:
+        ``data`` itself if it has at most ``max_points`` rows, otherwise the downsampled data with an additional
+        ``n_points`` column holding the number of rows each point represents.
+    """
+    if len(data) <= max_points or not axes:
+        return data
+
+    num_top = int(max_points * top_fraction)
+    order = np.argsort(-data['count'].to_numpy(), kind='stable')
+    top = data.iloc[order[:num_top]].assign(n_points=1)
+    rest = data.iloc[order[num_top:]]
+
+    num_bins = max(int(np.floor((max_points - num_top) ** (1 / len(axes)))), 1)
+    bin_ids = np.zeros(len(rest), dtype=np.int64)
+    for axis in axes:
+        values = rest[axis].to_numpy(dtype=np.float64)
+        lo, hi = values.min(), values.max()
+        bins = np.zeros(len(values), dtype=np.int64) if hi == lo else \
+            np.minimum(((values - lo) / (hi - lo) * num_bins).astype(np.int64), num_bins - 1)
+        bin_ids = bin_ids * num_bins + bins
+
+    columns = list(dict.fromkeys([*axes, 'count']))
+    binned = rest[columns].groupby(bin_ids).agg('mean')
+    binned['n_points'] = rest.groupby(bin_ids).size()
+
+    return pd.concat([top[[*columns, 'n_points']], binned], ignore_index=True)
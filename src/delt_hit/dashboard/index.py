@@ -0,0 +1,177 @@
+import re
+
+import numpy as np
+import pandas as pd
+
+
+def parse_code_intervals(range_str: str, code_cols: list[str]) -> dict[str, np.ndarray]:
+    """Parse a semicolon-delimited set of code filters into merged intervals.
+
+    Segments are matched to ``code_cols`` in order, empty segments leave a column unfiltered. A segment holds
+    comma-separated codes (``7``), closed ranges (``3-10``) and ranges open at the end (``100-``), e.g.
+    ``1-3;2-5,8-10;;100-`` yields ``{'code_1': [[1, 3]], 'code_2': [[2, 5], [8, 10]], 'code_4': [[100, max]]}``
+    with ``max`` the largest int64. Malformed tokens are ignored.
+
+    Args:
+        range_str: Filter string in ``code_1;code_2;...`` order.
+        code_cols: Code column names to map segments onto.
+
+    Returns:
+        A mapping of code columns to sorted, non-overlapping ``(n, 2)`` integer interval arrays.
+    """
+    if not range_str or not isinstance(range_str, str):
+        return {}
+
+    filters = {}
+    for col, seg in zip(code_cols, range_str.split(';')):
+        intervals = []
+        for part in seg.split(','):
+            part = part.strip()
+            m = re.match(r'^(-?\d+)\s*-\s*(-?\d+)?$', part)
+            if m:
+                a = int(m.group(1))
+                b = int(m.group(2)) if m.group(2) is not None else np.iinfo(np.int64).max
+                intervals.append((min(a, b), max(a, b)))
+            elif re.match(r'^-?\d+$', part):
+                intervals.append((int(part), int(part)))
+            # ignore empty and malformed tokens
+        if intervals:
+            filters[col] = merge_intervals(intervals)
+    return filters
+
+
+def merge_intervals(intervals: list[tuple[int, int]]) -> np.ndarray:
+    """Sort and merge overlapping or adjacent closed integer intervals.
+
+    Args:
+        intervals: ``(lo, hi)`` pairs.
+
+    Returns:
+        ``(n, 2)`` array of disjoint intervals.
+    """
+    merged = []
+    for lo, hi in sorted(intervals):
+        if merged and lo <= merged[-1][1] + 1:
+            merged[-1][1] = max(merged[-1][1], hi)
+        else:
+            merged.append([lo, hi])
+    return np.asarray(merged, dtype=np.int64).reshape(-1, 2)
+
+
+def in_intervals(values: np.ndarray, intervals: np.ndarray) -> np.ndarray:
+    """Vectorized membership test of values in disjoint sorted intervals.
+
+    Args:
+        values: Integer values.
+        intervals: ``(n, 2)`` array from ``merge_intervals``.
+
+    Returns:
+        Boolean mask.
+    """
+    idx = np.searchsorted(intervals[:, 0], values, side='right') - 1
+    return (idx >= 0) & (values <= intervals[np.maximum(idx, 0), 1])
+
+
+class CodeIndex:
+    """Sorted row permutations per code column for range filtering without full scans.
+
+    For a column, the rows with values in ``[lo, hi]`` are a contiguous slice of the permutation that sorts the
+    column, found with two binary searches. A multi-column filter starts from the most selective column and only
+    checks the remaining columns on its candidate rows. Permutations are built lazily per column.
+    """
+
+    def __init__(self, df: pd.DataFrame):
+        """Wrap a table to index.
+
+        Args:
+            df: Table with ``code_*`` columns.
+        """
+        self.df = df
+        self.order = {}
+        self.sorted_values = {}
+
+    def _index(self, col: str) -> tuple[np.ndarray, np.ndarray]:
+        """Return the sort permutation and sorted values of a column, building them on first use.
+
+        Args:
+            col: Column name.
+
+        Returns:
+            Tuple of permutation and sorted values.
+        """
+        if col not in self.order:
+            values = self.df[col].to_numpy()
+            if len(values) and values.min() >= np.iinfo(np.int16).min and values.max() <= np.iinfo(np.int16).max:
+                # stable argsort of 16-bit integers is a radix sort
+                values = values.astype(np.int16)
+            dtype = np.int32 if len(values) < 2 ** 31 else np.int64
+            order = np.argsort(values, kind='stable').astype(dtype, copy=False)
+            self.order[col] = order
+            self.sorted_values[col] = values[order]
+        return self.order[col], self.sorted_values[col]
+
+    def _bounds(self, col: str, intervals: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        """Slice bounds of ``intervals`` in the sorted values of a column.
+
+        Args:
+            col: Column name.
+            intervals: ``(n, 2)`` interval array.
+
+        Returns:
+            Tuple of start and stop positions per interval.
+        """
+        _, sorted_values = self._index(col)
+        if np.issubdtype(sorted_values.dtype, np.integer):
+            # search in the column's dtype, otherwise numpy upcasts the whole sorted column on every call
+            info = np.iinfo(sorted_values.dtype)
+            intervals = np.clip(intervals, info.min, info.max).astype(sorted_values.dtype)
+        lo = np.searchsorted(sorted_values, intervals[:, 0], side='left')
+        hi = np.searchsorted(sorted_values, intervals[:, 1], side='right')
+        return lo, hi
+
+    def count(self, col: str, intervals: np.ndarray) -> int:
+        """Number of rows with values of ``col`` in ``intervals``.
+
+        Args:
+            col: Column name.
+            intervals: ``(n, 2)`` interval array.
+
+        Returns:
+            Number of matching rows.
+        """
+        lo, hi = self._bounds(col, intervals)
+        return int((hi - lo).sum())
+
+    def rows(self, col: str, intervals: np.ndarray) -> np.ndarray:
+        """Row positions with values of ``col`` in ``intervals``.
+
+        Args:
+            col: Column name.
+            intervals: ``(n, 2)`` interval array.
+
+        Returns:
+            Row positions (unsorted).
+        """
+        order, _ = self._index(col)
+        lo, hi = self._bounds(col, intervals)
+        return np.concatenate([order[a:b] for a, b in zip(lo, hi)]) if len(lo) else order[:0]
+
+    def filter(self, filters: dict[str, np.ndarray]) -> pd.DataFrame:
+        """Apply interval filters to the indexed table.
+
+        Args:
+            filters: Mapping of code columns to interval arrays.
+
+        Returns:
+            The filtered table in original row order.
+        """
+        filters = {col: intervals for col, intervals in filters.items() if col in self.df.columns}
+        if not filters:
+            return self.df
+
+        first = min(filters, key=lambda col: self.count(col, filters[col]))
+        rows = np.sort(self.rows(first, filters[first]))
+        for col, intervals in filters.items():
+            if col != first and len(rows):
+                rows = rows[in_intervals(self.df[col].to_numpy()[rows], intervals)]
+        return self.df.iloc[rows]
@@ -0,0 +1,188 @@
+import json
+from pathlib import Path
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.csv as pacsv
+from loguru import logger
+
+
+def find_selection_counts(selections_dir: Path) -> dict[str, Path]:
+    """Find the counts table of every selection written by ``save_counts``.
+
+    Supports both layouts, ``<name>/counts.txt`` and ``<name>_counts.txt``.
+
+    Args:
+        selections_dir: The experiment's ``selections`` directory.
+
+    Returns:
+        Mapping of selection names to counts file paths, sorted by name.
+    """
+    sources = {path.parent.name: path for path in selections_dir.glob('*/counts.txt')}
+    sources.update({path.name.removesuffix('_counts.txt'): path for path in selections_dir.glob('*_counts.txt')})
+    return dict(sorted(sources.items()))
+
+
+class CountStore:
+    """Columnar store of the counts of several selections in one memory-mapped Arrow IPC file.
+
+    Selections are stored as contiguous row ranges, so a selection is a zero-copy slice of the mapped file and
+    converting it to pandas does not copy numeric columns. Memory use therefore stays close to one copy of the data
+    (held by the OS page cache) regardless of how many selections are opened or overlaid.
+    """
+
+    def __init__(self, table: pa.Table, meta: dict):
+        """Wrap an opened store.
+
+        Args:
+            table: Arrow table with all selections, usually memory-mapped.
+            meta: Store metadata with ``sources`` and row ``offsets`` per selection.
+        """
+        self.table = table
+        self.meta = meta
+        self.sources = {name: Path(item['path']) for name, item in meta['sources'].items()}
+        self.offsets = meta['offsets']
+        self.names = list(self.offsets)
+        self.code_cols = [col for col in table.column_names if col.startswith('code_')]
+
+    @staticmethod
+    def source_meta(sources: dict[str, Path]) -> dict:
+        """Describe source files by size and modification time.
+
+        Args:
+            sources: Mapping of selection names to counts file paths.
+
+        Returns:
+            Metadata used to detect stale stores.
+        """
+        meta = {}
+        for name, path in sources.items():
+            stat = path.stat()
+            meta[name] = {'path': str(path.resolve()), 'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+        return meta
+
+    @classmethod
+    def build(cls, sources: dict[str, Path], path: Path | None = None) -> 'CountStore | None':
+        """Stream the counts tables into a single Arrow IPC file.
+
+        Tables are read block-wise and appended one selection after the other. The string ``id`` column is dropped
+        since it is derived from the code columns.
+
+        Args:
+            sources: Mapping of selection names to counts file paths.
+            path: Path of the IPC file, the store is kept in memory if None.
+
+        Returns:
+            The opened store, None if all counts tables are empty.
+        """
+        assert sources, 'No selections to load'
+        meta = {'sources': cls.source_meta(sources), 'offsets': {}}
+
+        schema, batches, writer, offset = None, [], None, 0
+        for name, source in sources.items():
+            reader = pacsv.open_csv(source, parse_options=pacsv.ParseOptions(delimiter='\t'))
+            length = 0
+            for batch in reader:
+                batch = batch.select([col for col in batch.schema.names if col != 'id'])
+                if schema is None:
+                    schema = batch.schema
+                    writer = pa.ipc.new_file(path, schema) if path is not None else None
+                batch = batch.cast(schema)
+                if writer is not None:
+                    writer.write_batch(batch)
+                else:
+                    batches.append(batch)
+                length += batch.num_rows
+            meta['offsets'][name] = [offset, length]
+            offset += length
+
+        if schema is None:
+            logger.warning(f'All counts tables are empty, no count store is built from {len(sources)} selections')
+            return None
+        if writer is None:
+            return cls(pa.Table.from_batches(batches, schema=schema), meta)
+
+        writer.close()
+        Path(f'{path}.json').write_text(json.dumps(meta))
+        logger.info(f'Saved count store with {len(sources)} selections to {path}')
+        return cls.open(path)
+
+    @classmethod
+    def open(cls, path: Path) -> 'CountStore':
+        """Memory-map an existing store.
+
+        Args:
+            path: Path of the IPC file.
+
+        Returns:
+            The opened store.
+        """
+        table = pa.ipc.open_file(pa.memory_map(str(path), 'r')).read_all()
+        meta = json.loads(Path(f'{path}.json').read_text())
+        return cls(table, meta)
+
+    @classmethod
+    def is_fresh(cls, path: Path, sources: dict[str, Path]) -> bool:
+        """Check whether the store at ``path`` contains up-to-date copies of all ``sources``.
+
+        The store may contain further selections, e.g. the experiment-wide store written by
+        ``Demultiplex.process`` also serves a single selection.
+
+        Args:
+            path: Path of the IPC file.
+            sources: Mapping of selection names to counts file paths.
+
+        Returns:
+            True if every source is stored and unchanged since the store was built.
+        """
+        meta_path = Path(f'{path}.json')
+        if not (path.exists() and meta_path.exists()):
+            return False
+        stored = json.loads(meta_path.read_text())['sources']
+        return all(stored.get(name) == item for name, item in cls.source_meta(sources).items())
+
+    @classmethod
+    def open_or_build(cls, sources: dict[str, Path], path: Path) -> 'CountStore | None':
+        """Open the store at ``path`` if it is up to date with ``sources``, otherwise (re)build it.
+
+        Args:
+            sources: Mapping of selection names to counts file paths.
+            path: Path of the IPC file.
+
+        Returns:
+            The opened store, None if all counts tables are empty.
+        """
+        if cls.is_fresh(path, sources):
+            return cls.open(path)
+        try:
+            return cls.build(sources, path)
+        except OSError as e:
+            logger.warning(f'Could not write count store to {path}, keeping it in memory: {e}')
+            return cls.build(sources)
+
+    def frame(self, name: str) -> pd.DataFrame:
+        """Return the counts of a selection without copying numeric columns.
+
+        Args:
+            name: Selection name.
+
+        Returns:
+            Counts DataFrame backed by the mapped file.
+        """
+        offset, length = self.offsets[name]
+        return self.table.slice(offset, length).to_pandas(split_blocks=True)
+
+    def value_range(self, col: str) -> tuple[int, int] | None:
+        """Minimum and maximum of a column across all selections.
+
+        Args:
+            col: Column name.
+
+        Returns:
+            Tuple of min and max, None if the store is empty.
+        """
+        if self.table.num_rows == 0:
+            return None
+        result = pc.min_max(self.table[col])
+        return int(result['min'].as_py()), int(result['max'].as_py())
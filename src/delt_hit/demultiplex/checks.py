@@ -0,0 +1,245 @@
+from math import comb
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+from pydantic import BaseModel
+
+from delt_hit.demultiplex.distance import min_distances
+
+IUPAC = 'ACGTURYSWKMBDHVN'
+
+
+class Issue(BaseModel):
+    """A problem found while validating a config."""
+    level: str
+    section: str
+    location: str
+    message: str
+
+
+def max_errors(max_error_rate: float, length: int) -> int:
+    """Number of errors cutadapt allows for an adapter.
+
+    Args:
+        max_error_rate: Value passed to ``cutadapt -e``, an absolute number of errors if at least 1.
+        length: Adapter length.
+
+    Returns:
+        Maximum number of errors.
+    """
+    return int(max_error_rate) if max_error_rate >= 1 else int(np.floor(max_error_rate * length))
+
+
+def codon_table(config: dict) -> pd.DataFrame:
+    """Collect the codons of all regions of the structure in one table.
+
+    Args:
+        config: Configuration dictionary.
+
+    Returns:
+        DataFrame with ``region``, ``type``, ``row`` (Excel row of the codon in its sheet), ``codon``,
+        ``max_error_rate`` and ``indels`` columns.
+    """
+    frames = []
+    for item in config['structure']:
+        records = config['whitelists'].get(item['name'], [])
+        frames.append(pd.DataFrame({
+            'region': item['name'],
+            'type': item['type'],
+            'row': np.arange(len(records)) + 2,
+            'codon': [record.get('codon') for record in records],
+            'max_error_rate': item['max_error_rate'],
+            'indels': bool(item['indels']),
+        }))
+    return pd.concat(frames, ignore_index=True) if frames else \
+        pd.DataFrame(columns=['region', 'type', 'row', 'codon', 'max_error_rate', 'indels'])
+
+
+def check_structure(config: dict) -> list[Issue]:
+    """Check that every region has a whitelist and every whitelist is used.
+
+    Args:
+        config: Configuration dictionary.
+
+    Returns:
+        Found issues.
+    """
+    issues = []
+    regions = [item['name'] for item in config['structure']]
+    for name in regions:
+        if not config['whitelists'].get(name):
+            issues.append(Issue(level='error', section='structure', location=name,
+                                message='Region has no whitelist or an empty whitelist'))
+    for name in set(config['whitelists']) - set(regions):
+        issues.append(Issue(level='warning', section='whitelists', location=name,
+                            message='Whitelist is not used by any region of the structure'))
+    return issues
+
+
+def check_codons(codons: pd.DataFrame) -> list[Issue]:
+    """Check codon values of all regions at once.
+
+    Flags missing codons, invalid characters, duplicates within a region (for selection primers: duplicated primer
+    combinations), IUPAC wildcards, regions with codons of varying length and UMI regions whose whitelist is not a
+    single run of ``N``.
+
+    Args:
+        codons: Table from ``codon_table``.
+
+    Returns:
+        Found issues.
+    """
+    issues = []
+    location = codons.region + ' row ' + codons.row.astype(str)
+    values = codons.codon.astype('string').str.strip().str.upper()
+
+    missing = values.isna() | (values == '')
+    for loc in location[missing]:
+        issues.append(Issue(level='error', section='whitelists', location=loc, message='Codon is empty'))
+
+    invalid = ~missing & ~values.str.fullmatch(f'[{IUPAC}]+', na=False)
+    for loc, codon in zip(location[invalid], values[invalid]):
+        issues.append(Issue(level='error', section='whitelists', location=loc,
+                            message=f'Codon {codon} contains characters other than {IUPAC}'))
+
+    umi = codons.type == 'umi'
+    for region, group in values[umi].groupby(codons.region[umi]):
+        if len(group) != 1 or not group.str.fullmatch('N+', na=False).all():
+            issues.append(Issue(level='error', section='whitelists', location=region,
+                                message='UMI regions need a single codon of one N per UMI base, e.g. NNNNNNNN'))
+
+    wildcard = ~missing & ~invalid & ~umi & ~values.str.fullmatch('[ACGT]+', na=False)
+    for loc, codon in zip(location[wildcard], values[wildcard]):
+        issues.append(Issue(level='warning', section='whitelists', location=loc,
+                            message=f'Codon {codon} contains wildcards, cutadapt cannot use its adapter index for '
+                                    f'this region'))
+
+    # primers are shared between selections, only their combination has to be unique
+    selection = codons.type == 'selection'
+    duplicated = ~missing & ~selection & codons.assign(codon=values).duplicated(['region', 'codon'], keep=False)
+    for (region, codon), group in codons.loc[duplicated].assign(codon=values[duplicated]).groupby(['region', 'codon']):
+        issues.append(Issue(level='error', section='whitelists', location=f'{region} rows {group.row.tolist()}',
+                            message=f'Codon {codon} is not unique'))
+
+    primers = codons.loc[selection].assign(codon=values[selection]).pivot(index='row', columns='region', values='codon')
+    for combination, group in primers.loc[primers.duplicated(keep=False)].groupby(list(primers.columns)):
+        issues.append(Issue(level='error', section='whitelists', location=f'selection rows {group.index.tolist()}',
+                            message=f'Selection primers {dict(zip(primers.columns, combination))} are not unique'))
+
+    lengths = values[~missing].str.len().groupby(codons.region[~missing]).agg(['min', 'max'])
+    for region, row in lengths[lengths['min'] != lengths['max']].iterrows():
+        issues.append(Issue(level='warning', section='whitelists', location=region,
+                            message=f'Codons have varying length ({row["min"]}-{row["max"]}), shorter codons may '
+                                    f'match prefixes of longer ones'))
+    return issues
+
+
+def check_distances(codons: pd.DataFrame, processes: int | None = None) -> tuple[pd.DataFrame, list[Issue]]:
+    """Check that the codons of each region can be told apart with the allowed number of errors.
+
+    A read with ``k`` errors can only be assigned unambiguously if all codons of the region have a pairwise distance
+    of at least ``2k + 1``. Distances are Hamming distances for regions without indels and Levenshtein distances
+    otherwise.
+
+    Args:
+        codons: Table from ``codon_table``.
+        processes: Number of worker processes for Levenshtein distances.
+
+    Returns:
+        Tuple of a per-region summary and the found issues.
+    """
+    summary, issues = [], []
+    codons = codons.assign(codon=codons.codon.astype('string').str.strip().str.upper()).dropna(subset=['codon'])
+    codons = codons.loc[codons.codon != ''].drop_duplicates(['region', 'codon'])
+
+    for region, group in codons.groupby('region', sort=False):
+        values = group.codon.tolist()
+        rate, indels = group.max_error_rate.iloc[0], group.indels.iloc[0]
+        length = max(map(len, values))
+        k = max_errors(rate, length)
+        metric = 'levenshtein' if indels or len(set(map(len, values))) > 1 else 'hamming'
+
+        dist, nearest = min_distances(values, metric=metric, processes=processes)
+        conflicts = (dist <= 2 * k) & (nearest >= 0)
+        summary.append({'region': region, 'num_codons': len(values), 'metric': metric, 'max_errors': k,
+                        'min_distance': int(dist.min()) if len(values) > 1 else pd.NA,
+                        'num_conflicts': int(conflicts.sum())})
+
+        rows = group.row.to_numpy()
+        for i in np.flatnonzero(conflicts):
+            j = nearest[i]
+            if i < j or not conflicts[j] or nearest[j] != i:
+                issues.append(Issue(level='error', section='whitelists', location=f'{region} row {rows[i]}',
+                                    message=f'Codon {values[i]} has {metric} distance {dist[i]} to {values[j]} '
+                                            f'(row {rows[j]}), {k} allowed errors require at least {2 * k + 1}'))
+
+        # cutadapt enumerates all error variants of anchored adapters to build its index
+        variants = sum(comb(length, e) * 3 ** e for e in range(k + 1)) * len(values)
+        if len(values) > 1 and variants > 10_000_000:
+            issues.append(Issue(level='warning', section='structure', location=region,
+                                message=f'{k} allowed errors on {len(values)} codons of length {length} yield '
+                                        f'{variants:,} error variants, cutadapt may not index them and fall back '
+                                        f'to aligning every read against every codon'))
+    return pd.DataFrame(summary), issues
+
+
+def check_library(config: dict) -> list[Issue]:
+    """Check that building blocks and the reaction graph refer to known reactions.
+
+    Args:
+        config: Configuration dictionary.
+
+    Returns:
+        Found issues.
+    """
+    issues = []
+    reactions = set(config.get('catalog', {}).get('reactions', {}))
+    library = config.get('library', {})
+
+    for reaction in sorted(set(library.get('reactions', [])) - reactions):
+        issues.append(Issue(level='error', section='library', location=reaction,
+                            message='Reaction is not defined in the `reactions` sheet'))
+
+    for name in library.get('building_blocks', []):
+        records = pd.DataFrame.from_records(config['whitelists'].get(name, []))
+        if records.empty:
+            continue
+        if 'smiles' in records:
+            for row in np.flatnonzero(records.smiles.isna()) + 2:
+                issues.append(Issue(level='warning', section='library', location=f'{name} row {row}',
+                                    message='Building block has no SMILES'))
+    return issues
+
+
+def run_checks(config: dict, processes: int | None = None) -> tuple[pd.DataFrame, pd.DataFrame]:
+    """Run all checks on a config.
+
+    Args:
+        config: Configuration dictionary.
+        processes: Number of worker processes for Levenshtein distances.
+
+    Returns:
+        Tuple of an issues table (``level``, ``section``, ``location``, ``message``) and the per-region distance
+        summary.
+    """
+    codons = codon_table(config)
+    issues = check_structure(config) + check_codons(codons) + check_library(config)
+    summary, distance_issues = check_distances(codons, processes=processes)
+    issues += distance_issues
+    issues = pd.DataFrame([issue.model_dump() for issue in issues],
+                          columns=['level', 'section', 'location', 'message'])
+    return issues, summary
+
+
+def save_checks(issues: pd.DataFrame, summary: pd.DataFrame, save_dir: Path) -> None:
+    """Write the validation results.
+
+    Args:
+        issues: Issues table from ``run_checks``.
+        summary: Distance summary from ``run_checks``.
+        save_dir: Output directory.
+    """
+    save_dir.mkdir(parents=True, exist_ok=True)
+    issues.to_csv(save_dir / 'validation.tsv', sep='\t', index=False)
+    summary.to_csv(save_dir / 'codon_distances.tsv', sep='\t', index=False)
@@ -0,0 +1,168 @@
+import heapq
+from collections.abc import Iterator
+from itertools import groupby
+from pathlib import Path
+
+from loguru import logger
+
+from delt_hit.demultiplex.checks import max_errors
+from delt_hit.demultiplex.validation import Region
+
+# approximate memory of one entry in the table: dict slot, bytes object and int besides the sequence itself
+ENTRY_OVERHEAD = 120
+# sorted runs merged at once, more are first merged into a single run to bound the number of open files
+MAX_RUNS = 64
+
+
+def merge_runs(paths: list[Path]) -> Iterator[tuple[bytes, int]]:
+    """Merge sorted runs of ``<sequence> <count>`` lines, summing the counts of equal sequences.
+
+    Args:
+        paths: Sorted runs.
+
+    Yields:
+        Tuples of sequence and count in sequence order.
+    """
+    files = [open(path, 'rb') for path in paths]
+    try:
+        pairs = heapq.merge(*[(line.split() for line in f) for f in files], key=lambda pair: pair[0])
+        for sequence, group in groupby(pairs, key=lambda pair: pair[0]):
+            yield sequence, sum(int(count) for _, count in group)
+    finally:
+        for f in files:
+            f.close()
+
+
+def barcode_length(regions: list[Region]) -> int:
+    """Length of the read prefix that holds all regions.
+
+    Cutadapt only aligns anchored adapters at the read start, so bases after the last region never change the
+    decoding. Regions allowing indels add their maximum number of errors as slack.
+
+    Args:
+        regions: Regions in the order of the structure.
+
+    Returns:
+        Prefix length.
+    """
+    length = 0
+    for region in regions:
+        longest = max(map(len, region.codons), default=0)
+        length += longest + (max_errors(region.max_error_rate, longest) if int(region.indels) else 0)
+    return length
+
+
+class ReadCollapser:
+    """Collapses identical barcode prefixes into ``(sequence, multiplicity)`` pairs under a memory budget.
+
+    Prefixes are counted in a hash table. When the estimated size of the table exceeds the budget it is written to
+    disk as a sorted run and cleared; the runs are merged when the pairs are read. Every ``MAX_RUNS`` runs are merged
+    into one, so the number of open files stays bounded for any budget.
+    """
+
+    def __init__(self, length: int | None, tmp_dir: Path, memory_mb: int = 1024):
+        """Create an empty collapser.
+
+        Args:
+            length: Length of the collapsed prefix, whole reads if None.
+            tmp_dir: Directory for sorted runs.
+            memory_mb: Memory budget of the table in MiB.
+        """
+        self.length = length
+        self.tmp_dir = tmp_dir
+        self.max_bytes = memory_mb * 2 ** 20
+        self.counts = {}
+        self.num_bytes = 0
+        self.runs = []
+        self.num_spills = 0
+        self.num_reads = 0
+
+    def add(self, sequence: bytes):
+        """Count one read.
+
+        Args:
+            sequence: Read sequence, a trailing newline is removed.
+        """
+        self.num_reads += 1
+        prefix = sequence.rstrip()[:self.length]
+        if not prefix:
+            return
+        count = self.counts.get(prefix)
+        if count is None:
+            self.counts[prefix] = 1
+            self.num_bytes += len(prefix) + ENTRY_OVERHEAD
+            if self.num_bytes > self.max_bytes:
+                self.spill()
+        else:
+            self.counts[prefix] = count + 1
+
+    def add_records(self, records: Iterator[tuple[bytes, ...]]):
+        """Count the reads of FASTQ records.
+
+        Args:
+            records: Tuples of the four lines of each FASTQ record.
+        """
+        add = self.add
+        for record in records:
+            add(record[1])
+
+    def spill(self):
+        """Write the table as a sorted run and clear it."""
+        self.runs.append(self.write_run(sorted(self.counts.items())))
+        logger.debug(f'Spilled {len(self.counts):,} unique sequences to {self.runs[-1]}')
+        self.counts = {}
+        self.num_bytes = 0
+        if len(self.runs) >= MAX_RUNS:
+            runs, self.runs = self.runs, []
+            self.runs.append(self.write_run(merge_runs(runs)))
+            for path in runs:
+                path.unlink()
+
+    def write_run(self, items) -> Path:
+        """Write a sorted run.
+
+        Args:
+            items: Tuples of sequence and count in sequence order.
+
+        Returns:
+            Path to the run.
+        """
+        path = self.tmp_dir / f'collapse-{self.num_spills}.tmp'
+        self.num_spills += 1
+        self.tmp_dir.mkdir(parents=True, exist_ok=True)
+        with open(path, 'wb') as f:
+            f.writelines(b'%s %d\n' % item for item in items)
+        return path
+
+    def items(self) -> Iterator[tuple[bytes, int]]:
+        """Unique sequences and their multiplicities, sorted by sequence if runs were spilled.
+
+        Yields:
+            Tuples of sequence and multiplicity.
+        """
+        if not self.runs:
+            yield from self.counts.items()
+            return
+
+        self.spill()
+        logger.info(f'Merging {len(self.runs)} sorted runs of collapsed reads')
+        try:
+            yield from merge_runs(self.runs)
+        finally:
+            for path in self.runs:
+                path.unlink()
+            self.runs = []
+
+    def write_fasta(self, sink) -> int:
+        """Write the unique sequences as FASTA records named ``<index> count=<multiplicity>``.
+
+        Args:
+            sink: Writable binary stream.
+
+        Returns:
+            Number of unique sequences.
+        """
+        num_unique = 0
+        for num_unique, (sequence, count) in enumerate(self.items(), start=1):
+            sink.write(b'>%d count=%d\n%s\n' % (num_unique, count, sequence))
+        return num_unique
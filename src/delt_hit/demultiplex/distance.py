@@ -0,0 +1,175 @@
+import multiprocessing
+from collections.abc import Iterator
+
+import numpy as np
+from Levenshtein import distance
+
+
+def encode_codons(codons: list[str], alphabet: bytes | None = None) -> np.ndarray:
+    """One-hot encode equal-length codons.
+
+    Args:
+        codons: Codons of equal length.
+        alphabet: Characters to encode, defaults to all characters present.
+
+    Returns:
+        Float32 array of shape ``(len(codons), length * len(alphabet))``.
+    """
+    lengths = {len(codon) for codon in codons}
+    assert len(lengths) <= 1, 'One-hot encoding requires codons of equal length'
+    length = lengths.pop() if lengths else 0
+
+    data = np.frombuffer(''.join(codons).encode('ascii'), dtype=np.uint8).reshape(len(codons), length)
+    alphabet = np.frombuffer(alphabet, dtype=np.uint8) if alphabet is not None else np.unique(data)
+    return (data[:, :, None] == alphabet[None, None, :]).reshape(len(codons), -1).astype(np.float32)
+
+
+def hamming_blocks(codons: list[str], other: list[str] | None = None, block_size: int = 4096,
+                   triangular: bool = False) -> Iterator[tuple[int, np.ndarray]]:
+    """Pairwise Hamming distances of equal-length codons in row blocks.
+
+    Distances are computed as ``length - matches`` where the matches are the product of one-hot encodings, so each
+    block is a single matrix multiplication.
+
+    Args:
+        codons: Codons of equal length (rows).
+        other: Codons to compare against (columns), ``codons`` if None.
+        block_size: Number of rows per block.
+        triangular: Only compare each block against the columns from its first row on, which skips the blocks
+            below the diagonal of a symmetric comparison (``other`` is None).
+
+    Yields:
+        Tuples of the first row of the block and an int32 distance matrix of shape ``(rows, len(other))``, or
+        ``(rows, len(codons) - start)`` if ``triangular``.
+    """
+    triangular = triangular and other is None
+    other = codons if other is None else other
+    assert len({len(c) for c in [*codons, *other]}) <= 1, 'Hamming distances require codons of equal length'
+    alphabet = ''.join(sorted(set(''.join(codons) + ''.join(other)))).encode('ascii')
+    length = len(codons[0]) if codons else 0
+    a, b = encode_codons(codons, alphabet), encode_codons(other, alphabet).T
+    for start in range(0, len(codons), block_size):
+        matches = a[start:start + block_size] @ (b[:, start:] if triangular else b)
+        yield start, length - np.rint(matches).astype(np.int32)
+
+
+def _levenshtein_rows(args: tuple[list[str], list[str]]) -> np.ndarray:
+    """Levenshtein distances of some rows against all columns.
+
+    Args:
+        args: Tuple of row codons and column codons.
+
+    Returns:
+        Int32 distance matrix.
+    """
+    rows, columns = args
+    return np.array([[distance(a, b) for b in columns] for a in rows], dtype=np.int32).reshape(len(rows), len(columns))
+
+
+def levenshtein_blocks(codons: list[str], other: list[str] | None = None, block_size: int = 256,
+                       processes: int | None = None, triangular: bool = False) -> Iterator[tuple[int, np.ndarray]]:
+    """Pairwise Levenshtein distances in row blocks, computed by a process pool for large inputs.
+
+    Args:
+        codons: Codons (rows).
+        other: Codons to compare against (columns), ``codons`` if None.
+        block_size: Number of rows per block.
+        processes: Number of worker processes, all CPUs if None. Small inputs are computed in-process.
+        triangular: Only compare each block against the columns from its first row on (see ``hamming_blocks``).
+
+    Yields:
+        Tuples of the first row of the block and an int32 distance matrix of shape ``(rows, len(other))``, or
+        ``(rows, len(codons) - start)`` if ``triangular``.
+    """
+    triangular = triangular and other is None
+    other = codons if other is None else other
+    starts = range(0, len(codons), block_size)
+    tasks = ((codons[start:start + block_size], other[start:] if triangular else other) for start in starts)
+
+    if len(codons) * len(other) < 1_000_000 or processes == 1:
+        yield from zip(starts, map(_levenshtein_rows, tasks))
+        return
+
+    with multiprocessing.Pool(processes or multiprocessing.cpu_count()) as pool:
+        yield from zip(starts, pool.imap(_levenshtein_rows, tasks))
+
+
+def distance_blocks(codons: list[str], other: list[str] | None = None, metric: str = 'auto',
+                    processes: int | None = None, triangular: bool = False) -> Iterator[tuple[int, np.ndarray]]:
+    """Pairwise distances in row blocks.
+
+    Args:
+        codons: Codons (rows).
+        other: Codons to compare against (columns), ``codons`` if None.
+        metric: ``'hamming'``, ``'levenshtein'`` or ``'auto'`` (Hamming if all codons have equal length).
+        processes: Number of worker processes for Levenshtein distances.
+        triangular: Only compare each block against the columns from its first row on (see ``hamming_blocks``).
+
+    Yields:
+        Tuples of the first row of the block and an int32 distance matrix.
+    """
+    if metric == 'auto':
+        metric = 'hamming' if len({len(c) for c in [*codons, *(other or [])]}) <= 1 else 'levenshtein'
+
+    match metric:
+        case 'hamming':
+            yield from hamming_blocks(codons, other, triangular=triangular)
+        case 'levenshtein':
+            yield from levenshtein_blocks(codons, other, processes=processes, triangular=triangular)
+        case _:
+            raise ValueError(f'Unknown metric {metric}')
+
+
+def min_distances(codons: list[str], other: list[str] | None = None, metric: str = 'auto',
+                  processes: int | None = None) -> tuple[np.ndarray, np.ndarray]:
+    """Distance of every codon to its nearest neighbour.
+
+    Args:
+        codons: Codons.
+        other: Codons to search for neighbours, ``codons`` itself (excluding the codon) if None.
+        metric: ``'hamming'``, ``'levenshtein'`` or ``'auto'``.
+        processes: Number of worker processes for Levenshtein distances.
+
+    Returns:
+        Tuple of minimum distances and the positions of the nearest neighbours in ``other`` (or ``codons``).
+    """
+    nearest = np.full(len(codons), -1, dtype=np.int64)
+    min_dist = np.full(len(codons), np.iinfo(np.int32).max, dtype=np.int32)
+    if not codons or (other is None and len(codons) < 2) or (other is not None and not other):
+        return min_dist, nearest
+
+    for start, block in distance_blocks(codons, other, metric=metric, processes=processes):
+        rows = np.arange(len(block))
+        if other is None:
+            block[rows, start + rows] = np.iinfo(np.int32).max
+        idx = block.argmin(axis=1)
+        nearest[start:start + len(block)] = idx
+        min_dist[start:start + len(block)] = block[rows, idx]
+    return min_dist, nearest
+
+
+def distance_histogram(codons: list[str], other: list[str] | None = None, metric: str = 'auto',
+                       processes: int | None = None) -> np.ndarray:
+    """Histogram of pairwise distances, accumulated block by block without keeping all distances.
+
+    Within ``codons`` only the blocks on and above the diagonal are computed, each unordered pair once.
+
+    Args:
+        codons: Codons.
+        other: Codons to compare against, all unordered pairs within ``codons`` if None.
+        metric: ``'hamming'``, ``'levenshtein'`` or ``'auto'``.
+        processes: Number of worker processes for Levenshtein distances.
+
+    Returns:
+        Array whose ``i``-th entry is the number of pairs at distance ``i``.
+    """
+    counts = np.zeros(1, dtype=np.int64)
+    for start, block in distance_blocks(codons, other, metric=metric, processes=processes, triangular=True):
+        if other is None:
+            # columns start at the block's first row, keep the pairs right of the diagonal
+            block = block[np.arange(block.shape[1])[None, :] > np.arange(len(block))[:, None]]
+        block_counts = np.bincount(block.ravel())
+        if len(block_counts) > len(counts):
+            counts = np.pad(counts, (0, len(block_counts) - len(counts)))
+        counts[:len(block_counts)] += block_counts
+    return counts
@@ -1,6 +1,68 @@
+from collections.abc import Iterator
+from contextlib import contextmanager
 from pathlib import Path
 import pandas as pd
 
+
+class Workbook:
+    """Excel workbook that is opened once and parses each sheet at most once.
+
+    The section parsers below accept either a path or a ``Workbook``; ``config_from_excel`` shares one instance
+    between all of them instead of re-opening the file and re-parsing sheets such as ``selection`` per section.
+    """
+
+    def __init__(self, path: Path):
+        """Open the workbook (openpyxl in read-only mode).
+
+        Args:
+            path: Path to the Excel configuration workbook.
+        """
+        self.file = pd.ExcelFile(path, engine='openpyxl')
+        self.sheet_names = self.file.sheet_names
+        self.sheets = {}
+
+    def __enter__(self) -> 'Workbook':
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        """Close the underlying file."""
+        self.file.close()
+
+    def sheet(self, name: str) -> pd.DataFrame:
+        """Return a sheet as DataFrame, parsing it on first access.
+
+        Args:
+            name: Sheet name.
+
+        Returns:
+            A copy of the parsed sheet, so callers may modify it.
+        """
+        if name not in self.sheets:
+            self.sheets[name] = self.file.parse(name)
+        return self.sheets[name].copy()
+
+
+@contextmanager
+def open_workbook(path: Path | Workbook) -> Iterator[Workbook]:
+    """Use ``path`` if it already is a ``Workbook``, otherwise open it for the ``with`` block.
+
+    A workbook passed in is left open for its owner, one opened here is closed on exit.
+
+    Args:
+        path: Path to the Excel configuration workbook or an opened workbook.
+
+    Yields:
+        The workbook.
+    """
+    if isinstance(path, Workbook):
+        yield path
+    else:
+        with Workbook(path) as wb:
+            yield wb
+
 def validate_config(config: dict):
     """Validate that the config is internally consistent.
 
@@ -15,6 +77,8 @@ def validate_config(config: dict):
 def config_from_excel(path: Path):
     """Load a full configuration from an Excel workbook.
 
+    The workbook is opened once and every sheet is parsed once for all sections.
+
     Args:
         path: Path to the Excel configuration workbook.
 
@@ -22,24 +86,25 @@ def config_from_excel(path: Path):
         The assembled configuration dictionary.
     """
     config = {}
-    config['experiment'] = experiment_from_excel(path)
-    config['selections'] = selections_from_excel(path)
+    with Workbook(path) as wb:
+        config['experiment'] = experiment_from_excel(wb)
+        config['selections'] = selections_from_excel(wb)
 
-    config['library'] = library_from_excel(path)
-    config['catalog'] = catalog_from_excel(path)
+        config['library'] = library_from_excel(wb)
+        config['catalog'] = catalog_from_excel(wb)
 
-    config['structure'] = structure_from_excel(path)
-    # config['analyses'] = analyses_from_excel(path)
-    config['whitelists'] = whitelists_from_excel(path)
+        config['structure'] = structure_from_excel(wb)
+        # config['analyses'] = analyses_from_excel(wb)
+        config['whitelists'] = whitelists_from_excel(wb)
 
     validate_config(config)
     return config
 
-def library_from_excel(path: Path) -> dict:
+def library_from_excel(path: Path | Workbook) -> dict:
     """Parse library topology metadata from an Excel workbook.
 
     Args:
-        path: Path to the Excel configuration workbook.
+        path: Path to the Excel configuration workbook or an opened ``Workbook``.
 
     Returns:
         A dictionary with library edges, nodes, and building block sheets.
@@ -47,7 +112,10 @@ def library_from_excel(path: Path) -> dict:
     Raises:
         AssertionError: If required columns are missing values.
     """
-    rnx_g = pd.read_excel(path, sheet_name='reaction_graph')
+    with open_workbook(path) as wb:
+        rnx_g = wb.sheet('reaction_graph')
+        bbs_sheets = sorted(filter(lambda x: x.startswith('B'), wb.sheet_names))
+        bbs = {sheet: wb.sheet(sheet) for sheet in bbs_sheets}
     assert not rnx_g.educt_1.isna().any(), "All `educt_1` in `reaction_graph` must be filled"
     assert not rnx_g['product'].isna().any(), "All `product` in `reaction_graph` must be filled"
     assert not rnx_g.reaction.isna().any(), "All `reaction` in `reaction_graph` must be filled"
@@ -67,12 +135,8 @@ def library_from_excel(path: Path) -> dict:
     edges += [(i, j) for i, j in zip(rnx_g.reaction, rnx_g['product'])]
     educts.update(rnx_g.educt_2)
 
-    xf = pd.ExcelFile(path)
-    sheets = set(xf.sheet_names)
-    bbs_sheets = sorted(filter(lambda x: x.startswith('B'), sheets))
     bb_edges = set()
-    for sheet in bbs_sheets:
-        df = pd.read_excel(path, sheet_name=sheet)
+    for sheet, df in bbs.items():
         df = df.astype(str)
 
         filter_ = df.smiles.notna()
@@ -91,23 +155,24 @@ def library_from_excel(path: Path) -> dict:
                 bb_edges=sorted(list(bb_edges)), other_edges=sorted(list(edges)), building_blocks=sorted(list(bbs_sheets)))
 
 
-def experiment_from_excel(path: Path):
+def experiment_from_excel(path: Path | Workbook):
     """Parse experiment metadata from an Excel workbook.
 
     Args:
-        path: Path to the Excel configuration workbook.
+        path: Path to the Excel configuration workbook or an opened ``Workbook``.
 
     Returns:
         A dict of experiment settings keyed by variable name.
     """
-    experiment = pd.read_excel(path, sheet_name='experiment')
+    with open_workbook(path) as wb:
+        experiment = wb.sheet('experiment')
     return experiment.set_index('variable')['value'].to_dict()
 
-def structure_from_excel(path: Path):
+def structure_from_excel(path: Path | Workbook):
     """Parse structure metadata from an Excel workbook.
 
     Args:
-        path: Path to the Excel configuration workbook.
+        path: Path to the Excel configuration workbook or an opened ``Workbook``.
 
     Returns:
         A list of structure entries as dictionaries.
@@ -115,16 +180,17 @@ def structure_from_excel(path: Path):
     Raises:
         AssertionError: If structure names or types are invalid.
     """
-    structure = pd.read_excel(path, sheet_name='structure')
-    assert structure.name.str.match(r'^[SCB]').all(), "Structure `name` must start with 'S', 'B', or 'C' depending on type"
-    assert structure.type.isin(['selection', 'building_block', 'constant']).all(), "Structure `type` must be one of 'selection', 'building_block', or 'constant'"
+    with open_workbook(path) as wb:
+        structure = wb.sheet('structure')
+    assert structure.name.str.match(r'^[SCBU]').all(), "Structure `name` must start with 'S', 'B', 'C' or 'U' depending on type"
+    assert structure.type.isin(['selection', 'building_block', 'constant', 'umi']).all(), "Structure `type` must be one of 'selection', 'building_block', 'constant' or 'umi'"
     return structure.to_dict('records')
 
-def selections_from_excel(path: Path):
+def selections_from_excel(path: Path | Workbook):
     """Parse selections metadata from an Excel workbook.
 
     Args:
-        path: Path to the Excel configuration workbook.
+        path: Path to the Excel configuration workbook or an opened ``Workbook``.
 
     Returns:
         A dict keyed by selection name with selection metadata.
@@ -132,34 +198,36 @@ def selections_from_excel(path: Path):
     Raises:
         AssertionError: If selection names or primer combinations are invalid.
     """
-    selections = pd.read_excel(path, sheet_name='selection')
+    with open_workbook(path) as wb:
+        selections = wb.sheet('selection')
+        selection_ids_to_name = get_selection_name_to_ids(wb)
     if 'date' in selections.columns:
         selections['date'] = pd.to_datetime(selections['date']).dt.strftime('%Y-%m-%d')
-    selection_ids_to_name = get_selection_name_to_ids(path)
     assert selections.name.is_unique, "Selection `names` must be unique"
     selections['ids'] = list(map(list, selections['name'].map(selection_ids_to_name).tolist()))
     return selections.set_index('name').to_dict('index')
 
-def analyses_from_excel(path: Path):
+def analyses_from_excel(path: Path | Workbook):
     """Group selections by analysis name from an Excel workbook.
 
     Args:
-        path: Path to the Excel configuration workbook.
+        path: Path to the Excel configuration workbook or an opened ``Workbook``.
 
     Returns:
         A dict mapping analysis name to selection names.
     """
-    selections = pd.read_excel(path, sheet_name='selection')
+    with open_workbook(path) as wb:
+        selections = wb.sheet('selection')
     analyses = {}
     for grp, data in selections.groupby('analysis'):
         analyses[grp] = data.name.tolist()
     return analyses
 
-def whitelists_from_excel(path: Path):
+def whitelists_from_excel(path: Path | Workbook):
     """Parse codon whitelist sheets from an Excel workbook.
 
     Args:
-        path: Path to the Excel configuration workbook.
+        path: Path to the Excel configuration workbook or an opened ``Workbook``.
 
     Returns:
         A dict mapping whitelist names to codon records.
@@ -167,15 +235,14 @@ def whitelists_from_excel(path: Path):
     Raises:
         AssertionError: If codons are missing or duplicated.
     """
-    xf = pd.ExcelFile(path)
-    sheets = set(xf.sheet_names)
-
-    bbs_sheets = sorted(filter(lambda x: x.startswith('B'), sheets))
+    with open_workbook(path) as wb:
+        bbs_sheets = sorted(filter(lambda x: x.startswith('B'), wb.sheet_names))
+        bbs = {sheet: wb.sheet(sheet) for sheet in bbs_sheets}
+        selections = wb.sheet('selection')
+        constants = wb.sheet('constant')
 
-    selections = pd.read_excel(path, sheet_name='selection')
     selection_col_names = list(filter(lambda x: x.startswith('S'), selections.columns))
 
-    constants = pd.read_excel(path, sheet_name='constant')
     assert constants.notna().any().any(), "`constant` cannot have empty cells"
 
     # %%
@@ -186,8 +253,7 @@ def whitelists_from_excel(path: Path):
         name, codon = constant.pop('name'), constant.pop('codon')
         whitelists[name] = [{'codon': codon}]
 
-    for sheet in bbs_sheets:
-        df = pd.read_excel(path, sheet_name=sheet)
+    for sheet, df in bbs.items():
         assert df.codon.nunique() == len(df), f"Codons for building blocks {sheet} must be unique"
         assert df.codon.notna().all(), f"Codons for building blocks {sheet} cannot be empty"
 
@@ -203,20 +269,18 @@ def whitelists_from_excel(path: Path):
 
     return whitelists
 
-def catalog_from_excel(path: Path):
+def catalog_from_excel(path: Path | Workbook):
     """Parse the catalog of compounds and reactions from Excel.
 
     Args:
-        path: Path to the Excel configuration workbook.
+        path: Path to the Excel configuration workbook or an opened ``Workbook``.
 
     Returns:
         A dict containing compound and reaction catalogs.
     """
-    xf = pd.ExcelFile(path)
-    sheets = set(xf.sheet_names)
-
-    compounds = pd.read_excel(path, sheet_name='compounds')
-    reactions = pd.read_excel(path, sheet_name='reactions')
+    with open_workbook(path) as wb:
+        compounds = wb.sheet('compounds')
+        reactions = wb.sheet('reactions')
 
     # %%
     catalog = {
@@ -226,11 +290,11 @@ def catalog_from_excel(path: Path):
 
     return catalog
 
-def get_selection_name_to_ids(path: Path)-> dict:
+def get_selection_name_to_ids(path: Path | Workbook)-> dict:
     """Build a selection name to primer ID mapping.
 
     Args:
-        path: Path to the Excel configuration workbook.
+        path: Path to the Excel configuration workbook or an opened ``Workbook``.
 
     Returns:
         A mapping of selection names to primer ID tuples.
@@ -238,7 +302,8 @@ def get_selection_name_to_ids(path: Path)-> dict:
     Raises:
         AssertionError: If primer combinations are not unique.
     """
-    df = pd.read_excel(path, sheet_name='selection')
+    with open_workbook(path) as wb:
+        df = wb.sheet('selection')
     selection_col_names = list(filter(lambda x: x.startswith('S'), df.columns))
 
     assert len(df[selection_col_names].drop_duplicates()) == len(df), "S0, S1 combinations must be unique"
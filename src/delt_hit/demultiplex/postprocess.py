@@ -1,28 +1,125 @@
-from collections import defaultdict
+from collections import Counter, defaultdict
 import gzip
 from pathlib import Path
 
+import numpy as np
 import pandas as pd
+from Levenshtein import distance
 from tqdm import tqdm
 
+from delt_hit.demultiplex.read_store import ReadStoreWriter
+from delt_hit.demultiplex.sketch import TopKCounter
+from delt_hit.demultiplex.umi import UmiCounter
+from delt_hit.demultiplex.validation import Region
+
 def extract_ids(line: str):
     """Extract selection and barcode IDs from a cutadapt info line.
 
+    Adapter names may carry the matched read sequence as ``<adapter>=<sequence>``, UMI regions are annotated as
+    ``<region id>=<UMI>``. Reads collapsed before decoding carry their multiplicity as ``count=<n>`` in the read
+    comment.
+
     Args:
         line: A line from the cutadapt info file.
 
     Returns:
-        A dict with selection ID tuples and barcode tuples.
+        A dict with selection ID tuples, barcode tuples, the raw adapter annotations (without UMIs), the read
+        multiplicity and the UMI (the UMIs of several UMI regions joined, None without UMI regions).
     """
-    _, *adapters = line.strip().split('?')
+    name, *matches = line.strip().split('?')
+    count = next((int(i[6:]) for i in name.split() if i.startswith('count=')), 1)
+    umis = [i.partition('=')[2] for i in matches if 'U' in i.partition('=')[0]]
+    matches = [i for i in matches if 'U' not in i.partition('=')[0]]
+    adapters = [i.partition('=')[0] for i in matches]
     selection_ids = [i.split('.')[-1] for i in filter(lambda x: 'S' in x, adapters)]
     selection_ids = tuple(map(int, selection_ids))
     barcodes = tuple(int(i.split('.')[-1]) + 1 for i in filter(lambda x: 'B' in x, adapters))
-    return {'selection_ids': selection_ids, 'barcodes': barcodes}
+    return {'selection_ids': selection_ids, 'barcodes': barcodes, 'adapters': matches, 'count': count,
+            'umi': ''.join(umis) if umis else None}
+
+
+class ReadStats:
+    """Per-region histograms of edit counts, match length shifts and codon usage of the decoded reads.
+
+    While counting only the distinct ``<adapter>=<sequence>`` annotations are tallied, which costs one counter update
+    per read. Edit distances to the whitelisted codons are computed once per distinct annotation when the histograms
+    are built. Adapters are anchored at the read start, so the match position is described by the length shift
+    ``len(match) - len(codon)`` (non-zero only for indels).
+    """
+
+    def __init__(self, regions: list[Region]):
+        """Create empty statistics.
+
+        Args:
+            regions: Regions as used to write the cutadapt adapter files.
+        """
+        self.codons = {region.id: region.codons for region in regions if not region.is_umi}
+        self.matches = Counter()
+
+    def update(self, adapters: list[str], count: int = 1):
+        """Record the adapter annotations of one read.
+
+        Args:
+            adapters: Annotations as returned in ``extract_ids(line)['adapters']``.
+            count: Multiplicity of the read.
+        """
+        for adapter in adapters:
+            self.matches[adapter] += count
+
+    def histograms(self) -> dict[str, dict[str, np.ndarray]]:
+        """Build the histograms.
+
+        Returns:
+            Mapping of region IDs to ``errors`` (``codons x (max_length + 1)``) and ``length_delta``
+            (``codons x (2 * max_length + 1)``, column ``max_length`` is no shift) count matrices.
+        """
+        hists = {}
+        for region_id, codons in self.codons.items():
+            length = max(map(len, codons), default=0)
+            hists[region_id] = {'errors': np.zeros((len(codons), length + 1), dtype=np.int64),
+                                'length_delta': np.zeros((len(codons), 2 * length + 1), dtype=np.int64)}
+
+        for annotation, count in self.matches.items():
+            adapter, sep, match = annotation.partition('=')
+            region_id, _, index = adapter.rpartition('.')
+            if not sep or region_id not in hists:
+                continue
+            codon = self.codons[region_id][int(index)]
+            hist = hists[region_id]
+            length = hist['errors'].shape[1] - 1
+            hist['errors'][int(index), min(distance(match, codon), length)] += count
+            hist['length_delta'][int(index), np.clip(len(match) - len(codon), -length, length) + length] += count
+        return hists
+
+    def to_frame(self) -> pd.DataFrame:
+        """Non-zero histogram cells in long format.
+
+        Returns:
+            DataFrame with ``region``, ``stat`` (``errors`` or ``length_delta``), ``codon`` (index into the region's
+            adapters), ``value`` and ``count`` columns.
+        """
+        frames = []
+        for region_id, hists in self.histograms().items():
+            for stat, hist in hists.items():
+                offset = 0 if stat == 'errors' else (hist.shape[1] - 1) // 2
+                codon, value = np.nonzero(hist)
+                frames.append(pd.DataFrame({'region': region_id, 'stat': stat, 'codon': codon,
+                                            'value': value - offset, 'count': hist[codon, value]}))
+        columns = ['region', 'stat', 'codon', 'value', 'count']
+        return pd.concat(frames, ignore_index=True)[columns] if frames else pd.DataFrame(columns=columns)
+
+    def save(self, path: Path):
+        """Write the histograms as a single Parquet file.
+
+        Args:
+            path: Output path.
+        """
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self.to_frame().to_parquet(path, index=False)
 
 
 def save_counts(counts: dict, output_dir: Path, ids_to_name: dict = None,
-                as_files: bool = True, sort_by_counts: bool = True) -> None:
+                as_files: bool = True, sort_by_counts: bool = True, molecules: dict | None = None) -> None:
     """Persist count tables to disk.
 
     Args:
@@ -31,16 +128,21 @@ def save_counts(counts: dict, output_dir: Path, ids_to_name: dict = None,
         ids_to_name: Optional mapping from selection ID tuples to names.
         as_files: Whether to store counts as flat files or nested dirs.
         sort_by_counts: Whether to sort descending by count.
+        molecules: Nested dict of selection IDs to barcode molecule counts (``UmiCounter.counts``). If given, the
+            ``count`` column holds the molecules and an additional ``reads`` column the read counts.
     """
 
     num_codes = len(list(list(counts.values())[0].keys())[0])
     codon_cols = [f'code_{i}' for i in range(1, num_codes + 1)]
-    columns = codon_cols + ['count']
+    columns = codon_cols + ['count'] + (['reads'] if molecules is not None else [])
 
     sort_by_cols = 'count' if sort_by_counts else codon_cols
 
     for selection_ids, count in tqdm(counts.items(), ncols=100):
-        rows = [(*k, v, "_".join(map(str, k))) for k, v in count.items()]
+        if molecules is None:
+            rows = [(*k, v, "_".join(map(str, k))) for k, v in count.items()]
+        else:
+            rows = [(*k, molecules[selection_ids].get(k, 0), v, "_".join(map(str, k))) for k, v in count.items()]
         df = pd.DataFrame.from_records(rows, columns=[*columns, 'id'])
         df = df.astype({k: int for k in columns})
         df.sort_values(sort_by_cols, ascending=False, inplace=True)
@@ -61,12 +163,19 @@ def save_counts(counts: dict, output_dir: Path, ids_to_name: dict = None,
             df.to_csv(output_file, index=False, sep='\t')
 
 
-def get_counts(*, input_path: Path, num_reads: int) -> dict:
+def get_counts(*, input_path: Path, num_reads: int, read_stats: ReadStats | None = None,
+               umis: UmiCounter | None = None, top_k: TopKCounter | None = None,
+               read_store: ReadStoreWriter | None = None) -> dict:
     """Count barcode occurrences from a gzipped read file.
 
     Args:
         input_path: Path to the gzipped reads with adapter info.
         num_reads: Expected number of reads for progress tracking.
+        read_stats: Statistics to update in the same pass, if given.
+        umis: Counter of the distinct UMIs per selection and barcodes to update in the same pass, if given.
+        top_k: Approximate counter, if given only the estimated counts of its top barcodes per selection are
+            returned instead of exact counts of all barcodes.
+        read_store: Store to add every read to in the same pass, if given.
 
     Returns:
         A nested dict of selection IDs to barcode counts.
@@ -75,6 +184,15 @@ def get_counts(*, input_path: Path, num_reads: int) -> dict:
         counts = defaultdict(lambda: defaultdict(int))
         for line in tqdm(f, total=num_reads, ncols=100):
             ids = extract_ids(line)
-            counts[ids['selection_ids']][ids['barcodes']] += 1
-    return counts
+            if top_k is not None:
+                top_k.add(ids['selection_ids'], ids['barcodes'], ids['count'])
+            else:
+                counts[ids['selection_ids']][ids['barcodes']] += ids['count']
+            if read_stats is not None:
+                read_stats.update(ids['adapters'], ids['count'])
+            if umis is not None:
+                umis.add((ids['selection_ids'], ids['barcodes']), ids['umi'])
+            if read_store is not None:
+                read_store.add(ids['selection_ids'], ids['barcodes'], line)
+    return top_k.counts() if top_k is not None else counts
 
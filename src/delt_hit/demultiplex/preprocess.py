@@ -1,14 +1,22 @@
 import multiprocessing
 import os
 import stat
+import sys
 import textwrap
 from pathlib import Path
 
 import pandas as pd
 
-from delt_hit.utils import read_yaml
+from delt_hit.utils import read_config
+from delt_hit.demultiplex import sampling, telemetry
 from delt_hit.demultiplex.validation import Region
 
+# cutadapt --rename template, appends `?<adapter>=<matched sequence>` to the read name for every region
+RENAME_TEMPLATE = '{id} {comment}?{adapter_name}={match_sequence}'
+# UMI regions are cut from the read start and appended as `?<region id>=<UMI>`
+UMI_RENAME_TEMPLATE = '{{id}} {{comment}}?{region_id}={{cut_prefix}}'
+FAST_DEV_RUN_READS = 10000
+
 
 def get_codons(name: str, whitelists: dict) -> list[str]:
     """Return codon strings for a named whitelist.
@@ -68,6 +76,8 @@ def write_fastq_files(regions: list[Region], save_path: Path) -> None:
         save_path: Directory to write the FASTQ files.
     """
     for i, region in enumerate(regions):
+        if region.is_umi:
+            continue
         fastq = [f'>{region.id}.{index}\n{codon}'
                  for index, codon in enumerate(region.codons)]
         fastq = '\n'.join(fastq)
@@ -81,6 +91,8 @@ def generate_input_files(
         write_info_file: bool = False,
         fast_dev_run: bool = False,
         with_processing: bool = False,
+        sample: float | None = None,
+        seed: int = 0,
 ) -> None:
     """Create cutadapt input files and a demultiplex shell script.
 
@@ -88,13 +100,16 @@ def generate_input_files(
         config_path: Path to the YAML config file.
         write_json_file: Whether to request cutadapt JSON output files.
         write_info_file: Whether to request cutadapt info output files.
-        fast_dev_run: Whether to restrict to a small read subset.
+        fast_dev_run: Whether to restrict to a random sample of ``FAST_DEV_RUN_READS`` reads, unless ``sample`` is
+            given.
         with_processing: Whether to append post-processing commands.
+        sample: Number (if at least 1) or fraction of reads to sample from the whole input, all reads if None.
+        seed: Random seed of the sample.
 
     Returns:
         Path to the generated shell script.
     """
-    config = read_yaml(config_path)
+    config = read_config(config_path)
 
     save_dir = Path(config['experiment']['save_dir']).expanduser().resolve()
     path_input_fastq = Path(config['experiment']['fastq_path']).expanduser().resolve()
@@ -111,6 +126,7 @@ def generate_input_files(
 
     cutadapt_input_files_dir.mkdir(parents=True, exist_ok=True)
     path_demultiplex_exec = cutadapt_input_files_dir / 'demultiplex.sh'
+    path_telemetry = save_dir / experiment_name / 'demultiplex' / telemetry.TELEMETRY_FILE
 
     path_final_reads = cutadapt_output_files_dir / 'reads_with_adapters.gz'
     path_output_fastq = cutadapt_output_files_dir / 'out.fastq.gz'
@@ -121,26 +137,33 @@ def generate_input_files(
     with open(path_demultiplex_exec, 'w') as f:
         f.write('#!/bin/bash\n')
         f.write('# make sure you installed pigz with `brew install pigz` to enable parallel processing\n\n')
+        # every stage runs under the telemetry wrapper, see `delt-hit demultiplex status`. The module is run as a
+        # plain script so the wrapper does not import the package and inflate the peak RSS reported for its child
+        f.write('export DELT_HIT_RUN_ID=$(date +%Y%m%dT%H%M%S)\n')
+        f.write(f'telemetry() {{ "{sys.executable}" "{Path(telemetry.__file__).resolve()}" '
+                f'--log "{path_telemetry}" "$@"; }}\n\n')
         f.write(f'mkdir "{cutadapt_output_files_dir}"\n')
 
         # NOTE: we symlink the fastq file we want to demultiplex
         f.write(f'ln -sf "{path_input_fastq}" "{path_output_fastq}"\n')
 
-        if fast_dev_run:
-            n_reads_for_fast_dev_run = 10000
-            n_lines = 4 * n_reads_for_fast_dev_run
-            f.write(f'# fast-dev-run enabled\n')
+        sample = sample or (FAST_DEV_RUN_READS if fast_dev_run else None)
+        if sample is not None:
+            f.write(f'# sampling enabled\n')
 
+            # the sampler only uses the standard library and is run as a plain script like the telemetry wrapper
             cmd = f"""
             tmp_file=$(mktemp)
-            gzcat "{path_output_fastq}" | head -n {n_lines} | gzip -c > "$tmp_file"
+            telemetry --stage sample --input "{path_input_fastq}" -- \\
+            "{sys.executable}" "{Path(sampling.__file__).resolve()}" "{path_input_fastq}" "$tmp_file" \\
+            --size {sample:g} --seed {seed} || exit
             mv $tmp_file "{path_output_fastq}"
             """
 
             cmd = textwrap.dedent(cmd)
             f.write(cmd)
 
-    rename_command = '{id} {comment}?{adapter_name}'
+    rename_command = RENAME_TEMPLATE
 
     for region in regions:
         error_rate = region.max_error_rate
@@ -152,20 +175,31 @@ def generate_input_files(
         report_file_name = cutadapt_output_files_dir / f'{region.id}.cutadapt.json'
         stdout_file_name = cutadapt_output_files_dir / f'{region.id}.cutadapt.log'
         info_file_name = cutadapt_output_files_dir / f'{region.id}.cutadapt.info.gz'
+        report = f' --report "{report_file_name}"' if write_json_file else ''
+
+        if region.is_umi:
+            options = f"""
+                --cut {len(region.codons[0])} \\
+                --rename '{UMI_RENAME_TEMPLATE.format(region_id=region.id)}' \\
+                """
+        else:
+            options = f"""
+                -e {error_rate}{indels} \\
+                -g "^file:{path_adapters}" \\
+                --rename '{rename_command}' \\
+                --discard-untrimmed \\
+                """
 
         with open(path_demultiplex_exec, 'a') as f:
             cmd = f"""
                 mv "{path_output_fastq}" "{path_input_fastq}"
                 
+                telemetry --stage {region.id} --input "{path_input_fastq}" --output "{path_output_fastq}"{report} -- \\
                 cutadapt "{path_input_fastq}" \\
                 -o "{path_output_fastq}" \\
-                -e {error_rate}{indels} \\
-                -g "^file:{path_adapters}" \\
-                --rename '{rename_command}' \\
-                --discard-untrimmed \\
                 """
 
-            cmd = textwrap.dedent(cmd)
+            cmd = textwrap.dedent(cmd) + textwrap.dedent(options).lstrip('\n')
 
             if write_json_file:
                 cmd += f'--json="{report_file_name}" \\\n'
@@ -178,13 +212,16 @@ def generate_input_files(
 
     if with_processing:
         with open(path_demultiplex_exec, 'a') as f:
-            f.write(f'\nzgrep @ "{path_output_fastq}" | gzip -c > "{path_final_reads}" || exit\n')
-            f.write(f'delt-hit demultiplex process --config_path="{config_path}" || exit\n')
+            f.write(f'\ntelemetry --stage collect --input "{path_output_fastq}" --output "{path_final_reads}" -- '
+                    f'bash -c \'zgrep @ "{path_output_fastq}" | gzip -c > "{path_final_reads}"\' || exit\n')
+            f.write(f'telemetry --stage process --input "{path_final_reads}" -- '
+                    f'delt-hit demultiplex process --config_path="{config_path}" || exit\n')
             f.write(f'rm "{path_output_fastq}" "{path_input_fastq}"\n')
         os.chmod(path_demultiplex_exec, os.stat(path_demultiplex_exec).st_mode | stat.S_IEXEC)
     else:
         with open(path_demultiplex_exec, 'a') as f:
-            f.write(f'\nzgrep @ "{path_output_fastq}" | gzip -c > "{path_final_reads}" || exit\n')
+            f.write(f'\ntelemetry --stage collect --input "{path_output_fastq}" --output "{path_final_reads}" -- '
+                    f'bash -c \'zgrep @ "{path_output_fastq}" | gzip -c > "{path_final_reads}"\' || exit\n')
         os.chmod(path_demultiplex_exec, os.stat(path_demultiplex_exec).st_mode | stat.S_IEXEC)
 
 
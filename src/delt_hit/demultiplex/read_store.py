@@ -0,0 +1,194 @@
+import gzip
+import heapq
+from bisect import bisect_left
+from pathlib import Path
+
+import pandas as pd
+from loguru import logger
+
+from delt_hit.demultiplex.collapse import MAX_RUNS
+from delt_hit.demultiplex.sampling import BGZF_BLOCK_SIZE, BGZF_EOF, bgzf_block
+
+READ_STORE_FILE = 'reads.tsv.gz'
+READ_STORE_INDEX = 'reads.index.parquet'
+
+
+def store_key(selection: str, codes: tuple[int, ...]) -> str:
+    """Key of the reads of one compound in a selection.
+
+    Args:
+        selection: Selection name.
+        codes: Codes as in the count tables (``code_1``, ...).
+
+    Returns:
+        ``<selection>\\t<code_1>_<code_2>...``, where the codes part equals the ``id`` column of the count tables.
+    """
+    return f'{selection}\t{"_".join(map(str, codes))}'
+
+
+class ReadStoreWriter:
+    """Writes the demultiplexed reads sorted by selection and codes into a BGZF file with a block index.
+
+    Every line of the store is ``<selection>\\t<codes>\\t<read name>``, where the read name carries the matched
+    sequence of every region. Since tabs sort before all printable characters, sorting whole lines groups them by
+    key. Lines are sorted in memory up to the budget and spilled to sorted runs that are merged when the store is
+    written, every ``MAX_RUNS`` runs are merged into one beforehand. The index has the first and last key, offset
+    and size of every block.
+    """
+
+    def __init__(self, save_dir: Path, ids_to_name: dict, memory_mb: float = 1024):
+        """Create an empty store.
+
+        Args:
+            save_dir: Directory of the store, also used for sorted runs.
+            ids_to_name: Mapping from selection ID tuples to names, IDs without name are joined by ``-``.
+            memory_mb: Memory budget of the sort buffer in MiB.
+        """
+        self.save_dir = save_dir
+        self.ids_to_name = ids_to_name
+        self.max_bytes = memory_mb * 2 ** 20
+        self.lines = []
+        self.num_bytes = 0
+        self.runs = []
+        self.num_runs = 0
+        self.num_reads = 0
+
+    def add(self, selection_ids: tuple, barcodes: tuple, read_name: str):
+        """Add one read.
+
+        Args:
+            selection_ids: Selection IDs of the read.
+            barcodes: Codes of the read.
+            read_name: Annotated read name as collected after demultiplexing.
+        """
+        name = self.ids_to_name.get(selection_ids) or '-'.join(map(str, selection_ids))
+        line = f'{store_key(name, barcodes)}\t{read_name.strip()[1:]}\n'
+        self.lines.append(line)
+        self.num_bytes += len(line) + 50
+        self.num_reads += 1
+        if self.num_bytes > self.max_bytes:
+            self.spill()
+
+    def spill(self):
+        """Write the buffer as a sorted run and clear it."""
+        self.lines.sort()
+        self.runs.append(self.write_run(self.lines))
+        self.lines = []
+        self.num_bytes = 0
+        if len(self.runs) >= MAX_RUNS:
+            runs, self.runs = self.runs, []
+            files = [open(path) for path in runs]
+            self.runs.append(self.write_run(heapq.merge(*files)))
+            for f, path in zip(files, runs):
+                f.close()
+                path.unlink()
+
+    def write_run(self, lines) -> Path:
+        """Write sorted lines to a new run file.
+
+        Args:
+            lines: Sorted lines.
+
+        Returns:
+            Path to the run.
+        """
+        self.save_dir.mkdir(parents=True, exist_ok=True)
+        self.num_runs += 1
+        path = self.save_dir / f'store-{self.num_runs}.tmp'
+        with open(path, 'w') as f:
+            f.writelines(lines)
+        return path
+
+    def write(self) -> Path:
+        """Sort all reads and write the store and its index.
+
+        Returns:
+            Path to the store.
+        """
+        self.save_dir.mkdir(parents=True, exist_ok=True)
+        files = []
+        if self.runs:
+            self.spill()
+            files = [open(path) for path in self.runs]
+            lines = heapq.merge(*files)
+        else:
+            lines = iter(sorted(self.lines))
+
+        path = self.save_dir / READ_STORE_FILE
+        blocks, buffer, keys, offset = [], [], [], 0
+        with open(path, 'wb') as f:
+            def flush():
+                """Write the buffered lines as one block."""
+                nonlocal offset
+                block = bgzf_block(''.join(buffer).encode())
+                f.write(block)
+                blocks.append({'first_key': keys[0], 'last_key': keys[-1], 'offset': offset, 'size': len(block)})
+                offset += len(block)
+                buffer.clear()
+                keys.clear()
+
+            num_bytes = 0
+            for line in lines:
+                if num_bytes + len(line) > BGZF_BLOCK_SIZE:
+                    flush()
+                    num_bytes = 0
+                buffer.append(line)
+                keys.append(line[:line.index('\t', line.index('\t') + 1)])
+                num_bytes += len(line)
+            if buffer:
+                flush()
+            f.write(BGZF_EOF)
+
+        for file in files:
+            file.close()
+        for run in self.runs:
+            run.unlink()
+        self.runs, self.lines = [], []
+
+        index = pd.DataFrame(blocks, columns=['first_key', 'last_key', 'offset', 'size'])
+        index.to_parquet(self.save_dir / READ_STORE_INDEX, index=False)
+        logger.info(f'Wrote {self.num_reads:,} reads in {len(index):,} blocks to {path}')
+        return path
+
+
+class ReadStore:
+    """Random access to the reads of a store written by ``ReadStoreWriter``.
+
+    The blocks that may hold a key are found by binary search in the index, only those are decompressed.
+    """
+
+    def __init__(self, save_dir: Path):
+        """Open a store.
+
+        Args:
+            save_dir: Directory of the store.
+        """
+        self.path = save_dir / READ_STORE_FILE
+        index = pd.read_parquet(save_dir / READ_STORE_INDEX)
+        self.first_keys = index.first_key.tolist()
+        self.last_keys = index.last_key.tolist()
+        self.offsets = index.offset.to_numpy()
+        self.sizes = index['size'].to_numpy()
+
+    def reads(self, selection: str, codes: tuple[int, ...]) -> list[str]:
+        """Read names of the reads of one compound in a selection.
+
+        Args:
+            selection: Selection name.
+            codes: Codes as in the count tables.
+
+        Returns:
+            Annotated read names.
+        """
+        key = store_key(selection, codes)
+        prefix = f'{key}\t'
+        reads = []
+        with open(self.path, 'rb') as f:
+            # the first block whose last key is not smaller, then all blocks starting at or before the key
+            for i in range(bisect_left(self.last_keys, key), len(self.first_keys)):
+                if self.first_keys[i] > key:
+                    break
+                f.seek(self.offsets[i])
+                lines = gzip.decompress(f.read(self.sizes[i])).decode().splitlines()
+                reads += [line[len(prefix):] for line in lines if line.startswith(prefix)]
+        return reads
@@ -0,0 +1,125 @@
+from collections.abc import Iterator
+from itertools import combinations, product
+
+from delt_hit.demultiplex.checks import max_errors
+from delt_hit.demultiplex.validation import Region
+
+
+def hamming_variants(codon: str, k: int) -> set[str]:
+    """All sequences within Hamming distance ``k`` of a codon.
+
+    Args:
+        codon: Codon.
+        k: Maximum number of substitutions.
+
+    Returns:
+        Set of sequences including the codon itself.
+    """
+    variants = {codon}
+    for e in range(1, k + 1):
+        for positions in combinations(range(len(codon)), e):
+            for bases in product('ACGTN', repeat=e):
+                variant = list(codon)
+                for position, base in zip(positions, bases):
+                    variant[position] = base
+                variants.add(''.join(variant))
+    return variants
+
+
+def fixed_offsets(regions: list[Region]) -> list[int | None]:
+    """Start position of every region in the read, if it does not depend on the read.
+
+    A region starts at a fixed position if all regions before it have codons of a single length and do not allow
+    indels.
+
+    Args:
+        regions: Regions in the order of the structure.
+
+    Returns:
+        Start offsets, None for regions whose start varies.
+    """
+    offsets, offset = [], 0
+    for region in regions:
+        offsets.append(offset)
+        lengths = {len(codon) for codon in region.codons}
+        if offset is None or len(lengths) != 1 or int(region.indels):
+            offset = None
+        else:
+            offset += lengths.pop()
+    return offsets
+
+
+class SelectionRouter:
+    """Keeps reads whose selection primers belong to one of the requested selections, before any decoding.
+
+    Only selection regions at a fixed read position without indels can be checked; primers are matched with up to
+    the number of substitutions cutadapt allows for the region. Reads that cutadapt could still assign to a requested
+    selection are never dropped, so the counts of the requested selections equal those of a full run.
+    """
+
+    def __init__(self, regions: list[Region], structure: list[dict], selections: dict[str, list[int]]):
+        """Prepare the primer lookup tables.
+
+        Args:
+            regions: Regions in the order of the structure.
+            structure: Structure records, used for the region types.
+            selections: Requested selections, mapping names to primer indices of the selection regions.
+        """
+        selection_regions = [i for i, item in enumerate(structure) if item['type'] == 'selection']
+        offsets = fixed_offsets(regions)
+
+        # (position among selection regions, start, length, variant -> primer indices)
+        self.checks = []
+        for position, i in enumerate(selection_regions):
+            region = regions[i]
+            lengths = {len(codon) for codon in region.codons}
+            if offsets[i] is None or int(region.indels) or len(lengths) != 1:
+                continue
+            k = max_errors(region.max_error_rate, lengths.pop())
+            lookup = {}
+            for index, codon in enumerate(region.codons):
+                for variant in hamming_variants(codon, k):
+                    lookup.setdefault(variant.encode(), set()).add(index)
+            self.checks.append((position, offsets[i], len(region.codons[0]), lookup))
+
+        self.selections = selections
+        self.num_in = self.num_out = 0
+        self.combinations = {tuple(ids[position] for position, *_ in self.checks) for ids in selections.values()}
+
+    @property
+    def active(self) -> bool:
+        """Whether any selection region can be checked before decoding."""
+        return bool(self.checks)
+
+    def keep(self, sequence: bytes) -> bool:
+        """Check whether a read can belong to one of the requested selections.
+
+        Args:
+            sequence: Read sequence.
+
+        Returns:
+            True if the read is kept.
+        """
+        candidates = []
+        for _, start, length, lookup in self.checks:
+            indices = lookup.get(sequence[start:start + length])
+            if indices is None:
+                return False
+            candidates.append(indices)
+        return any(combination in self.combinations for combination in product(*candidates))
+
+    def filter(self, records: Iterator[tuple[bytes, ...]]) -> Iterator[tuple[bytes, ...]]:
+        """Keep the FASTQ records of requested selections, counted in ``num_in`` and ``num_out``.
+
+        Args:
+            records: Tuples of the four lines of each FASTQ record.
+
+        Yields:
+            The kept records.
+        """
+        keep = self.keep
+        for record in records:
+            self.num_in += 1
+            if keep(record[1]):
+                self.num_out += 1
+                yield record
@@ -0,0 +1,514 @@
+import gzip
+import multiprocessing
+import os
+import resource
+import shutil
+import subprocess
+import sys
+import threading
+import time
+from collections.abc import Callable
+from contextlib import ExitStack
+from functools import partial
+from itertools import islice
+from pathlib import Path
+
+import pandas as pd
+from loguru import logger
+from pydantic import BaseModel
+
+from delt_hit.demultiplex.collapse import ReadCollapser, barcode_length
+from delt_hit.demultiplex.preprocess import (FAST_DEV_RUN_READS, RENAME_TEMPLATE, UMI_RENAME_TEMPLATE, get_regions,
+                                             write_fastq_files)
+from delt_hit.demultiplex.routing import SelectionRouter
+from delt_hit.demultiplex.sampling import ReadSampler, read_records
+from delt_hit.demultiplex.telemetry import TELEMETRY_FILE, end_stage, file_size, start_stage, wait_process
+from delt_hit.demultiplex.validation import Region
+
+
+class Stage(BaseModel):
+    """One cutadapt step of the demultiplex pipeline."""
+    name: str
+    command: list[str]
+    input: Path | None = None
+    output: Path | None = None
+    log: Path
+    report: Path | None = None
+
+
+def intermediate_path(output_dir: Path, region: Region, fmt: str = 'fastq') -> Path:
+    """Path of the reads kept after a region when intermediate files are written.
+
+    Args:
+        output_dir: Cutadapt output directory.
+        region: The region.
+        fmt: Read format, ``fastq`` or ``fasta`` for collapsed reads.
+
+    Returns:
+        Path to the gzipped read file.
+    """
+    return output_dir / f'{region.id}.{fmt}.gz'
+
+
+def build_stages(regions: list[Region], *, input_dir: Path, output_dir: Path, fastq_path: Path | None,
+                 num_cores: int, keep_intermediate: bool = False, start: int = 0, write_json_file: bool = True,
+                 write_info_file: bool = False, fmt: str = 'fastq') -> list[Stage]:
+    """Build the chain of cutadapt stages, one per region in the order of the structure.
+
+    Every stage keeps the reads that start with one of the region's codons and passes them on to the next one, so
+    the stages form a linear chain. Stages of UMI regions cut the UMI and keep all reads. Stages stream uncompressed
+    reads to each other through pipes unless ``keep_intermediate`` is set.
+
+    Args:
+        regions: Regions of the structure.
+        input_dir: Directory with the adapter files written by ``write_fastq_files``.
+        output_dir: Cutadapt output directory.
+        fastq_path: Reads of the first stage, None to read them from stdin.
+        num_cores: Cores per cutadapt process.
+        keep_intermediate: Whether every stage writes its reads to ``intermediate_path`` instead of a pipe.
+        start: Index of the first stage to build. It reads the intermediate file of the previous region.
+        write_json_file: Whether to write cutadapt JSON reports.
+        write_info_file: Whether to write cutadapt info files.
+        fmt: Format of the reads, ``fastq`` or ``fasta`` for collapsed reads.
+
+    Returns:
+        The stages from ``start`` on.
+    """
+    stages = []
+    for i, region in enumerate(regions[start:], start=start):
+        input_path = fastq_path if i == 0 else None
+        if i > 0 and (i == start or keep_intermediate):
+            input_path = intermediate_path(output_dir, regions[i - 1], fmt)
+        output_path = intermediate_path(output_dir, region, fmt) if keep_intermediate else None
+        report = output_dir / f'{region.id}.cutadapt.json'
+
+        command = ['cutadapt', str(input_path or '-'), '-o', str(output_path or '-')]
+        if region.is_umi:
+            command += ['--cut', str(len(region.codons[0])), '--rename',
+                        UMI_RENAME_TEMPLATE.format(region_id=region.id)]
+        else:
+            command += ['-e', str(region.max_error_rate)] + ([] if int(region.indels) else ['--no-indels'])
+            command += ['-g', f'^file:{input_dir / f"{region.id}.fastq"}', '--rename', RENAME_TEMPLATE,
+                        '--discard-untrimmed']
+        command += [f'--cores={num_cores}']
+        command += [f'--json={report}'] if write_json_file else []
+        command += [f'--info-file={output_dir / f"{region.id}.cutadapt.info.gz"}'] if write_info_file else []
+
+        stages.append(Stage(name=region.id, command=command, input=input_path, output=output_path,
+                            log=output_dir / f'{region.id}.cutadapt.log', report=report if write_json_file else None))
+    return stages
+
+
+def close_pipe(stdin) -> None:
+    """Close a pipe whose reader may already have exited.
+
+    Args:
+        stdin: Writable binary pipe.
+    """
+    try:
+        stdin.close()
+    except BrokenPipeError:
+        pass
+
+
+def collect_headers(reads, save_path: Path, lines_per_record: int = 4) -> int:
+    """Write the read names, which carry the matched adapters, of a FASTQ or FASTA stream.
+
+    Args:
+        reads: Binary FASTQ or FASTA stream.
+        save_path: Gzipped output file.
+        lines_per_record: Lines per read, 4 for FASTQ and 2 for FASTA.
+
+    Returns:
+        Number of reads.
+    """
+    num_reads = 0
+    with gzip.open(save_path, 'wb', compresslevel=6) as f:
+        for header in islice(reads, 0, None, lines_per_record):
+            f.write(header)
+            num_reads += 1
+    return num_reads
+
+
+def publish(source: Path, target: Path) -> None:
+    """Move a file into place atomically, also across filesystems.
+
+    The file is copied next to ``target`` under a temporary name and renamed, so readers never see a partial file.
+
+    Args:
+        source: File to move.
+        target: Destination path.
+    """
+    target.parent.mkdir(parents=True, exist_ok=True)
+    try:
+        os.replace(source, target)
+        return
+    except OSError:
+        pass
+    tmp = target.with_name(f'.{target.name}.tmp')
+    shutil.copyfile(source, tmp)
+    os.replace(tmp, target)
+    source.unlink()
+
+
+def check_capacity(path: Path, required: int, purpose: str) -> None:
+    """Fail early if the filesystem of ``path`` has less free space than required.
+
+    Args:
+        path: Directory on the filesystem to check.
+        required: Required space in bytes.
+        purpose: Description used in the error message.
+
+    Raises:
+        RuntimeError: If there is not enough free space.
+    """
+    free = shutil.disk_usage(path).free
+    logger.info(f'{purpose}: {required / 2 ** 30:.2f} GiB required, {free / 2 ** 30:.2f} GiB free in {path}')
+    if free < required:
+        raise RuntimeError(f'Not enough space for {purpose} in {path}: {required / 2 ** 30:.2f} GiB required, '
+                           f'{free / 2 ** 30:.2f} GiB free')
+
+
+class Runner:
+    """Runs the demultiplex pipeline as supervised processes.
+
+    The cutadapt stages of all regions run concurrently and stream reads to each other through pipes, the read
+    names of the last stage are collected in-process. Each stage is checked for its exit code and logged to the
+    telemetry log (see ``delt-hit demultiplex status``).
+
+    With a scratch directory (e.g. local NVMe or ``/dev/shm``) all files written while demultiplexing go to
+    ``<scratch_dir>/delt-hit-<experiment_name>/`` and only the final ones are moved to ``save_dir`` when the cutadapt
+    stages are done. The scratch directory is removed afterwards, unless intermediate reads are kept in it to resume
+    from.
+    """
+
+    def __init__(self, config: dict, config_path: Path, scratch_dir: Path | None = None):
+        """Set up the pipeline of an experiment.
+
+        Args:
+            config: Configuration dictionary.
+            config_path: Path of the config, passed to the ``process`` stage.
+            scratch_dir: Directory for files written while demultiplexing, defaults to the ``scratch_dir`` of the
+                experiment config if set, otherwise files are written to ``save_dir`` directly.
+        """
+        self.config = config
+        self.config_path = config_path
+        save_dir = Path(config['experiment']['save_dir']).expanduser().resolve()
+        name = config['experiment']['name']
+        self.input_dir = save_dir / name / 'demultiplex' / 'cutadapt_input_files'
+        self.output_dir = save_dir / name / 'demultiplex' / 'cutadapt_output_files'
+        self.log_path = save_dir / name / 'demultiplex' / TELEMETRY_FILE
+        self.reads_path = self.output_dir / 'reads_with_adapters.gz'
+        self.fastq_path = Path(config['experiment']['fastq_path']).expanduser().resolve()
+
+        scratch_dir = scratch_dir or config['experiment'].get('scratch_dir')
+        scratch_dir = None if scratch_dir is None or pd.isna(scratch_dir) else Path(scratch_dir).expanduser().resolve()
+        self.work_dir = scratch_dir / f'delt-hit-{name}' if scratch_dir else self.output_dir
+
+        num_cores = config['experiment']['num_cores']
+        self.num_cores = multiprocessing.cpu_count() if pd.isna(num_cores) else int(num_cores)
+        self.regions = get_regions(config['structure'], config['whitelists'])
+        self.run_id = None
+        self.fmt = 'fastq'
+
+    @property
+    def stage_names(self) -> list[str]:
+        """Names of all stages in execution order."""
+        return [region.id for region in self.regions] + ['collect', 'process']
+
+    def run(self, *, fast_dev_run: bool = False, keep_intermediate: bool = False, resume_from: str | None = None,
+            with_processing: bool = True, selections: list[str] | None = None, collapse: bool = False,
+            collapse_memory_mb: int = 1024, sample: float | None = None, seed: int = 0) -> Path:
+        """Run the pipeline.
+
+        Args:
+            fast_dev_run: Whether to only use a random sample of ``FAST_DEV_RUN_READS`` reads, unless ``sample`` is
+                given.
+            keep_intermediate: Whether to write the reads kept after every region to disk, which allows resuming
+                from any region. Without, stages are connected by pipes.
+            resume_from: Name of the stage to start from (a region ID, ``collect`` or ``process``). The outputs of
+                the previous stage must exist.
+            with_processing: Whether to run ``delt-hit demultiplex process`` on the collected reads, implied when
+                resuming from ``process``.
+            selections: Names of the selections to decode. Reads of other or unknown selections are dropped by a
+                ``SelectionRouter`` before the first cutadapt stage. All reads are decoded if None.
+            collapse: Whether to collapse identical barcode prefixes with a ``ReadCollapser`` before the first
+                cutadapt stage. The stages then decode each unique prefix once and pass FASTA records whose
+                multiplicity is counted by ``process``. Resuming requires the same setting as the original run.
+            collapse_memory_mb: Memory budget of the collapser in MiB, larger tables are spilled to sorted runs in
+                the scratch directory.
+            sample: Number (if at least 1) or fraction of reads to sample from the whole input with a
+                ``ReadSampler``, all reads if None.
+            seed: Random seed of the sample.
+
+        Returns:
+            Path to the collected read names.
+        """
+        resume_from = resume_from or self.stage_names[0]
+        assert resume_from in self.stage_names, f'Unknown stage {resume_from}, choose from {self.stage_names}'
+        start = self.stage_names.index(resume_from)
+        with_processing = with_processing or resume_from == 'process'
+        sample = sample or (FAST_DEV_RUN_READS if fast_dev_run else None)
+        self.run_id = time.strftime('%Y%m%dT%H%M%S')
+        self.fmt = 'fasta' if collapse else 'fastq'
+
+        self.input_dir.mkdir(parents=True, exist_ok=True)
+        self.output_dir.mkdir(parents=True, exist_ok=True)
+        self.work_dir.mkdir(parents=True, exist_ok=True)
+        write_fastq_files(self.regions, save_path=self.input_dir)
+
+        if start > 0 and resume_from != 'process':
+            previous = intermediate_path(self.work_dir, self.regions[start - 1], self.fmt)
+            assert previous.exists(), f'Cannot resume from {resume_from}: {previous} does not exist, ' \
+                                      f'run with keep_intermediate to write intermediate reads'
+
+        if resume_from != 'process':
+            self.check_capacity(keep_intermediate=keep_intermediate, num_stages=max(len(self.regions) - start, 0),
+                                fast_dev_run=sample is not None)
+
+        router = self.router(selections) if selections and start == 0 else None
+        if selections and start > 0:
+            logger.warning(f'Selections are only routed when starting from the first region, not from {resume_from}')
+        if sample is not None and start > 0:
+            logger.warning(f'Reads are only sampled when starting from the first region, not from {resume_from}')
+
+        collapser = ReadCollapser(barcode_length(self.regions), self.work_dir,
+                                  memory_mb=collapse_memory_mb) if collapse and start == 0 else None
+
+        if start < len(self.regions):
+            # later stages read the intermediate file of the previous region
+            streamed = start == 0 and (sample is not None or router is not None or collapser is not None)
+            stages = build_stages(self.regions, input_dir=self.input_dir, output_dir=self.work_dir,
+                                  fastq_path=None if streamed else self.fastq_path, num_cores=self.num_cores,
+                                  keep_intermediate=keep_intermediate, start=start, fmt=self.fmt)
+            sampler = ReadSampler(sample, seed=seed) if sample is not None and start == 0 else None
+            feed = partial(self.feed, sampler=sampler, router=router, collapser=collapser) if streamed else None
+            self.run_cutadapt(stages, feed=feed)
+        elif resume_from == 'collect':
+            with gzip.open(intermediate_path(self.work_dir, self.regions[-1], self.fmt), 'rb') as reads:
+                self.run_collect(reads)
+
+        if self.work_dir != self.output_dir and resume_from != 'process':
+            self.publish(keep_intermediate=keep_intermediate)
+
+        if with_processing:
+            command = [sys.executable, '-m', 'delt_hit.cli.main', 'demultiplex', 'process',
+                       f'--config_path={self.config_path}']
+            start_event = start_stage(self.log_path, stage='process', command=command, run_id=self.run_id)
+            status, usage = wait_process(subprocess.Popen(command))
+            code = end_stage(self.log_path, start_event, status=status, usage=usage,
+                             bytes_read=file_size([self.reads_path]))
+            if code != 0:
+                raise RuntimeError(f'Stage process failed with exit code {code}')
+        return self.reads_path
+
+    def check_capacity(self, keep_intermediate: bool, num_stages: int, fast_dev_run: bool = False):
+        """Check up front that the scratch and output directories can hold the files of a run.
+
+        The collected read names and, with ``keep_intermediate``, the reads kept after every stage are each assumed
+        to be at most as large as the input reads.
+
+        Args:
+            keep_intermediate: Whether intermediate reads are written.
+            num_stages: Number of cutadapt stages to run.
+            fast_dev_run: Whether only a sample of the reads is used, skips the check.
+        """
+        if fast_dev_run or not self.fastq_path.exists():
+            return
+        input_size = self.fastq_path.stat().st_size
+        required = input_size * (1 + (num_stages if keep_intermediate else 0))
+        if self.work_dir == self.output_dir:
+            check_capacity(self.work_dir, required, 'demultiplex outputs')
+        else:
+            check_capacity(self.work_dir, required, 'demultiplex scratch files')
+            check_capacity(self.output_dir, input_size, 'demultiplex outputs')
+
+    def publish(self, keep_intermediate: bool = False):
+        """Move the final files of the run from the scratch directory to ``save_dir``.
+
+        Cutadapt reports, logs and info files and the collected read names are moved. The scratch directory is
+        removed afterwards unless ``keep_intermediate`` is set, then the intermediate reads stay in it to resume from.
+
+        Args:
+            keep_intermediate: Whether to keep the scratch directory.
+        """
+        patterns = ['*.cutadapt.json', '*.cutadapt.log', '*.cutadapt.info.gz', self.reads_path.name]
+        paths = [path for pattern in patterns for path in self.work_dir.glob(pattern)]
+        for path in paths:
+            publish(path, self.output_dir / path.name)
+        logger.info(f'Moved {len(paths)} files from {self.work_dir} to {self.output_dir}')
+
+        if keep_intermediate:
+            remaining = [path for path in self.work_dir.rglob('*') if path.is_file()]
+            logger.info(f'Kept {len(remaining)} intermediate files ({file_size(remaining) / 2 ** 30:.2f} GiB) in '
+                        f'{self.work_dir}')
+        else:
+            shutil.rmtree(self.work_dir)
+            logger.info(f'Removed {self.work_dir}')
+
+    def router(self, selections: list[str]) -> SelectionRouter | None:
+        """Build the router for the requested selections.
+
+        Args:
+            selections: Selection names.
+
+        Returns:
+            The router, None if no selection region can be checked before decoding.
+        """
+        unknown = set(selections) - set(self.config['selections'])
+        assert not unknown, f'Unknown selections {sorted(unknown)}'
+        router = SelectionRouter(self.regions, self.config['structure'],
+                                 {name: list(self.config['selections'][name]['ids']) for name in selections})
+        if not router.active:
+            logger.warning('No selection region is at a fixed read position without indels, reads are not routed')
+            return None
+        return router
+
+    def feed(self, stdin, sampler: ReadSampler | None = None, router: SelectionRouter | None = None,
+             collapser: ReadCollapser | None = None):
+        """Feed the input reads to the first stage and close its stdin.
+
+        Sampling, routing and collapsing are logged as stages ``sample``, ``route`` and ``collapse``.
+
+        Args:
+            stdin: Writable pipe of the first stage.
+            sampler: Sampler drawing the reads to use, all reads if None.
+            router: Router dropping the reads of selections that were not requested.
+            collapser: Collapser writing unique barcode prefixes as FASTA records instead of the reads.
+        """
+        try:
+            with ExitStack() as stack:
+                if sampler is not None:
+                    sample_event = start_stage(self.log_path, stage='sample', command=['sample_reads'],
+                                               run_id=self.run_id)
+                    records = sampler.sample(self.fastq_path)
+                else:
+                    records = read_records(stack.enter_context(gzip.open(self.fastq_path, 'rb')))
+                if router is not None:
+                    route_event = start_stage(self.log_path, stage='route', command=['route_selections'],
+                                              run_id=self.run_id)
+                    records = router.filter(records)
+                if collapser is not None:
+                    collapse_event = start_stage(self.log_path, stage='collapse', command=['collapse_reads'],
+                                                 run_id=self.run_id)
+                    collapser.add_records(records)
+                else:
+                    stdin.writelines(b''.join(record) for record in records)
+                # block-sampled BGZF input is only read in part
+                bytes_read = sampler.bytes_read if sampler is not None else file_size([self.fastq_path])
+                if sampler is not None:
+                    self.end_feed(sample_event, sampler.num_in, sampler.num_out, bytes_read)
+                    logger.info(f'Sampled {sampler.num_out:,} of {sampler.num_in:,} reads read')
+                if router is not None:
+                    self.end_feed(route_event, router.num_in, router.num_out, bytes_read)
+                    logger.info(f'Routed {router.num_out:,} of {router.num_in:,} reads to '
+                                f'{len(router.selections)} selections')
+            if collapser is not None:
+                num_unique = collapser.write_fasta(stdin)
+                self.end_feed(collapse_event, collapser.num_reads, num_unique, bytes_read)
+                logger.info(f'Collapsed {collapser.num_reads:,} reads to {num_unique:,} unique barcode prefixes '
+                            f'({num_unique / max(collapser.num_reads, 1):.1%})')
+        except BrokenPipeError:
+            pass
+        finally:
+            close_pipe(stdin)
+
+    def end_feed(self, start_event: dict, num_in: int, num_out: int, bytes_read: int):
+        """Log the end of a stage running in the feeding thread.
+
+        Args:
+            start_event: Event returned by ``start_stage``.
+            num_in: Reads in.
+            num_out: Reads out.
+            bytes_read: Bytes of the input file read.
+        """
+        # the stage runs in a thread of this process
+        usage = resource.getrusage(getattr(resource, 'RUSAGE_THREAD', resource.RUSAGE_SELF))
+        end_stage(self.log_path, start_event, status=0, usage=usage, bytes_read=bytes_read,
+                  counts={'reads_in': num_in, 'reads_out': num_out})
+
+    def run_cutadapt(self, stages: list[Stage], feed: Callable | None = None):
+        """Run cutadapt stages and collect the read names of the last one.
+
+        Stages connected by pipes run concurrently; stages that write to a file are waited for before the next one
+        starts.
+
+        Args:
+            stages: Stages from ``build_stages``.
+            feed: Function writing the reads of the first stage to its stdin, run in a thread.
+        """
+        group, stdin, thread, errors = [], None, None, []
+
+        def feed_stage(pipe):
+            """Run ``feed`` and keep its error, the stages only see the end of their input."""
+            try:
+                feed(pipe)
+            except Exception as e:
+                errors.append(e)
+
+        for i, stage in enumerate(stages):
+            log = open(stage.log, 'wb')
+            streamed = stage.output is None
+            if i == 0 and feed is not None:
+                stdin = subprocess.PIPE
+            process = subprocess.Popen(stage.command, stdin=stdin, stdout=subprocess.PIPE if streamed else log,
+                                       stderr=log)
+            log.close()
+            if stdin not in (None, subprocess.PIPE):
+                # only the next stage holds the read end, so it sees EOF and upstream stages see broken pipes
+                stdin.close()
+            if i == 0 and feed is not None:
+                thread = threading.Thread(target=feed_stage, args=(process.stdin,), daemon=True)
+                thread.start()
+
+            bytes_read = file_size([stage.input]) if stage.input else 0
+            group.append((stage, process, bytes_read,
+                          start_stage(self.log_path, stage=stage.name, command=stage.command, run_id=self.run_id)))
+            stdin = process.stdout if streamed else None
+
+            if i == len(stages) - 1 and streamed:
+                self.run_collect(process.stdout)
+                process.stdout.close()
+            if not streamed or i == len(stages) - 1:
+                self.wait(group)
+                group = []
+
+        if thread is not None:
+            thread.join()
+        if errors:
+            raise RuntimeError('Feeding reads to the first stage failed') from errors[0]
+        if stages[-1].output is not None:
+            with gzip.open(stages[-1].output, 'rb') as reads:
+                self.run_collect(reads)
+
+    def run_collect(self, reads):
+        """Collect the read names of the final reads, logged as stage ``collect``.
+
+        Args:
+            reads: Binary FASTQ stream, FASTA for collapsed reads.
+        """
+        start_event = start_stage(self.log_path, stage='collect', command=['collect_headers'], run_id=self.run_id)
+        reads_path = self.work_dir / self.reads_path.name
+        num_reads = collect_headers(reads, reads_path, lines_per_record=2 if self.fmt == 'fasta' else 4)
+        # the collector runs in this process, its usage includes the runner itself
+        end_stage(self.log_path, start_event, status=0, usage=resource.getrusage(resource.RUSAGE_SELF),
+                  outputs=[reads_path])
+        logger.info(f'Collected {num_reads:,} reads in {reads_path}')
+
+    def wait(self, group: list[tuple]):
+        """Wait for concurrently running stages and check their exit codes.
+
+        Args:
+            group: Tuples of stage, process, bytes read and start event.
+        """
+        failed = []
+        for stage, process, bytes_read, start_event in group:
+            status, usage = wait_process(process)
+            code = end_stage(self.log_path, start_event, status=status, usage=usage, bytes_read=bytes_read,
+                             outputs=[stage.output] if stage.output else [], report_path=stage.report)
+            if code != 0:
+                failed.append(f'{stage.name} (exit code {code}, see {stage.log})')
+            else:
+                logger.info(f'Stage {stage.name} done')
+        if failed:
+            raise RuntimeError(f'Stages failed: {", ".join(failed)}')
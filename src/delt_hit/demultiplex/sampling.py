@@ -0,0 +1,250 @@
+import argparse
+import gzip
+import math
+import random
+import struct
+import sys
+import zlib
+from collections.abc import Iterator
+from itertools import islice
+from pathlib import Path
+
+BGZF_MAGIC = b'\x1f\x8b\x08\x04'
+# empty block marking the end of a BGZF file
+BGZF_EOF = bytes.fromhex('1f8b08040000000000ff0600424302001b0003000000000000000000')
+# maximum uncompressed size of a block, as used by bgzip
+BGZF_BLOCK_SIZE = 65280
+
+
+def read_records(f, num_reads: int | None = None) -> Iterator[tuple[bytes, ...]]:
+    """Group the lines of a FASTQ stream into records.
+
+    Args:
+        f: Binary FASTQ stream.
+        num_reads: Number of reads to read, all if None.
+
+    Returns:
+        Iterator over tuples of the four lines of each record.
+    """
+    lines = islice(f, 4 * num_reads) if num_reads is not None else iter(f)
+    return zip(lines, lines, lines, lines)
+
+
+def is_bgzf(path: Path) -> bool:
+    """Check whether a file is BGZF compressed (e.g. by ``bgzip``), which allows seeking to any block.
+
+    Args:
+        path: File path.
+
+    Returns:
+        True if the first block has the BGZF ``BC`` extra field.
+    """
+    with open(path, 'rb') as f:
+        header = f.read(18)
+    return len(header) == 18 and header[:4] == BGZF_MAGIC and header[12:14] == b'BC'
+
+
+def bgzf_blocks(path: Path) -> list[tuple[int, int]]:
+    """Offsets and sizes of the blocks of a BGZF file, read from the block headers without decompressing.
+
+    Args:
+        path: BGZF file.
+
+    Returns:
+        Tuples of offset and compressed size, without the empty end-of-file block.
+    """
+    blocks, offset = [], 0
+    with open(path, 'rb') as f:
+        while len(header := f.read(18)) == 18:
+            assert header[:4] == BGZF_MAGIC and header[12:14] == b'BC', f'{path} has a non-BGZF block at {offset}'
+            size = int.from_bytes(header[16:18], 'little') + 1
+            blocks.append((offset, size))
+            offset += size
+            f.seek(offset)
+    # the end-of-file marker is an empty block of 28 bytes
+    return [block for block in blocks if block[1] > 28]
+
+
+def bgzf_block(data: bytes) -> bytes:
+    """Compress data into one BGZF block, a gzip member with the block size in its ``BC`` extra field.
+
+    Args:
+        data: At most ``BGZF_BLOCK_SIZE`` bytes.
+
+    Returns:
+        The block.
+    """
+    assert len(data) <= BGZF_BLOCK_SIZE, f'BGZF blocks hold at most {BGZF_BLOCK_SIZE} bytes'
+    compressor = zlib.compressobj(6, zlib.DEFLATED, -15)
+    deflated = compressor.compress(data) + compressor.flush()
+    return (BGZF_MAGIC + b'\x00\x00\x00\x00\x00\xff\x06\x00BC\x02\x00' + struct.pack('<H', len(deflated) + 25)
+            + deflated + struct.pack('<II', zlib.crc32(data), len(data)))
+
+
+def first_record(lines: list[bytes]) -> int:
+    """Index of the line starting the first complete FASTQ record, for data split at an arbitrary position.
+
+    A record starts at a line beginning with ``@`` whose third line begins with ``+`` and whose sequence and quality
+    lines have the same length. Quality lines may start with ``@`` too, but then the line two below is a sequence.
+
+    Args:
+        lines: Lines of the data.
+
+    Returns:
+        Line index, ``len(lines)`` if no record starts in the data.
+    """
+    for k in range(len(lines) - 4):
+        if lines[k][:1] == b'@' and lines[k + 2][:1] == b'+' and len(lines[k + 1]) == len(lines[k + 3]):
+            return k
+    return len(lines)
+
+
+class ReadSampler:
+    """Draws a seeded random sample of the reads of a gzipped FASTQ file from the whole file.
+
+    ``size`` is a number of reads if at least 1 and a fraction of the reads otherwise. Plain gzip files are read in
+    full: a number of reads is drawn by reservoir sampling (Algorithm L), a fraction by keeping every read with that
+    probability. BGZF files are sampled block-wise instead: randomly chosen blocks are decompressed and all reads
+    starting in them are used, so only the sampled part of the file is read. Reads are returned in file order. The
+    compressed bytes read are counted in ``bytes_read``.
+    """
+
+    def __init__(self, size: float, seed: int = 0):
+        """Create a sampler.
+
+        Args:
+            size: Number of reads if at least 1, fraction of the reads otherwise.
+            seed: Random seed.
+        """
+        assert size > 0, 'Sample size must be positive'
+        self.size = size
+        self.seed = seed
+        self.num_in = self.num_out = 0
+        self.bytes_read = 0
+
+    def sample(self, path: Path) -> Iterator[tuple[bytes, ...]]:
+        """Sample the reads of a file, counted in ``num_in`` (reads read) and ``num_out``.
+
+        Args:
+            path: Gzipped FASTQ file.
+
+        Yields:
+            Tuples of the four lines of each sampled record.
+        """
+        rng = random.Random(self.seed)
+        if is_bgzf(path):
+            records = self.sample_blocks(path, rng)
+        elif self.size >= 1:
+            records = self.sample_reservoir(path, rng)
+        else:
+            records = self.sample_fraction(path, rng)
+        for record in records:
+            self.num_out += 1
+            yield record
+
+    def sample_reservoir(self, path: Path, rng: random.Random) -> Iterator[tuple[bytes, ...]]:
+        """Draw ``size`` reads with Algorithm L, which only draws random numbers for replaced reads."""
+        n = int(self.size)
+        reservoir = []
+        weight = math.exp(math.log(rng.random()) / n)
+        following = n + int(math.log(rng.random()) / math.log(1 - weight))
+        with gzip.open(path, 'rb') as f:
+            for i, record in enumerate(read_records(f)):
+                if i < n:
+                    reservoir.append((i, record))
+                elif i == following:
+                    reservoir[rng.randrange(n)] = (i, record)
+                    weight *= math.exp(math.log(rng.random()) / n)
+                    following += int(math.log(rng.random()) / math.log(1 - weight)) + 1
+                self.num_in += 1
+        self.bytes_read += path.stat().st_size
+        for _, record in sorted(reservoir, key=lambda item: item[0]):
+            yield record
+
+    def sample_fraction(self, path: Path, rng: random.Random) -> Iterator[tuple[bytes, ...]]:
+        """Keep every read with probability ``size``."""
+        with gzip.open(path, 'rb') as f:
+            for record in read_records(f):
+                self.num_in += 1
+                if rng.random() < self.size:
+                    yield record
+        self.bytes_read += path.stat().st_size
+
+    def sample_blocks(self, path: Path, rng: random.Random) -> Iterator[tuple[bytes, ...]]:
+        """Sample random BGZF blocks until enough reads are found."""
+        blocks = bgzf_blocks(path)
+        if self.size < 1:
+            chosen = [i for i in range(len(blocks)) if rng.random() < self.size]
+        else:
+            chosen = list(range(len(blocks)))
+            rng.shuffle(chosen)
+
+        sampled = []
+        with open(path, 'rb') as f:
+            for i in chosen:
+                records = self.block_records(f, blocks, i)
+                self.num_in += len(records)
+                self.bytes_read += sum(size for _, size in blocks[i:i + 2])
+                sampled += [(i, j, record) for j, record in enumerate(records)]
+                if self.size >= 1 and len(sampled) >= self.size:
+                    break
+        if self.size >= 1 and len(sampled) > self.size:
+            sampled = rng.sample(sampled, int(self.size))
+        for *_, record in sorted(sampled, key=lambda item: item[:2]):
+            yield record
+
+    @staticmethod
+    def block_records(f, blocks: list[tuple[int, int]], i: int) -> list[tuple[bytes, ...]]:
+        """Records starting in a BGZF block, completed from the following block.
+
+        Args:
+            f: The BGZF file opened in binary mode.
+            blocks: Blocks from ``bgzf_blocks``.
+            i: Index of the block.
+
+        Returns:
+            Tuples of the four lines of each record.
+        """
+        f.seek(blocks[i][0])
+        data = gzip.decompress(f.read(blocks[i][1]))
+        end = len(data)
+        if i + 1 < len(blocks):
+            data += gzip.decompress(f.read(blocks[i + 1][1]))
+
+        # the last element is the rest after the last newline
+        lines = data.split(b'\n')
+        k = first_record(lines)
+        offset = sum(len(line) + 1 for line in lines[:k])
+        records = []
+        while k + 4 < len(lines) and offset < end:
+            record = tuple(line + b'\n' for line in lines[k:k + 4])
+            records.append(record)
+            offset += sum(map(len, record))
+            k += 4
+        return records
+
+
+def main(args: list[str] | None = None) -> None:
+    """Write a random sample of the reads of a gzipped FASTQ file as gzipped FASTQ, used by the generated scripts.
+
+    Usage: ``python sampling.py INPUT OUTPUT --size N [--seed S]``
+
+    Args:
+        args: Command line arguments, defaults to ``sys.argv[1:]``.
+    """
+    parser = argparse.ArgumentParser(prog='sampling.py')
+    parser.add_argument('input', type=Path)
+    parser.add_argument('output', type=Path)
+    parser.add_argument('--size', type=float, required=True)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args(args)
+
+    sampler = ReadSampler(args.size, seed=args.seed)
+    with gzip.open(args.output, 'wb', compresslevel=6) as f:
+        for record in sampler.sample(args.input):
+            f.writelines(record)
+    print(f'Sampled {sampler.num_out:,} of {sampler.num_in:,} reads read from {args.input}', file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
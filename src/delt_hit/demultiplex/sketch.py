@@ -0,0 +1,140 @@
+import numpy as np
+
+from delt_hit.demultiplex.umi import hash64
+
+
+class CountMinSketch:
+    """Count-min sketch of ``depth`` rows of ``width`` counters.
+
+    Estimates never undercount; with ``N`` counted items an estimate exceeds the true count by more than
+    ``e / width * N`` with probability at most ``exp(-depth)``.
+    """
+
+    def __init__(self, width: int = 2 ** 18, depth: int = 4, seed: int = 0):
+        """Create an empty sketch.
+
+        Args:
+            width: Counters per row.
+            depth: Number of rows, each with its own hash function.
+            seed: Seed of the hash functions.
+        """
+        self.width = width
+        self.table = np.zeros((depth, width), dtype=np.int64)
+        self.seeds = hash64(np.arange(depth, dtype=np.uint64) + np.uint64(seed))
+
+    def columns(self, hashes: np.ndarray) -> np.ndarray:
+        """Counter of every row for each hashed key.
+
+        Args:
+            hashes: uint64 key hashes.
+
+        Returns:
+            Array of shape ``(depth, len(hashes))``.
+        """
+        return (hash64(hashes[None, :] ^ self.seeds[:, None]) % np.uint64(self.width)).astype(np.intp)
+
+    def add(self, hashes: np.ndarray, counts: np.ndarray) -> None:
+        """Add counts of keys.
+
+        Args:
+            hashes: uint64 key hashes.
+            counts: Counts to add.
+        """
+        for row, columns in zip(self.table, self.columns(hashes)):
+            np.add.at(row, columns, counts)
+
+    def query(self, hashes: np.ndarray) -> np.ndarray:
+        """Estimated counts of keys.
+
+        Args:
+            hashes: uint64 key hashes.
+
+        Returns:
+            int64 estimates.
+        """
+        columns = self.columns(hashes)
+        return self.table[np.arange(len(self.table))[:, None], columns].min(axis=0)
+
+
+class TopKCounter:
+    """Approximate counts of the ``k`` most frequent barcodes of every selection in fixed memory.
+
+    All selections share one ``CountMinSketch`` keyed on the hash of ``(selection_ids, barcodes)``, so its memory
+    does not grow with the number of selection ID combinations; each selection keeps up to ``k`` candidate barcodes
+    with their estimated counts. Reads are buffered and added in batches; after each batch the barcodes of the batch
+    compete with the candidates of their selection for the ``k`` places by their estimates. The final counts are
+    re-estimated from the sketch.
+    """
+
+    def __init__(self, k: int = 10000, width: int = 2 ** 20, depth: int = 4, batch_size: int = 100_000):
+        """Create an empty counter.
+
+        Args:
+            k: Number of barcodes kept per selection.
+            width: Counters per sketch row.
+            depth: Rows of the sketch.
+            batch_size: Reads buffered before they are added.
+        """
+        self.k = k
+        self.batch_size = batch_size
+        self.sketch = CountMinSketch(width, depth)
+        self.candidates = {}
+        self.keys = []
+        self.weights = []
+
+    @property
+    def nbytes(self) -> int:
+        """Memory of the sketch in bytes."""
+        return self.sketch.table.nbytes
+
+    def add(self, selection_ids: tuple, barcodes: tuple, count: int = 1):
+        """Count one read.
+
+        Args:
+            selection_ids: Selection IDs of the read.
+            barcodes: Barcodes of the read.
+            count: Multiplicity of the read.
+        """
+        self.keys.append((selection_ids, barcodes))
+        self.weights.append(count)
+        if len(self.keys) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        """Add the buffered reads to the sketch and update the candidates of their selections."""
+        keys, counts = self.keys, self.weights
+        self.keys, self.weights = [], []
+        if not keys:
+            return
+
+        # tuples of ints hash deterministically
+        hashes = np.array([hash(key) for key in keys], dtype=np.int64).view(np.uint64)
+        hashes, first, inverse = np.unique(hashes, return_index=True, return_inverse=True)
+        self.sketch.add(hashes, np.bincount(inverse, weights=counts).astype(np.int64))
+
+        updated = set()
+        for i, estimate in zip(first.tolist(), self.sketch.query(hashes).tolist()):
+            selection_ids, barcodes = keys[i]
+            self.candidates.setdefault(selection_ids, {})[barcodes] = estimate
+            updated.add(selection_ids)
+
+        for selection_ids in updated:
+            candidates = self.candidates[selection_ids]
+            if len(candidates) > self.k:
+                barcodes, estimates = list(candidates), np.fromiter(candidates.values(), dtype=np.int64)
+                top = np.argpartition(estimates, -self.k)[-self.k:]
+                self.candidates[selection_ids] = {barcodes[i]: int(estimates[i]) for i in top}
+
+    def counts(self) -> dict:
+        """Estimated counts of the top barcodes.
+
+        Returns:
+            A nested dict of selection IDs to barcode counts, as ``get_counts`` returns.
+        """
+        self.flush()
+        counts = {}
+        for selection_ids, candidates in self.candidates.items():
+            barcodes = list(candidates)
+            hashes = np.array([hash((selection_ids, key)) for key in barcodes], dtype=np.int64).view(np.uint64)
+            counts[selection_ids] = dict(zip(barcodes, self.sketch.query(hashes).tolist()))
+        return counts
@@ -0,0 +1,258 @@
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+TELEMETRY_FILE = 'telemetry.jsonl'
+
+
+def append_event(log_path: Path, event: dict) -> None:
+    """Append one JSON line to a telemetry log.
+
+    Args:
+        log_path: Path to the JSONL log.
+        event: Event record.
+    """
+    log_path.parent.mkdir(parents=True, exist_ok=True)
+    with open(log_path, 'a') as f:
+        f.write(json.dumps(event) + '\n')
+
+
+def file_size(paths: list[Path]) -> int:
+    """Total size of the existing files among ``paths``.
+
+    Args:
+        paths: File paths.
+
+    Returns:
+        Size in bytes.
+    """
+    return sum(path.stat().st_size for path in paths if path.exists())
+
+
+def read_counts(report_path: Path | None) -> dict:
+    """Reads in and out of a stage from its cutadapt JSON report.
+
+    Args:
+        report_path: Path to a ``*.cutadapt.json`` report.
+
+    Returns:
+        Dict with ``reads_in`` and ``reads_out``, None where unknown.
+    """
+    if report_path is None or not report_path.exists():
+        return {'reads_in': None, 'reads_out': None}
+    counts = json.loads(report_path.read_text())['read_counts']
+    return {'reads_in': counts['input'], 'reads_out': counts['output']}
+
+
+def start_stage(log_path: Path, *, stage: str, command: list[str], run_id: str | None = None) -> dict:
+    """Write the ``start`` event of a stage.
+
+    Args:
+        log_path: Telemetry JSONL log.
+        stage: Stage name, e.g. the region ID.
+        command: Command of the stage.
+        run_id: Identifier grouping the stages of one pipeline run, taken from ``DELT_HIT_RUN_ID`` or the current
+            time if None.
+
+    Returns:
+        The start event, to be passed to ``end_stage``.
+    """
+    run_id = run_id or os.environ.get('DELT_HIT_RUN_ID') or time.strftime('%Y%m%dT%H%M%S')
+    event = {'run': run_id, 'stage': stage, 'pid': os.getpid(), 'event': 'start', 'time': time.time(),
+             'command': ' '.join(map(str, command))}
+    append_event(log_path, event)
+    return event
+
+
+def end_stage(log_path: Path, start: dict, *, status: int, usage, bytes_read: int = 0, outputs: list[Path] = (),
+              report_path: Path | None = None, counts: dict | None = None) -> int:
+    """Write the ``end`` event of a stage.
+
+    Args:
+        log_path: Telemetry JSONL log.
+        start: Event returned by ``start_stage``.
+        status: Wait status of the stage's process.
+        usage: Resource usage of the stage's process as returned by ``os.wait4``.
+        bytes_read: Size of the files read by the stage.
+        outputs: Files written by the stage.
+        report_path: Cutadapt JSON report written by the stage.
+        counts: Reads in and out (``reads_in``, ``reads_out``) of stages without a report.
+
+    Returns:
+        Exit code of the stage's process.
+    """
+    end = time.time()
+    wall = end - start['time']
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    peak_rss = usage.ru_maxrss * (1 if sys.platform == 'darwin' else 1024)
+    counts = counts or read_counts(report_path)
+    returncode = os.waitstatus_to_exitcode(status)
+    append_event(log_path, {
+        'run': start['run'], 'stage': start['stage'], 'pid': start['pid'], 'event': 'end', 'time': end,
+        'returncode': returncode, 'wall_seconds': wall, 'cpu_seconds': usage.ru_utime + usage.ru_stime,
+        'peak_rss_bytes': peak_rss, 'bytes_read': bytes_read, 'bytes_written': file_size(outputs), **counts,
+        'reads_per_second': counts['reads_in'] / wall if counts['reads_in'] is not None and wall > 0 else None,
+    })
+    return returncode
+
+
+def wait_process(process: subprocess.Popen) -> tuple[int, object]:
+    """Wait for a child process with ``wait4``, also when interrupted.
+
+    Args:
+        process: The child process, its ``returncode`` is set.
+
+    Returns:
+        Tuple of wait status and resource usage.
+    """
+    while True:
+        try:
+            _, status, usage = os.wait4(process.pid, 0)
+            process.returncode = os.waitstatus_to_exitcode(status)
+            return status, usage
+        except KeyboardInterrupt:
+            # the child received the signal as well, wait for it to exit
+            continue
+
+
+def run_stage(command: list[str], *, log_path: Path, stage: str, run_id: str | None = None,
+              inputs: list[Path] = (), outputs: list[Path] = (), report_path: Path | None = None) -> int:
+    """Run a pipeline stage as a child process and log its resource usage.
+
+    A ``start`` event is written before and an ``end`` event after the command. The end event has the wall time,
+    CPU seconds and peak RSS of the command (from ``wait4``, including its own children), input and output sizes
+    and, if a cutadapt report is given, reads in, reads out and reads per second. On Linux the peak RSS also covers
+    the forked copy of this process before ``exec``, so it is never below the footprint of the wrapper.
+
+    Args:
+        command: Command and arguments. The child inherits stdout and stderr.
+        log_path: Telemetry JSONL log.
+        stage: Stage name, e.g. the region ID.
+        run_id: Identifier grouping the stages of one pipeline run.
+        inputs: Files read by the stage.
+        outputs: Files written by the stage.
+        report_path: Cutadapt JSON report written by the stage.
+
+    Returns:
+        Exit code of the command.
+    """
+    bytes_read = file_size(inputs)
+    start = start_stage(log_path, stage=stage, command=command, run_id=run_id)
+    status, usage = wait_process(subprocess.Popen(command))
+    return end_stage(log_path, start, status=status, usage=usage, bytes_read=bytes_read, outputs=outputs,
+                     report_path=report_path)
+
+
+def read_events(log_path: Path) -> list[dict]:
+    """Read a telemetry log, skipping a partially written last line.
+
+    Args:
+        log_path: Telemetry JSONL log.
+
+    Returns:
+        Event records in order.
+    """
+    events = []
+    for line in log_path.read_text().splitlines():
+        try:
+            events.append(json.loads(line))
+        except json.JSONDecodeError:
+            continue
+    return events
+
+
+def summarize(log_path: Path, run_id: str | None = None) -> list[dict]:
+    """Summarize the stages of one pipeline run.
+
+    Args:
+        log_path: Telemetry JSONL log.
+        run_id: Run to summarize, the latest one if None.
+
+    Returns:
+        One record per stage in start order with a ``status`` of ``running``, ``done`` or ``failed``. Running stages
+        have their elapsed time as ``wall_seconds``.
+    """
+    events = read_events(log_path) if log_path.exists() else []
+    run_id = run_id or (events[-1]['run'] if events else None)
+
+    stages = {}
+    for event in filter(lambda e: e['run'] == run_id, events):
+        key = (event['stage'], event['pid'])
+        match event['event']:
+            case 'start':
+                stages[key] = {'run': run_id, 'stage': event['stage'], 'status': 'running', 'start': event['time'],
+                               'wall_seconds': time.time() - event['time']}
+            case 'end' if key in stages:
+                stages[key].update({k: v for k, v in event.items() if k not in ('run', 'stage', 'pid', 'event')})
+                stages[key]['status'] = 'done' if event['returncode'] == 0 else 'failed'
+    return list(stages.values())
+
+
+def status_table(stages: list[dict]):
+    """Render a stage summary as a Rich table, highlighting the slowest stage.
+
+    Args:
+        stages: Records from ``summarize``.
+
+    Returns:
+        A Rich table.
+    """
+    from rich.table import Table
+
+    def fmt(value, spec: str = ',.0f') -> str:
+        """Format a number or return an empty string for missing values."""
+        return '' if value is None else format(value, spec)
+
+    slowest = max(stages, key=lambda s: s['wall_seconds'], default=None)
+    run_id = stages[0]['run'] if stages else None
+    table = Table(title=f'Demultiplex run {run_id}')
+    for column in ['Stage', 'Status', 'Started', 'Wall s', 'CPU s', 'Reads in', 'Reads out', 'Reads/s',
+                   'MB read', 'MB written', 'Peak RSS MB']:
+        table.add_column(column, justify='left' if column in ('Stage', 'Status', 'Started') else 'right')
+
+    for s in stages:
+        style = {'running': 'yellow', 'failed': 'red'}.get(s['status'])
+        mb = {key: None if s.get(key) is None else s[key] / 2 ** 20
+              for key in ('bytes_read', 'bytes_written', 'peak_rss_bytes')}
+        table.add_row(
+            f"[bold]{s['stage']}[/bold]" if s is slowest else s['stage'],
+            f'[{style}]{s["status"]}[/{style}]' if style else s['status'],
+            time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(s['start'])),
+            fmt(s['wall_seconds'], ',.1f'), fmt(s.get('cpu_seconds'), ',.1f'),
+            fmt(s.get('reads_in')), fmt(s.get('reads_out')), fmt(s.get('reads_per_second')),
+            fmt(mb['bytes_read'], ',.1f'), fmt(mb['bytes_written'], ',.1f'), fmt(mb['peak_rss_bytes'], ',.1f'),
+        )
+    return table
+
+
+def main(args: list[str] | None = None) -> None:
+    """Run one stage under telemetry, used by the generated demultiplex scripts.
+
+    Usage: ``python telemetry.py --log LOG --stage NAME [--input F] [--output F]
+    [--report F] -- COMMAND ...``
+
+    Args:
+        args: Command line arguments, defaults to ``sys.argv[1:]``.
+    """
+    parser = argparse.ArgumentParser(prog='telemetry.py')
+    parser.add_argument('--log', type=Path, required=True)
+    parser.add_argument('--stage', required=True)
+    parser.add_argument('--run_id')
+    parser.add_argument('--input', type=Path, action='append', default=[])
+    parser.add_argument('--output', type=Path, action='append', default=[])
+    parser.add_argument('--report', type=Path)
+    parser.add_argument('command', nargs=argparse.REMAINDER)
+    args = parser.parse_args(args)
+
+    command = args.command[1:] if args.command[:1] == ['--'] else args.command
+    assert command, 'No command given'
+    sys.exit(run_stage(command, log_path=args.log, stage=args.stage, run_id=args.run_id, inputs=args.input,
+                       outputs=args.output, report_path=args.report))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,210 @@
+from collections import defaultdict
+
+import numpy as np
+
+# UMIs are read as base-4 numbers, other characters (e.g. N) make a UMI invalid
+UMI_DIGITS = str.maketrans('ACGT', '0123')
+MAX_UMI_LENGTH = 32
+
+
+def hash64(values: np.ndarray) -> np.ndarray:
+    """Mix 64-bit values with the SplitMix64 finalizer.
+
+    Args:
+        values: uint64 array.
+
+    Returns:
+        Hashed uint64 array.
+    """
+    z = values + np.uint64(0x9E3779B97F4A7C15)
+    z = (z ^ (z >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+    z = (z ^ (z >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+    return z ^ (z >> np.uint64(31))
+
+
+def bit_length(values: np.ndarray) -> np.ndarray:
+    """Number of bits needed to represent each value, exact for all uint64 values.
+
+    Args:
+        values: uint64 array.
+
+    Returns:
+        int64 array, 0 for zeros.
+    """
+    values = values.copy()
+    lengths = np.zeros(len(values), dtype=np.int64)
+    for shift in (32, 16, 8, 4, 2, 1):
+        high = values >= np.uint64(1 << shift)
+        values[high] >>= np.uint64(shift)
+        lengths[high] += shift
+    return lengths + (values > 0)
+
+
+def hll_add(registers: np.ndarray, values: np.ndarray) -> None:
+    """Add values to a HyperLogLog sketch.
+
+    Args:
+        registers: uint8 registers, their number ``2 ** p`` sets the precision.
+        values: uint64 values to add.
+    """
+    p = int(len(registers)).bit_length() - 1
+    h = hash64(values)
+    index = (h >> np.uint64(64 - p)).astype(np.intp)
+    rank = (64 - p) - bit_length(h & np.uint64((1 << (64 - p)) - 1)) + 1
+    np.maximum.at(registers, index, rank.astype(np.uint8))
+
+
+def hll_estimate(registers: np.ndarray) -> int:
+    """Estimate the number of distinct values of a HyperLogLog sketch.
+
+    Args:
+        registers: uint8 registers.
+
+    Returns:
+        Estimated cardinality, with linear counting for small cardinalities.
+    """
+    m = len(registers)
+    estimate = 0.7213 / (1 + 1.079 / m) * m * m / np.sum(np.ldexp(1.0, -registers.astype(np.int64)))
+    zeros = int(np.count_nonzero(registers == 0))
+    if estimate <= 2.5 * m and zeros:
+        estimate = m * np.log(m / zeros)
+    return int(round(estimate))
+
+
+def count_clusters(values: np.ndarray, length: int) -> int:
+    """Count groups of UMIs connected by single substitutions.
+
+    UMIs one substitution apart are assumed to stem from the same molecule, every connected group counts as one.
+
+    Args:
+        values: Sorted unique UMIs encoded by ``UmiCounter``.
+        length: UMI length.
+
+    Returns:
+        Number of groups.
+    """
+    if len(values) < 2:
+        return len(values)
+
+    sources, targets = [], []
+    for position in range(length):
+        for delta in (1, 2, 3):
+            # xor with 1, 2 or 3 at a position changes its base to each of the other three
+            neighbours = values ^ np.uint64(delta << (2 * position))
+            index = np.minimum(np.searchsorted(values, neighbours), len(values) - 1)
+            found = np.flatnonzero(values[index] == neighbours)
+            sources.append(found)
+            targets.append(index[found])
+    sources, targets = np.concatenate(sources), np.concatenate(targets)
+
+    labels = np.arange(len(values))
+    while True:
+        updated = labels.copy()
+        np.minimum.at(updated, sources, labels[targets])
+        updated = updated[updated]
+        if np.array_equal(updated, labels):
+            return len(np.unique(labels))
+        labels = updated
+
+
+class UmiCounter:
+    """Counts distinct UMIs per key with bounded memory.
+
+    UMIs of a key are buffered and merged into a sorted array of distinct UMIs. Once the array holds more than
+    ``threshold`` UMIs it is replaced by a HyperLogLog sketch of ``2 ** precision`` one-byte registers, so the memory
+    of a key never exceeds the sketch size no matter how many reads it has. The default threshold makes the largest
+    array as large as a sketch. Counts of keys below the threshold are exact.
+    """
+
+    def __init__(self, length: int, precision: int = 12, threshold: int | None = None, batch_size: int = 64,
+                 collapse_errors: bool = False):
+        """Create an empty counter.
+
+        Args:
+            length: UMI length.
+            precision: Sketch precision ``p``, the relative error of estimates is about ``1.04 / sqrt(2 ** p)``.
+            threshold: Number of distinct UMIs above which a key switches to a sketch, ``2 ** precision / 8`` if
+                None.
+            batch_size: Number of UMIs buffered per key before they are merged.
+            collapse_errors: Whether UMIs one substitution apart count as one molecule. Only applies to keys below
+                the threshold.
+        """
+        assert 0 < length <= MAX_UMI_LENGTH, f'UMIs must have 1 to {MAX_UMI_LENGTH} bases, got {length}'
+        assert 4 <= precision <= 18, 'Sketch precision must be between 4 and 18'
+        self.length = length
+        self.num_registers = 2 ** precision
+        self.threshold = self.num_registers // 8 if threshold is None else threshold
+        self.batch_size = batch_size
+        self.collapse_errors = collapse_errors
+        self.pending = defaultdict(list)
+        self.exact = {}
+        self.sketches = {}
+        self.num_invalid = 0
+
+    def add(self, key, umi: str | None):
+        """Record the UMI of one read.
+
+        Args:
+            key: Key to count the UMI for, e.g. selection and barcode IDs.
+            umi: UMI sequence. UMIs of another length or with other bases than ACGT are only counted in
+                ``num_invalid``.
+        """
+        if umi is None or len(umi) != self.length:
+            self.num_invalid += 1
+            return
+        try:
+            value = int(umi.translate(UMI_DIGITS), 4)
+        except ValueError:
+            self.num_invalid += 1
+            return
+        pending = self.pending[key]
+        pending.append(value)
+        if len(pending) >= self.batch_size:
+            self.flush(key)
+
+    def flush(self, key):
+        """Merge the buffered UMIs of a key.
+
+        Args:
+            key: The key.
+        """
+        values = np.array(self.pending.pop(key, []), dtype=np.uint64)
+        if key in self.sketches:
+            hll_add(self.sketches[key], values)
+            return
+        values = np.union1d(self.exact.pop(key, values[:0]), values)
+        if len(values) > self.threshold:
+            self.sketches[key] = np.zeros(self.num_registers, dtype=np.uint8)
+            hll_add(self.sketches[key], values)
+        else:
+            self.exact[key] = values
+
+    def molecules(self, key) -> int:
+        """Number of distinct molecules of a key.
+
+        Args:
+            key: The key.
+
+        Returns:
+            Exact or error-collapsed count below the threshold, a HyperLogLog estimate above.
+        """
+        self.flush(key)
+        if key in self.sketches:
+            return hll_estimate(self.sketches[key])
+        values = self.exact.get(key)
+        if values is None:
+            return 0
+        return count_clusters(values, self.length) if self.collapse_errors else len(values)
+
+    def counts(self) -> dict:
+        """Molecule counts of all keys of the form ``(selection_ids, barcodes)``.
+
+        Returns:
+            A nested dict of selection IDs to barcode molecule counts, as ``get_counts`` returns for reads.
+        """
+        counts = defaultdict(dict)
+        for key in [*self.pending, *self.exact, *self.sketches]:
+            selection_ids, barcodes = key
+            if barcodes not in counts[selection_ids]:
+                counts[selection_ids][barcodes] = self.molecules(key)
+        return counts
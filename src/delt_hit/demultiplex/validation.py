@@ -12,3 +12,8 @@ class Region(BaseModel):
     def id(self):
         """Return a stable region identifier."""
         return f'{self.index}-{self.name}'
+
+    @property
+    def is_umi(self) -> bool:
+        """Whether the region is a UMI, cut from the read instead of matched against codons."""
+        return self.name.startswith('U')
@@ -0,0 +1 @@
+from .lookup import CodeLookup, library_to_counts_codes
@@ -0,0 +1,171 @@
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+from loguru import logger
+
+
+def get_code_cols(df: pd.DataFrame) -> list[str]:
+    """List ``code_*`` columns ordered by their numeric suffix.
+
+    Args:
+        df: DataFrame with code columns.
+
+    Returns:
+        Code column names sorted by position.
+    """
+    cols = [col for col in df.columns if col.startswith('code_')]
+    return sorted(cols, key=lambda x: int(x.split('_')[-1]))
+
+
+def library_to_counts_codes(df: pd.DataFrame) -> pd.DataFrame:
+    """Convert library code columns to the convention used by count tables.
+
+    ``Library.enumerate`` writes 0-based ``code_0..code_{n-1}`` columns holding the whitelist index of each
+    building block, while ``save_counts`` writes 1-based ``code_1..code_n`` columns holding ``index + 1``.
+
+    Args:
+        df: Library DataFrame with 0-based code columns.
+
+    Returns:
+        DataFrame with code columns renamed and shifted to the count table convention.
+    """
+    code_cols = get_code_cols(df)
+    if code_cols and code_cols[0] != 'code_0':
+        # already in count table convention
+        return df
+    df = df.rename(columns={col: f'code_{i + 1}' for i, col in enumerate(code_cols)})
+    for i in range(1, len(code_cols) + 1):
+        df[f'code_{i}'] = df[f'code_{i}'] + 1
+    return df
+
+
+class CodeLookup:
+    """Map count table code tuples to library rows via a mixed-radix integer index.
+
+    Each code tuple ``(c_1, ..., c_n)`` is encoded as a single integer key ``sum(c_i * stride_i)``. If the key space
+    is small enough, a dense array maps keys directly to row positions (O(1) per lookup); otherwise the sorted keys
+    are searched with ``np.searchsorted``.
+    """
+
+    def __init__(self, table: pd.DataFrame, radices: list[int] | None = None, max_dense_size: int = 2 ** 26):
+        """Build the index over a library table.
+
+        Args:
+            table: Library table in count table convention (``code_1..code_n``).
+            radices: Optional number of codes per position. Defaults to ``max(code) + 1`` per column.
+            max_dense_size: Maximum key space for which a dense position array is allocated.
+        """
+        self.code_cols = get_code_cols(table)
+        assert self.code_cols, 'Library table must contain `code_*` columns'
+
+        codes = table[self.code_cols].to_numpy(dtype=np.int64)
+        assert (codes >= 0).all(), 'Codes must be non-negative'
+
+        if radices is None:
+            radices = (codes.max(axis=0) + 1).tolist() if len(codes) else [1] * len(self.code_cols)
+        assert len(radices) == len(self.code_cols), 'Number of radices must match the number of code columns'
+        assert (codes < np.asarray(radices)).all(), 'Codes must be smaller than their radix'
+
+        self.radices = np.asarray(radices, dtype=np.int64)
+        self.strides = np.ones(len(self.radices), dtype=np.int64)
+        self.strides[:-1] = np.cumprod(self.radices[::-1])[::-1][1:]
+        self.size = int(np.prod(self.radices))
+        self.table = table.reset_index(drop=True)
+
+        keys = codes @ self.strides
+        if self.size <= max_dense_size:
+            self.positions = np.full(self.size, -1, dtype=np.int64)
+            self.positions[keys] = np.arange(len(keys))
+            self.keys = self.order = None
+        else:
+            self.positions = None
+            self.order = np.argsort(keys, kind='stable')
+            self.keys = keys[self.order]
+
+        logger.debug(f'Built {"dense" if self.positions is not None else "sorted"} code index '
+                     f'over {len(self.table)} compounds with radices {self.radices.tolist()}')
+
+    def encode(self, codes: np.ndarray) -> np.ndarray:
+        """Encode code tuples into mixed-radix integer keys.
+
+        Args:
+            codes: Integer array of shape ``(n, num_codes)``.
+
+        Returns:
+            Integer keys, ``-1`` for tuples outside the index bounds.
+        """
+        codes = np.asarray(codes, dtype=np.int64)
+        valid = ((codes >= 0) & (codes < self.radices)).all(axis=1)
+        keys = codes @ self.strides
+        keys[~valid] = -1
+        return keys
+
+    def positions_of(self, codes: np.ndarray) -> np.ndarray:
+        """Look up library row positions for code tuples.
+
+        Args:
+            codes: Integer array of shape ``(n, num_codes)``.
+
+        Returns:
+            Row positions into ``table``, ``-1`` for tuples not in the library.
+        """
+        keys = self.encode(codes)
+        valid = keys >= 0
+        pos = np.full(len(keys), -1, dtype=np.int64)
+
+        if self.positions is not None:
+            pos[valid] = self.positions[keys[valid]]
+        else:
+            idx = np.searchsorted(self.keys, keys[valid])
+            idx = np.minimum(idx, len(self.keys) - 1)
+            found = self.keys[idx] == keys[valid]
+            pos[np.flatnonzero(valid)[found]] = self.order[idx[found]]
+        return pos
+
+    def annotate(self, df: pd.DataFrame, columns: list[str] | None = None) -> pd.DataFrame:
+        """Annotate a counts or hits table with library structures and properties.
+
+        Args:
+            df: Table with ``code_1..code_n`` columns, e.g. a ``counts.txt`` or enrichment result.
+            columns: Library columns to attach. Defaults to all non-code columns.
+
+        Returns:
+            A copy of ``df`` with the library columns appended; missing compounds are NaN.
+        """
+        missing = set(self.code_cols) - set(df.columns)
+        assert not missing, f'Table is missing code columns {sorted(missing)}'
+
+        columns = columns or [col for col in self.table.columns if col not in self.code_cols]
+        pos = self.positions_of(df[self.code_cols].to_numpy())
+        found = pos >= 0
+
+        out = df.copy()
+        for col in columns:
+            # NOTE: positions of -1 are filled with NaN (upcasting integer columns)
+            out[col] = pd.api.extensions.take(self.table[col].to_numpy(), pos, allow_fill=True)
+
+        if not found.all():
+            logger.warning(f'{(~found).sum()} of {len(found)} code tuples not found in library')
+        return out
+
+    @classmethod
+    def from_files(cls, library_path: Path, properties_path: Path | None = None, **kwargs) -> 'CodeLookup':
+        """Build a lookup from ``library.parquet`` and optionally ``properties.parquet``.
+
+        Args:
+            library_path: Path to the enumerated library parquet file.
+            properties_path: Optional path to the properties parquet file.
+            **kwargs: Forwarded to the constructor.
+
+        Returns:
+            A ``CodeLookup`` over the library in count table convention.
+        """
+        if properties_path is not None and Path(properties_path).exists():
+            # NOTE: properties.parquet already contains the library columns
+            table = pd.read_parquet(properties_path)
+        else:
+            table = pd.read_parquet(library_path)
+        table = library_to_counts_codes(table)
+        return cls(table, **kwargs)
+
@@ -1,11 +1,12 @@
-from functools import reduce
-from itertools import combinations, pairwise, product
+from collections import Counter
+from itertools import pairwise
 from pathlib import Path
 
-from Levenshtein import distance
 from matplotlib import pyplot as plt
 import numpy as np
 
+from delt_hit.demultiplex.distance import distance_histogram
+
 
 def read_txt(
         path: Path,
@@ -25,28 +26,38 @@ def read_txt(
 def plot_edit_distances(
         codons: dict,
         output_dir: Path,
+        metric: str = 'auto',
+        processes: int | None = None,
 ) -> None:
     """Plot intra- and inter-set edit distance histograms.
 
+    Distances are accumulated into histograms block by block (see ``delt_hit.demultiplex.distance``), so large codon
+    sets do not materialize all pairwise distances.
+
     Args:
         codons: Mapping of region names to codon lists.
         output_dir: Directory to save plots into.
+        metric: ``'auto'`` (Hamming for equal-length codons, Levenshtein for mixed lengths), ``'hamming'`` or
+            ``'levenshtein'``.
+        processes: Number of worker processes for Levenshtein distances.
     """
     keys = set(filter(lambda x: 'C' not in x, set(codons.keys())))
     for key in keys:
         other = keys - {key}
-        codons_key = codons[key]
+        codons_key = [i.strip() for i in codons[key] if i.strip()]
         codons_other = []
         
         for i in other:
-            codons_other.extend(codons[i])
+            codons_other.extend(i.strip() for i in codons[i] if i.strip())
 
-        d = [distance(*i) for i in combinations(codons_key, 2)]
-        d_other = [distance(*i) for i in product(codons_key, codons_other)]
+        hist = distance_histogram(codons_key, metric=metric, processes=processes)
+        hist_other = distance_histogram(codons_key, codons_other, metric=metric, processes=processes) \
+            if codons_other else np.zeros(1, dtype=np.int64)
 
         fig, axs = plt.subplots(1, 2, figsize=(10, 5))
 
-        labels, counts = np.unique(d, return_counts=True)
+        labels = np.flatnonzero(hist)
+        counts = hist[labels]
         bars = axs[0].bar(labels, counts, align='center')
         axs[0].set_title('Intra codon set edit distance')
 
@@ -55,7 +66,8 @@ def plot_edit_distances(
             axs[0].text(bar.get_x() + bar.get_width() / 2, bar.get_height(), str(count),
                         ha='center', va='bottom', color='black')
 
-        labels, counts = np.unique(d_other, return_counts=True)
+        labels = np.flatnonzero(hist_other)
+        counts = hist_other[labels]
         bars = axs[1].bar(labels, counts, align='center')
         axs[1].set_title('Inter codon set edit distance')
         
@@ -71,28 +83,14 @@ def plot_edit_distances(
         fig.savefig(output_file)
 
 
-def compute_stats(item, a, b):
-    """Update overlap stats for one comparison.
-
-    Args:
-        item: Mutable stats dictionary.
-        a: First base.
-        b: Second base.
-
-    Returns:
-        The updated stats dictionary.
-    """
-    item['number_of_comparisons'] += 1
-    item['number_of_matches'] += a == b
-    item['proportion_of_matches'] = item['number_of_matches'] / item['number_of_comparisons']
-    return item
-
-
 def compute_overlap(
         codons: dict,
 ) -> dict:
     """Compute overlap statistics between successive codon sets.
 
+    All pairs of a last base of ``a`` and a first base of ``b`` are compared. The number of matching pairs is
+    computed from the base frequencies of both sets, i.e. in linear time.
+
     Args:
         codons: Mapping of region names to codon lists.
 
@@ -101,11 +99,12 @@ def compute_overlap(
     """
     overlap = {}
     for a, b in pairwise(codons.keys()):
-        last_base = [i.strip()[-1] for i in codons[a]]
-        first_base = [i.strip()[0] for i in codons[b]]
-        item = {'number_of_comparisons': 0, 'number_of_matches': 0, 'proportion_of_matches': 0}
-        res = reduce(lambda x, y: compute_stats(x, a=y[0], b=y[1]), product(last_base, first_base), item)
-        overlap[(a, b)] = res
+        last_base = Counter(i.strip()[-1] for i in codons[a])
+        first_base = Counter(i.strip()[0] for i in codons[b])
+        comparisons = last_base.total() * first_base.total()
+        matches = sum(count * first_base[base] for base, count in last_base.items())
+        overlap[(a, b)] = {'number_of_comparisons': comparisons, 'number_of_matches': matches,
+                           'proportion_of_matches': matches / comparisons if comparisons else 0}
     return overlap
 
 
@@ -1,82 +1,179 @@
 import json
+import multiprocessing
 from pathlib import Path
 
 from matplotlib import pyplot as plt
+import numpy as np
 import pandas as pd
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
 
-def get_stats(experiment_path: Path) -> list:
-    """Extract adapter trimming stats from a cutadapt report.
+
+def load_json(path: Path) -> dict:
+    """Load a JSON file, with ``orjson`` if it is installed.
+
+    Args:
+        path: Path to the JSON file.
+
+    Returns:
+        The parsed document.
+    """
+    if orjson is not None:
+        return orjson.loads(path.read_bytes())
+    with open(path) as f:
+        return json.load(f)
+
+
+def read_report(report_path: Path) -> dict | None:
+    """Aggregate the adapter trimming stats of a cutadapt report into an error count matrix.
+
+    Args:
+        report_path: Path to a ``*.cutadapt.json`` report.
+
+    Returns:
+        Dict with ``region_id``, ``reads_in``, ``reads_out`` and ``errors``, an int64 array of shape
+        ``(codons, max_errors + 1)`` indexed by adapter index and number of errors. None if no adapter matched.
+    """
+    report = load_json(report_path)
+    hits = []
+    for stat in report['adapters_read1']:
+        trimmed_lengths = stat['five_prime_end']['trimmed_lengths']
+        if trimmed_lengths:
+            region_id, index = '_'.join(stat['name'].split('.')[:-1]), int(stat['name'].split('.')[-1])
+            hits += [(region_id, index, item['counts']) for item in trimmed_lengths]
+    if not hits:
+        return None
+
+    errors = np.zeros((max(index for _, index, _ in hits) + 1, max(len(counts) for *_, counts in hits)),
+                      dtype=np.int64)
+    for _, index, counts in hits:
+        errors[index, :len(counts)] += counts
+    return {'region_id': hits[0][0], 'reads_in': report['read_counts']['input'],
+            'reads_out': report['read_counts']['output'], 'errors': errors}
+
+
+def read_reports(report_paths: list[Path], processes: int | None = None) -> dict[str, dict]:
+    """Read cutadapt reports in parallel and merge them by region.
 
     Args:
-        experiment_path: Path to a ``*.cutadapt.json`` report.
+        report_paths: Paths to ``*.cutadapt.json`` reports.
+        processes: Number of worker processes, all CPUs if None.
 
     Returns:
-        A list of stats dictionaries for each region.
+        Mapping of region IDs to the (summed) results of ``read_report``.
+    """
+    if len(report_paths) < 2 or processes == 1:
+        results = list(map(read_report, report_paths))
+    else:
+        with multiprocessing.Pool(min(processes or multiprocessing.cpu_count(), len(report_paths))) as pool:
+            results = pool.map(read_report, report_paths)
+
+    regions = {}
+    for result in filter(None, results):
+        if result['region_id'] not in regions:
+            regions[result['region_id']] = result
+            continue
+        merged, errors = regions[result['region_id']], result['errors']
+        shape = np.maximum(merged['errors'].shape, errors.shape)
+        merged['errors'] = np.pad(merged['errors'], [(0, n - m) for n, m in zip(shape, merged['errors'].shape)])
+        merged['errors'][:errors.shape[0], :errors.shape[1]] += errors
+        merged['reads_in'] += result['reads_in']
+        merged['reads_out'] += result['reads_out']
+    return regions
+
+
+def plot_error_counts(pdat: pd.DataFrame, title: str, save_path: Path) -> None:
+    """Plot stacked per-codon error counts on a linear and a log scale.
+
+    Every number of errors is drawn as one filled step artist instead of one bar per codon, which keeps rendering
+    fast for regions with thousands of codons.
+
+    Args:
+        pdat: Counts with codon indices as index and number of errors as columns.
+        title: Figure title.
+        save_path: Path of the PDF to write.
+    """
+    fig, axs = plt.subplots(1, 2, figsize=(10, 5))
+    fig.suptitle(title)
+
+    values = pdat.to_numpy(dtype=np.float64)
+    tops = values.cumsum(axis=1)
+    for ax in axs:
+        for i, col in enumerate(pdat.columns):
+            ax.stairs(tops[:, i], baseline=tops[:, i - 1] if i else 0, fill=True, label=str(col))
+        ax.legend(title=pdat.columns.name)
+        ax.set_xlim(0, len(pdat))
+
+    axs[0].set_ylabel('counts')
+    _max = max(axs[1].get_ylim())
+    _max += _max / 2
+    ylim = (1, _max)
+    axs[1].set_yscale('log')
+    axs[1].set_ylim(ylim)
+
+    for ax in axs:
+        ax.set_xticks([])
+    fig.tight_layout()
+    fig.savefig(save_path)
+    plt.close(fig)
+
+
+def plot_read_stats(read_stats_path: Path, save_dir: Path) -> None:
+    """Plot per-region error and length shift histograms collected while counting.
+
+    Args:
+        read_stats_path: Parquet file written by ``ReadStats.save``.
+        save_dir: Directory to write plots.
     """
-    items = []
-    report = json.load(experiment_path.open('r'))
-    stats = report['adapters_read1']
-    reads_in = report['read_counts']['input']
-    reads_out = report['read_counts']['output']
-    for stat in stats:
-        if stat['five_prime_end']['trimmed_lengths']:
-            item = {'reads_in': reads_in, 'reads_out': reads_out}
-            item['region_id'] = '_'.join(stat['name'].split('.')[:-1])
-            item['index'] = int(stat['name'].split('.')[-1])
-            ec = pd.concat([pd.DataFrame(i) for i in stat['five_prime_end']['trimmed_lengths']])
-            ec = ec.reset_index().rename(columns={'index': 'number_of_errors', 'counts': 'error_counts'})
-            ec = ec.assign(index=item['index'])
-            item['error_counts'] = ec
-            items += [item]
-    return items
-
-
-def plot_hits(output_dir: Path, save_dir: Path) -> None:
-    """Plot codon hit summaries from cutadapt reports.
+    stats = pd.read_parquet(read_stats_path)
+    for region_id, grp_dat in stats.groupby('region'):
+        errors = grp_dat[grp_dat.stat == 'errors'] \
+            .pivot_table(index='codon', columns='value', values='count', aggfunc='sum', fill_value=0) \
+            .rename_axis(index='index', columns='number_of_errors')
+        shifts = grp_dat[grp_dat.stat == 'length_delta'].groupby('value')['count'].sum()
+
+        total = errors.to_numpy().sum()
+        error_stats = ' '.join(f'e{key}: {val:.3E} ({val / total:.2%})' for key, val in errors.sum().items())
+        shift_stats = ' '.join(f'{key:+d}: {val / total:.2%}' for key, val in shifts.items() if key != 0)
+        title = f'{region_id}, {total:.3E} decoded reads, {len(errors)} codons seen\n{error_stats}'
+        if shift_stats:
+            title += f'\nlength shift {shift_stats}'
+        plot_error_counts(errors, title, save_dir / f'hits_{region_id}.pdf')
+
+
+def plot_hits(output_dir: Path, save_dir: Path, read_stats_path: Path | None = None,
+              processes: int | None = None) -> None:
+    """Plot codon hit summaries from the read statistics or from cutadapt reports.
 
     Args:
         output_dir: Directory with ``*.cutadapt.json`` reports.
         save_dir: Directory to write plots and parquet files.
+        read_stats_path: Parquet file written by ``ReadStats.save``, used instead of the reports if it exists.
+        processes: Number of worker processes to read the reports.
     """
-    stats = []
+    if read_stats_path is not None and read_stats_path.exists():
+        plot_read_stats(read_stats_path, save_dir)
+        return
+
     report_paths = sorted(output_dir.glob('*.cutadapt.json'))
     report_paths = sorted(filter(lambda f: not f.stem.startswith('._'), report_paths))
-    for report_path in report_paths:
-        stats += [*get_stats(report_path)]
-    df = pd.DataFrame(stats)
-
-    for grp_name, grp_dat in df.groupby('region_id'):
-        pdat = pd.concat(grp_dat['error_counts'].tolist())
-
-        pdat = pdat.convert_dtypes()
-        pdat.to_parquet(save_dir / f'hits_{grp_name}.parquet', engine='pyarrow')
-
-        pdat = pdat[['index', 'number_of_errors', 'error_counts']] \
-            .groupby(['index', 'number_of_errors']) \
-            .agg('sum') \
-            .reset_index() \
-            .pivot(index='index', columns='number_of_errors', values='error_counts')
-
-        _in, _out, = grp_dat.reads_in.iloc[0], grp_dat.reads_out.iloc[0]
-        # expected = grp_dat.expected.iloc[0]
-        error_sums = {col: pdat[col].sum() for col in pdat}
-        error_stats = ' '.join(f'e{key}: {val:.3E} ({val/_out:.2%})' for key, val in error_sums.items())
-
-        fig, axs = plt.subplots(1, 2, figsize=(10, 5))
-        fig.suptitle(f'{grp_name}, {_out:.3E} / {_in:.3E} ({_out/_in:.2%})\n{error_stats}')
-
-        pdat.plot(kind='bar', stacked=True, ax=axs[0])
-        pdat.plot(kind='bar', stacked=True, ax=axs[1])
-
-        axs[0].set_ylabel('counts')
-        _max = max(axs[1].get_ylim())
-        _max += _max / 2
-        ylim = (1, _max)
-        axs[1].set_yscale('log')
-        axs[1].set_ylim(ylim)
-
-        for ax in axs:
-            ax.set_xticklabels([])
-        fig.tight_layout()
-        fig.savefig(save_dir / f'hits_{grp_name}.pdf')
+
+    for grp_name, grp_dat in sorted(read_reports(report_paths, processes=processes).items()):
+        errors = grp_dat['errors']
+        index, number_of_errors = np.nonzero(errors)
+        pd.DataFrame({'index': index, 'number_of_errors': number_of_errors,
+                      'error_counts': errors[index, number_of_errors]}) \
+            .to_parquet(save_dir / f'hits_{grp_name}.parquet', engine='pyarrow')
+
+        rows, cols = errors.any(axis=1), errors.any(axis=0)
+        pdat = pd.DataFrame(errors[rows][:, cols], index=pd.Index(np.flatnonzero(rows), name='index'),
+                            columns=pd.Index(np.flatnonzero(cols), name='number_of_errors'))
+
+        _in, _out, = grp_dat['reads_in'], grp_dat['reads_out']
+        error_stats = ' '.join(f'e{key}: {val:.3E} ({val/_out:.2%})' for key, val in pdat.sum().items())
+
+        plot_error_counts(pdat, f'{grp_name}, {_out:.3E} / {_in:.3E} ({_out/_in:.2%})\n{error_stats}',
+                          save_dir / f'hits_{grp_name}.pdf')
@@ -3,16 +3,59 @@ import math
 from pathlib import Path
 
 import numpy as np
+import pandas as pd
 from rich.console import Console
 from rich.table import Table
 
 
-def print_report(output_dir: Path, save_path: Path) -> None:
+def read_stats_table(read_stats_path: Path) -> Table:
+    """Summarize the per-region read statistics collected while counting.
+
+    Args:
+        read_stats_path: Parquet file written by ``ReadStats.save``.
+
+    Returns:
+        A Rich table with one row per region.
+    """
+    stats = pd.read_parquet(read_stats_path)
+
+    table = Table(title="Decoded Read Statistics")
+    table.add_column("Region", justify="left", style="cyan", no_wrap=True)
+    table.add_column("Reads", justify="right")
+    table.add_column("Codons seen", justify="right")
+    table.add_column("% exact", justify="right")
+    table.add_column("% 1 error", justify="right")
+    table.add_column("% 2+ errors", justify="right")
+    table.add_column("Mean errors", justify="right")
+    table.add_column("% length shift", justify="right")
+
+    for region_id, grp in stats.groupby('region'):
+        errors = grp[grp.stat == 'errors']
+        shifts = grp[grp.stat == 'length_delta']
+        total = errors['count'].sum()
+        if not total:
+            continue
+        by_errors = errors.groupby('value')['count'].sum()
+        table.add_row(
+            str(region_id),
+            f"{total:,}",
+            f"{errors.codon.nunique():,}",
+            f"{by_errors.get(0, 0) / total:.2%}",
+            f"{by_errors.get(1, 0) / total:.2%}",
+            f"{by_errors[by_errors.index >= 2].sum() / total:.2%}",
+            f"{(by_errors.index * by_errors).sum() / total:.3f}",
+            f"{shifts.loc[shifts.value != 0, 'count'].sum() / total:.2%}",
+        )
+    return table
+
+
+def print_report(output_dir: Path, save_path: Path, read_stats_path: Path | None = None) -> None:
     """Render a cutadapt pipeline report using Rich.
 
     Args:
         output_dir: Directory containing ``*.cutadapt.json`` files.
         save_path: Path to write the plain-text report.
+        read_stats_path: Parquet file written by ``ReadStats.save``, summarized below the report if it exists.
     """
     report_files = sorted(output_dir.glob("*.cutadapt.json"))
     report_files = sorted(filter(lambda f: not f.stem.startswith('._'), report_files))
@@ -107,5 +150,9 @@ def print_report(output_dir: Path, save_path: Path) -> None:
         f"  Discarded     : {fmt_int(overall_discarded)} ({fmt_pct(overall_p_discarded)})"
     )
 
+    if read_stats_path is not None and read_stats_path.exists():
+        console.print()
+        console.print(read_stats_table(read_stats_path))
+
     # Save report as plain text (without ANSI codes)
     save_path.write_text(console.export_text(), encoding='utf-8')
@@ -1,5 +1,6 @@
 import hashlib
 import json
+from collections.abc import Mapping
 from datetime import datetime
 from pathlib import Path
 
@@ -81,3 +82,146 @@ def hash_dict(
     hash_object = hashlib.sha256()
     hash_object.update(data_str.encode())
     return hash_object.hexdigest()
+
+
+# Config sections stored as Parquet tables next to the YAML, with the layout of each section's values
+CONFIG_TABLES = {'whitelists': 'records', 'catalog': 'index'}
+
+
+def file_stat(
+        path: Path,
+) -> dict:
+    """Describe a file by size and modification time.
+
+    Args:
+        path: Path to the file.
+
+    Returns:
+        Dictionary used to detect stale derived files.
+    """
+    stat = path.stat()
+    return {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+
+
+class LazyTables(Mapping):
+    """Read-only mapping of config tables that are read from Parquet on first access.
+
+    Values have the same layout as in the YAML config: a list of records (``orient='records'``) or a dictionary
+    keyed by the ``name`` column (``orient='index'``).
+    """
+
+    def __init__(self, paths: dict[str, Path | None], orient: str, inline: dict | None = None):
+        """Wrap the tables of a config section.
+
+        Args:
+            paths: Mapping of table names to Parquet files, None for tables kept ``inline``.
+            orient: Layout of the values, ``'records'`` or ``'index'``.
+            inline: Tables stored in the header because they could not be written as Parquet.
+        """
+        self.paths = paths
+        self.orient = orient
+        self.loaded = dict(inline or {})
+
+    def __getitem__(self, key: str):
+        if key not in self.loaded:
+            import numpy as np
+            import pandas as pd
+
+            df = pd.read_parquet(self.paths[key])
+            # Parquet returns missing strings as None, YAML configs hold NaN
+            for col in df.select_dtypes(object):
+                df[col] = df[col].where(df[col].notna(), np.nan)
+            match self.orient:
+                case 'records':
+                    self.loaded[key] = df.to_dict('records')
+                case 'index':
+                    self.loaded[key] = df.set_index('name').to_dict('index')
+        return self.loaded[key]
+
+    def __iter__(self):
+        return iter(self.paths)
+
+    def __len__(self) -> int:
+        return len(self.paths)
+
+
+def write_config_tables(
+        config: dict,
+        path: Path,
+) -> Path:
+    """Write a binary copy of a config next to its YAML file.
+
+    The ``whitelists`` and ``catalog`` sections are stored as one Parquet file per table in ``<stem>.tables/`` and
+    the remaining (small) sections in ``<stem>.tables/header.json``. The header records size and modification time
+    of the YAML so that ``read_config`` ignores the copy once the YAML is edited.
+
+    Args:
+        config: Configuration dictionary, as written to ``path``.
+        path: Path to the YAML config file.
+
+    Returns:
+        Path to the directory of the binary config.
+    """
+    import pandas as pd
+    import pyarrow as pa
+
+    save_dir = path.parent / f'{path.stem}.tables'
+    header = {'source': file_stat(path), 'order': list(config),
+              'config': {k: v for k, v in config.items() if k not in CONFIG_TABLES}, 'tables': {}}
+
+    for section, orient in CONFIG_TABLES.items():
+        if section not in config:
+            continue
+        (save_dir / section).mkdir(parents=True, exist_ok=True)
+        paths, inline = {}, {}
+        for name, value in config[section].items():
+            match orient:
+                case 'records':
+                    df = pd.DataFrame.from_records(value)
+                case 'index':
+                    df = pd.DataFrame.from_dict(value, orient='index').rename_axis('name').reset_index()
+            try:
+                df.to_parquet(save_dir / section / f'{name}.parquet', index=False)
+                paths[name] = f'{section}/{name}.parquet'
+            except (pa.ArrowInvalid, pa.ArrowTypeError):
+                # e.g. columns mixing numbers and strings
+                paths[name], inline[name] = None, value
+        header['tables'][section] = {'orient': orient, 'paths': paths, 'inline': inline}
+
+    # e.g. dates parsed from the YAML are stored as ISO strings
+    (save_dir / 'header.json').write_text(json.dumps(header, default=str))
+    return save_dir
+
+
+def read_config(
+        path: Path,
+) -> dict:
+    """Read a config, preferring the binary copy written by ``write_config_tables``.
+
+    Tables of the binary copy are loaded on first access. Falls back to ``read_yaml`` if there is no copy or the
+    YAML changed since it was written.
+
+    Args:
+        path: Path to the YAML config file.
+
+    Returns:
+        Configuration dictionary.
+    """
+    path = Path(path)
+    header_path = path.parent / f'{path.stem}.tables' / 'header.json'
+    if not header_path.exists():
+        return read_yaml(path)
+
+    header = json.loads(header_path.read_text())
+    if header['source'] != file_stat(path):
+        return read_yaml(path)
+
+    config = {}
+    for key in header['order']:
+        if key in header['tables']:
+            item = header['tables'][key]
+            paths = {name: header_path.parent / p if p else None for name, p in item['paths'].items()}
+            config[key] = LazyTables(paths, orient=item['orient'], inline=item['inline'])
+        else:
+            config[key] = header['config'][key]
+    return config
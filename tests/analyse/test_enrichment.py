@@ -0,0 +1,35 @@
+import numpy as np
+import pandas as pd
+
+from delt_hit.analyse.enrichment import calc_norm_factors, counts_matrix, enrichment_test, p_adjust_bh
+
+
+def test_p_adjust_bh():
+    adjusted = p_adjust_bh(np.array([0.01, 0.04, 0.03, 0.5]))
+    assert np.allclose(adjusted, [0.04, 0.04 * 4 / 3, 0.04 * 4 / 3, 0.5])
+
+
+def test_enrichment_recovers_spiked_compounds():
+    rng = np.random.default_rng(0)
+    code_1, code_2 = np.divmod(np.arange(400), 20)
+    samples, groups = [], []
+    for i in range(6):
+        group = 'protein' if i >= 3 else 'no_protein'
+        count = rng.poisson(5, size=400)
+        if group == 'protein':
+            count[:5] *= 20
+        df = pd.DataFrame({'code_1': code_1 + 1, 'code_2': code_2 + 1, 'count': count})
+        samples.append((f's{i}', df[df['count'] > 0]))
+        groups.append(group)
+
+    codes, counts, names = counts_matrix(samples)
+    assert counts.shape == (400, 6)
+
+    norm_factors = calc_norm_factors(counts)
+    assert np.isclose(np.prod(norm_factors), 1)
+
+    for test in ('nb', 'poisson'):
+        stats = enrichment_test(counts, groups, treatment='protein', control='no_protein',
+                                norm_factors=norm_factors, test=test)
+        hits = set(np.flatnonzero(stats.FDR < 0.05))
+        assert set(range(5)) <= hits
@@ -0,0 +1,24 @@
+import pandas as pd
+import pyarrow.dataset as ds
+
+from delt_hit.cli.analyse.api import prepare_dataset
+
+
+def test_prepare_dataset_replaces_previous_run(tmp_path):
+    selections = []
+    for i, group in enumerate(['protein', 'protein', 'no_protein']):
+        counts_path = tmp_path / f's{i}' / 'counts.txt'
+        counts_path.parent.mkdir()
+        pd.DataFrame({'code_1': [1, 2], 'count': [i + 1, 5], 'id': ['1', '2']}).to_csv(counts_path, sep='\t',
+                                                                                      index=False)
+        selections.append({'name': f's{i}', 'group': group, 'counts_path': str(counts_path)})
+
+    data_dir = tmp_path / 'data'
+    prepare_dataset({'selections': selections}, data_dir, tmp_path / 'samples.parquet')
+    assert len(ds.dataset(data_dir, partitioning='hive').to_table()) == 6
+
+    # a rerun with fewer selections leaves no partitions of the previous run
+    prepare_dataset({'selections': selections[:1]}, data_dir, tmp_path / 'samples.parquet')
+    table = ds.dataset(data_dir, partitioning='hive').to_table().to_pandas()
+    assert table['name'].unique().tolist() == ['s0'] and table['count'].tolist() == [1, 5]
+    assert not (tmp_path / '.data.tmp').exists()
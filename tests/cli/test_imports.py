@@ -0,0 +1,36 @@
+import subprocess
+import sys
+
+import pytest
+
+HEAVY = ['rdkit', 'dash', 'plotly', 'networkx', 'seaborn', 'matplotlib']
+
+
+def import_time(code: str) -> tuple[dict[str, int], set[str]]:
+    """Run ``code`` in a fresh interpreter with ``-X importtime``.
+
+    Returns:
+        Cumulative import time in microseconds per module and the set of top-level modules loaded.
+    """
+    code = f'{code}\nimport sys\nprint(",".join(sorted({{m.split(".")[0] for m in sys.modules}})))'
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', code], capture_output=True, text=True, check=True)
+    times = {}
+    for line in result.stderr.splitlines():
+        if line.startswith('import time:') and '|' in line:
+            _, cumulative, module = line.removeprefix('import time:').split('|')
+            if cumulative.strip().isdigit():
+                times[module.strip()] = int(cumulative)
+    return times, set(result.stdout.strip().split(','))
+
+
+def test_main_import_is_light():
+    times, modules = import_time('import delt_hit.cli.main')
+    assert not modules & set(HEAVY)
+    assert times['delt_hit.cli.main'] < 1_000_000
+
+
+@pytest.mark.parametrize('group, allowed', [('init', []), ('validate', []), ('demultiplex', []), ('analyse', []),
+                                            ('dashboard', ['dash', 'plotly'])])
+def test_group_imports_only_its_dependencies(group, allowed):
+    _, modules = import_time(f'from delt_hit.cli.main import load_command\nload_command("{group}")')
+    assert not modules & (set(HEAVY) - set(allowed))
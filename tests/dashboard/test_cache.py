@@ -0,0 +1,36 @@
+import numpy as np
+
+from delt_hit.dashboard.cache import LRUCache
+
+
+def test_lru_eviction_order():
+    cache = LRUCache(max_entries=3)
+    for key in 'abc':
+        cache.put(key, key)
+    assert cache.get('a') == 'a'
+    cache.put('d', 'd')
+    # b is the least recently used after the lookup of a
+    assert 'b' not in cache and list(cache.entries) == ['c', 'a', 'd']
+    assert cache.get_or_compute('b', lambda: 'B') == 'B'
+    assert 'c' not in cache and len(cache) == 3
+    stats = cache.stats()
+    assert (stats['hits'], stats['misses'], stats['hit_rate'], stats['evictions']) == (1, 1, 0.5, 2)
+
+
+def test_lru_size_bound():
+    value = np.zeros(1000)
+    cache = LRUCache(max_entries=100, max_bytes=3 * value.nbytes)
+    for i in range(10):
+        cache.put(i, np.zeros(1000))
+        assert cache.num_bytes <= cache.max_bytes
+    assert list(cache.entries) == [7, 8, 9] and cache.num_bytes == 3 * value.nbytes
+
+    # values larger than the budget are not cached, replacing a key updates its size
+    cache.put('large', np.zeros(4000))
+    assert 'large' not in cache
+    cache.put(9, np.zeros(10))
+    assert list(cache.entries) == [7, 8, 9] and cache.num_bytes == 2 * value.nbytes + 80
+
+    # replacing a key with a value larger than the budget drops the old value
+    cache.put(8, np.zeros(4000))
+    assert list(cache.entries) == [7, 9] and cache.num_bytes == value.nbytes + 80
@@ -0,0 +1,83 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from delt_hit.dashboard.cubes import MarginalCubes
+from delt_hit.dashboard.index import parse_code_intervals
+from delt_hit.dashboard.store import CountStore
+
+CODE_COLS = ['code_1', 'code_2', 'code_3', 'code_4']
+
+
+@pytest.fixture
+def counts():
+    rng = np.random.default_rng(0)
+    df = pd.DataFrame(rng.integers(1, 8, size=(500, 4)), columns=CODE_COLS)
+    df['count'] = rng.integers(1, 100, size=len(df))
+    return df.groupby(CODE_COLS)['count'].sum().reset_index()
+
+
+def expected(counts, selected_codes, mask=None):
+    data = counts if mask is None else counts[mask]
+    return data.groupby(selected_codes)['count'].sum().reset_index()
+
+
+def compare(result, expected, selected_codes):
+    result = result.sort_values(selected_codes).reset_index(drop=True)
+    pd.testing.assert_frame_equal(result, expected, check_dtype=False)
+
+
+@pytest.mark.parametrize('index_min_rows', [1_000_000, 0])
+def test_query(counts, index_min_rows):
+    cubes = MarginalCubes.build(counts, CODE_COLS, max_dim=2)
+    cubes.index_min_rows = index_min_rows
+    assert set(cubes.cubes) == {('code_1',), ('code_2',), ('code_3',), ('code_4',), ('code_1', 'code_2'),
+                                ('code_1', 'code_3'), ('code_1', 'code_4'), ('code_2', 'code_3'),
+                                ('code_2', 'code_4'), ('code_3', 'code_4')}
+
+    for selected_codes in [['code_1'], ['code_2', 'code_4'], ['code_1', 'code_2', 'code_3']]:
+        compare(cubes.query(selected_codes, {}), expected(counts, selected_codes), selected_codes)
+    assert cubes.query([], {})['count'].item() == counts['count'].sum()
+
+    # filters on grouped and other columns, the code_4 filter keeps every value and is dropped
+    filters = parse_code_intervals('1-2,5;;3-7;1-7', CODE_COLS)
+    mask = counts.code_1.isin([1, 2, 5]) & counts.code_3.between(3, 7)
+    for selected_codes in [['code_1'], ['code_2'], ['code_2', 'code_3']]:
+        compare(cubes.query(selected_codes, filters), expected(counts, selected_codes, mask), selected_codes)
+    assert cubes.query([], filters)['count'].item() == counts.loc[mask, 'count'].sum()
+
+
+def test_no_copy_of_counts(counts):
+    counts = counts.groupby(CODE_COLS[:3])['count'].sum().reset_index()
+    cubes = MarginalCubes.build(counts, CODE_COLS[:3], max_dim=3)
+    assert ('code_1', 'code_2', 'code_3') not in cubes.cubes and len(cubes.cubes) == 6
+    assert cubes.source_for(CODE_COLS[:3]) is counts
+    compare(cubes.query(CODE_COLS[:3], {}), expected(counts, CODE_COLS[:3]), CODE_COLS[:3])
+
+
+def test_full_resolution_query(counts, tmp_path):
+    path = tmp_path / 'sel' / 'counts.txt'
+    path.parent.mkdir()
+    counts.to_csv(path, sep='\t', index=False)
+    frame = CountStore.build({'sel': path}).frame('sel')
+    cubes = MarginalCubes.from_counts(path, frame, CODE_COLS, max_dim=2, cache=False)
+    # queries at full resolution are answered from the Arrow-backed frame without a copy
+    assert cubes.query(CODE_COLS[::-1], {}) is frame
+
+
+def test_from_counts_cache(tmp_path, counts):
+    counts_path = tmp_path / 'counts.txt'
+    counts.to_csv(counts_path, sep='\t', index=False)
+    built = MarginalCubes.from_counts(counts_path, counts, CODE_COLS, max_dim=2)
+    assert (tmp_path / 'counts.cubes' / 'meta.json').exists()
+
+    loaded = MarginalCubes.from_counts(counts_path, counts, CODE_COLS, max_dim=2)
+    assert set(loaded.cubes) == set(built.cubes)
+    for key, cube in built.cubes.items():
+        pd.testing.assert_frame_equal(loaded.cubes[key], cube)
+
+    # a rebuild with other dimensions removes the cubes of the previous build
+    MarginalCubes.from_counts(counts_path, counts, CODE_COLS, max_dim=1)
+    assert len(list((tmp_path / 'counts.cubes').glob('*.parquet'))) == 4
+    assert set(MarginalCubes.from_counts(counts_path, counts, CODE_COLS, max_dim=1).cubes) == {
+        (col,) for col in CODE_COLS}
@@ -0,0 +1,21 @@
+import numpy as np
+import pandas as pd
+
+from delt_hit.dashboard.downsample import downsample
+
+
+def test_downsample():
+    rng = np.random.default_rng(0)
+    data = pd.DataFrame({'code_1': rng.integers(1, 300, 20_000), 'code_2': rng.integers(1, 300, 20_000),
+                         'count': rng.permutation(20_000) + 1})
+    assert downsample(data, ['code_1', 'code_2'], max_points=20_000) is data
+
+    for axes in [['code_1', 'code_2'], ['code_1', 'code_2', 'count']]:
+        result = downsample(data, axes, max_points=1000)
+        assert len(result) <= 1000
+        assert result['n_points'].sum() == len(data)
+
+        # the 500 highest counts are kept as they are
+        top = data[data['count'] > 20_000 - 500]
+        pd.testing.assert_frame_equal(result.iloc[:500][top.columns].sort_values('count').reset_index(drop=True),
+                                      top.sort_values('count').reset_index(drop=True), check_dtype=False)
@@ -0,0 +1,40 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from delt_hit.dashboard.index import CodeIndex, in_intervals, parse_code_intervals
+
+CODE_COLS = ['code_1', 'code_2', 'code_3']
+MAX = np.iinfo(np.int64).max
+
+
+@pytest.mark.parametrize('range_str, expected', [
+    ('7', {'code_1': [[7, 7]]}),
+    ('1,2,3,7', {'code_1': [[1, 3], [7, 7]]}),
+    ('5-3;2-5,8-10,4', {'code_1': [[3, 5]], 'code_2': [[2, 5], [8, 10]]}),
+    (';;100-', {'code_3': [[100, MAX]]}),
+    ('1-3,2-;;', {'code_1': [[1, MAX]]}),
+    ('1-2;3;4;5', {'code_1': [[1, 2]], 'code_2': [[3, 3]], 'code_3': [[4, 4]]}),
+    ('a,1-b, 2 ;x-y;--', {'code_1': [[2, 2]]}),
+    ('', {}),
+    (None, {}),
+])
+def test_parse_code_intervals(range_str, expected):
+    filters = parse_code_intervals(range_str, CODE_COLS)
+    assert {col: intervals.tolist() for col, intervals in filters.items()} == expected
+
+
+def test_code_index():
+    rng = np.random.default_rng(0)
+    df = pd.DataFrame(rng.integers(1, 500, size=(10_000, 3)), columns=CODE_COLS)
+    index = CodeIndex(df)
+
+    for range_str in ['1-10,400-', '17;;', ';100-200,300;1-250', '600-', '1-;1-;1-']:
+        filters = parse_code_intervals(range_str, CODE_COLS)
+        mask = np.ones(len(df), dtype=bool)
+        for col, intervals in filters.items():
+            column_mask = in_intervals(df[col].to_numpy(), intervals)
+            assert index.count(col, intervals) == column_mask.sum()
+            assert np.array_equal(np.sort(index.rows(col, intervals)), np.flatnonzero(column_mask))
+            mask &= column_mask
+        pd.testing.assert_frame_equal(index.filter(filters), df[mask])
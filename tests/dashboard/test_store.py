@@ -0,0 +1,49 @@
+import os
+
+import pandas as pd
+
+from delt_hit.dashboard.store import CountStore, find_selection_counts
+
+
+def write_counts(path, df):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    df.assign(id=df.code_1.astype(str) + '_' + df.code_2.astype(str)).to_csv(path, sep='\t', index=False)
+
+
+def test_count_store(tmp_path):
+    tables = {
+        'sel_a': pd.DataFrame({'code_1': [1, 2, 3], 'code_2': [4, 5, 6], 'count': [10, 5, 1]}),
+        'sel_b': pd.DataFrame({'code_1': [7, 1], 'code_2': [2, 2], 'count': [3, 2]}),
+    }
+    write_counts(tmp_path / 'sel_a' / 'counts.txt', tables['sel_a'])
+    write_counts(tmp_path / 'sel_b_counts.txt', tables['sel_b'])
+    sources = find_selection_counts(tmp_path)
+    assert list(sources) == ['sel_a', 'sel_b']
+
+    path = tmp_path / 'counts.arrow'
+    assert not CountStore.is_fresh(path, sources)
+    CountStore.build(sources, path)
+    assert CountStore.is_fresh(path, sources)
+
+    store = CountStore.open(path)
+    assert store.names == ['sel_a', 'sel_b'] and store.code_cols == ['code_1', 'code_2']
+    for name, df in tables.items():
+        pd.testing.assert_frame_equal(store.frame(name), df, check_dtype=False)
+    assert store.value_range('count') == (1, 10)
+    # a store in memory holds the same data
+    pd.testing.assert_frame_equal(CountStore.build(sources).frame('sel_b'), tables['sel_b'], check_dtype=False)
+
+    # touching a source makes the store stale, a store with more selections serves a subset
+    stat = sources['sel_b'].stat()
+    os.utime(sources['sel_b'], ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+    assert CountStore.is_fresh(path, {'sel_a': sources['sel_a']})
+    assert not CountStore.is_fresh(path, sources)
+    CountStore.open_or_build(sources, path)
+    assert CountStore.is_fresh(path, sources)
+
+
+def test_empty_count_store(tmp_path):
+    write_counts(tmp_path / 'sel_a' / 'counts.txt', pd.DataFrame(columns=['code_1', 'code_2', 'count']))
+    path = tmp_path / 'counts.arrow'
+    assert CountStore.build(find_selection_counts(tmp_path), path) is None
+    assert not path.exists()
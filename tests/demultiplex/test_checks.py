@@ -0,0 +1,27 @@
+import numpy as np
+from Levenshtein import distance, hamming
+
+from delt_hit.demultiplex.checks import check_distances, codon_table
+from delt_hit.demultiplex.distance import min_distances
+
+
+def test_min_distances():
+    rng = np.random.default_rng(0)
+    codons = [''.join(rng.choice(list('ACGT'), 8)) for _ in range(200)]
+    for metric, func in [('hamming', hamming), ('levenshtein', distance)]:
+        dist, nearest = min_distances(codons, metric=metric)
+        expected = [min(func(a, b) for j, b in enumerate(codons) if j != i) for i, a in enumerate(codons)]
+        assert dist.tolist() == expected
+        assert all(func(codons[i], codons[j]) == d for i, (j, d) in enumerate(zip(nearest, dist)))
+
+
+def test_check_distances():
+    config = {
+        'structure': [{'name': 'B0', 'type': 'building_block', 'max_error_rate': 1, 'indels': 0}],
+        'whitelists': {'B0': [{'codon': 'AAAAAA'}, {'codon': 'AAAATT'}, {'codon': 'CCCCCC'}]},
+    }
+    summary, issues = check_distances(codon_table(config))
+
+    assert summary.loc[0, 'min_distance'] == 2
+    assert summary.loc[0, 'num_conflicts'] == 2
+    assert len(issues) == 1 and issues[0].location == 'B0 row 2'
@@ -0,0 +1,21 @@
+from delt_hit.demultiplex.collapse import ReadCollapser, barcode_length
+from delt_hit.demultiplex.validation import Region
+
+REGIONS = [
+    Region(name='S0', index=0, codons=['AAAA', 'CCC'], max_error_rate=0, indels=0),
+    Region(name='B0', index=1, codons=['GGGGG'], max_error_rate=1, indels=1),
+]
+
+
+def test_barcode_length():
+    assert barcode_length(REGIONS) == 4 + 5 + 1
+
+
+def test_collapse_spill(tmp_path):
+    reads = [b'ACGTAC\n', b'ACGTTT\n', b'GGGG\n', b'ACG\n', b'\n', b'GGGGCC\n'] * 50
+    collapser = ReadCollapser(4, tmp_path, memory_mb=0)
+    collapser.add_records((b'@r\n', read, b'+\n', b'I\n') for read in reads)
+    assert len(collapser.runs) < 64
+
+    assert list(collapser.items()) == [(b'ACG', 50), (b'ACGT', 100), (b'GGGG', 100)]
+    assert collapser.num_reads == 300 and not list(tmp_path.iterdir())
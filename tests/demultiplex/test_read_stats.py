@@ -0,0 +1,35 @@
+import numpy as np
+
+from delt_hit.demultiplex.postprocess import ReadStats, extract_ids
+from delt_hit.demultiplex.validation import Region
+
+
+def test_read_stats(tmp_path):
+    regions = [Region(name='S0', index=0, codons=['ACGT', 'TTTT'], max_error_rate=0.2, indels=1),
+               Region(name='B0', index=1, codons=['AAAAA', 'CCCCC', 'GGGGG'], max_error_rate=0.2, indels=1),
+               Region(name='U0', index=2, codons=['NNNN'], max_error_rate=0, indels=0)]
+    reads = [
+        '@r1 ?0-S0.0=ACGT?1-B0.1=CCCCC?2-U0=ACGA',
+        '@r2 count=3 ?0-S0.0=ACGA?1-B0.1=CCCC?2-U0=ACGA',  # one substitution, one deletion
+        '@r3 ?0-S0.1=TTTTT?1-B0.2=GAGGG?2-U0=TTTT',  # one insertion, one substitution
+        '@r4 ?0-S0.1=TTTT?1-B0.0',  # without matched sequence
+    ]
+    stats = ReadStats(regions)
+    for line in reads:
+        ids = extract_ids(line)
+        stats.update(ids['adapters'], ids['count'])
+
+    hists = stats.histograms()
+    assert set(hists) == {'0-S0', '1-B0'}
+    assert np.array_equal(hists['0-S0']['errors'], [[1, 3, 0, 0, 0], [1, 1, 0, 0, 0]])
+    assert np.array_equal(hists['1-B0']['errors'], [[0] * 6, [1, 3, 0, 0, 0, 0], [0, 1, 0, 0, 0, 0]])
+    # columns are the length shifts -5 to 5
+    assert hists['1-B0']['length_delta'][1, 4] == 3 and hists['1-B0']['length_delta'][1, 5] == 1
+    assert hists['0-S0']['length_delta'][1, 5] == 1
+
+    stats.save(tmp_path / 'read_stats.parquet')
+    df = stats.to_frame()
+    # every annotation with a sequence appears once per stat
+    assert df['count'].sum() == 2 * (6 + 5)
+    row = df.query("region == '1-B0' and stat == 'length_delta' and codon == 1 and value == -1")
+    assert row['count'].tolist() == [3]
@@ -0,0 +1,28 @@
+import gzip
+import random
+
+from delt_hit.demultiplex.read_store import ReadStore, ReadStoreWriter
+
+
+def test_read_store(tmp_path):
+    rng = random.Random(0)
+    reads = [((1, rng.randrange(3)), (rng.randrange(1, 20), rng.randrange(1, 300)), f'@r{i} ?0-S0.1=ACGT\n')
+             for i in range(20000)]
+    # a frequent compound spans several blocks
+    reads += [((1, 0), (7, 7), f'@f{i} ?0-S0.1=ACGT\n') for i in range(10000)]
+    rng.shuffle(reads)
+    # a tiny budget spills more than MAX_RUNS sorted runs
+    writer = ReadStoreWriter(tmp_path / 'store', ids_to_name={(1, 0): 'sel_a', (1, 1): 'sel_b'}, memory_mb=0.02)
+    for selection_ids, barcodes, line in reads:
+        writer.add(selection_ids, barcodes, line)
+    path = writer.write()
+    assert not list((tmp_path / 'store').glob('*.tmp'))
+    assert len(gzip.decompress(path.read_bytes()).splitlines()) == len(reads)
+
+    store = ReadStore(tmp_path / 'store')
+    assert len(store.first_keys) > 5
+    names = {(1, 0): 'sel_a', (1, 1): 'sel_b', (1, 2): '1-2'}
+    for selection_ids, barcodes, _ in [((1, 0), (7, 7), None), *reads[:100]]:
+        expected = [line[1:].strip() for ids, codes, line in reads if ids == selection_ids and codes == barcodes]
+        assert sorted(store.reads(names[selection_ids], barcodes)) == sorted(expected)
+    assert store.reads('sel_a', (99, 1)) == []
@@ -0,0 +1,30 @@
+from delt_hit.demultiplex.routing import SelectionRouter, fixed_offsets
+from delt_hit.demultiplex.validation import Region
+
+STRUCTURE = [{'type': 'selection'}, {'type': 'building_block'}, {'type': 'selection'}]
+REGIONS = [
+    Region(name='S0', index=0, codons=['AAAA', 'CCCC'], max_error_rate=1, indels=0),
+    Region(name='B0', index=1, codons=['GGG', 'TTT'], max_error_rate=0, indels=0),
+    Region(name='S1', index=2, codons=['ACAC', 'GTGT'], max_error_rate=0, indels=0),
+]
+
+
+def test_fixed_offsets():
+    assert fixed_offsets(REGIONS) == [0, 4, 7]
+    regions = [REGIONS[0], REGIONS[1].model_copy(update={'indels': 1}), REGIONS[2]]
+    assert fixed_offsets(regions) == [0, 4, None]
+
+
+def test_selection_router():
+    router = SelectionRouter(REGIONS, STRUCTURE, {'a': [0, 1], 'b': [1, 0]})
+    assert router.keep(b'AAAAGGGGTGTNN\n')
+    assert router.keep(b'AATAGGGGTGTNN\n')  # one substitution allowed in S0
+    assert router.keep(b'CCCCTTTACACNN\n')
+    assert not router.keep(b'AAAAGGGACACNN\n')  # primers of an unrequested selection
+    assert not router.keep(b'ATTAGGGGTGTNN\n')
+    assert not router.keep(b'AAAA\n')
+
+    # S1 cannot be checked if B0 allows indels, only S0 is used
+    regions = [REGIONS[0], REGIONS[1].model_copy(update={'indels': 1}), REGIONS[2]]
+    router = SelectionRouter(regions, STRUCTURE, {'a': [0, 1]})
+    assert router.keep(b'AAAAGGGACACNN\n') and not router.keep(b'CCCCGGGGTGTNN\n')
@@ -0,0 +1,229 @@
+import errno
+import gzip
+import json
+import os
+import random
+import shutil
+from collections import Counter
+from pathlib import Path
+from types import SimpleNamespace
+
+import pytest
+
+from delt_hit.demultiplex.postprocess import extract_ids
+from delt_hit.demultiplex.preprocess import get_regions
+from delt_hit.demultiplex.runner import Runner, build_stages, check_capacity, intermediate_path, publish
+from delt_hit.demultiplex.sampling import BGZF_EOF, bgzf_block
+
+WHITELISTS = {
+    'S0': [{'codon': 'AACCGG'}, {'codon': 'TTGGCC'}],
+    'C0': [{'codon': 'ACGTTGCA'}],
+    'B0': [{'codon': 'GATTAC'}, {'codon': 'CCATGG'}, {'codon': 'TGTACA'}],
+    'U0': [{'codon': 'NNNN'}],
+    'S1': [{'codon': 'CTCTCT'}, {'codon': 'AGAGAG'}],
+}
+STRUCTURE = [{'name': name, 'type': kind, 'max_error_rate': 0, 'indels': 0}
+             for name, kind in [('S0', 'selection'), ('C0', 'constant'), ('B0', 'building_block'), ('S1', 'selection')]]
+
+requires_cutadapt = pytest.mark.skipif(shutil.which('cutadapt') is None, reason='cutadapt is not installed')
+
+
+@pytest.fixture
+def experiment(tmp_path):
+    """Config of a tiny experiment and the expected counts of its reads."""
+    rng = random.Random(0)
+    expected = Counter()
+    with gzip.open(tmp_path / 'reads.fastq.gz', 'wt') as f:
+        for i in range(300):
+            s0, b0, s1 = rng.randrange(2), rng.randrange(3), rng.randrange(2)
+            sequence = (WHITELISTS['S0'][s0]['codon'] + 'ACGTTGCA' + WHITELISTS['B0'][b0]['codon']
+                        + WHITELISTS['S1'][s1]['codon'])
+            if i % 10 == 0:
+                # reads without a valid building block are dropped
+                sequence = sequence.replace(WHITELISTS['B0'][b0]['codon'], 'GGGGGG')
+            else:
+                expected[(s0, s1), (b0 + 1,)] += 1
+            sequence += ''.join(rng.choice('ACGT') for _ in range(20))
+            f.write(f'@r{i}\n{sequence}\n+\n{"I" * len(sequence)}\n')
+
+    config = {
+        'experiment': {'name': 'exp', 'save_dir': str(tmp_path), 'fastq_path': str(tmp_path / 'reads.fastq.gz'),
+                       'num_cores': 1},
+        'selections': {f'sel{i}{j}': {'ids': [i, j]} for i in range(2) for j in range(2)},
+        'structure': STRUCTURE,
+        'whitelists': WHITELISTS,
+    }
+    return config, expected
+
+
+def read_counts(path) -> Counter:
+    counts = Counter()
+    with gzip.open(path, 'rt') as f:
+        for line in f:
+            ids = extract_ids(line)
+            counts[ids['selection_ids'], ids['barcodes']] += ids['count']
+    return counts
+
+
+def test_build_stages(tmp_path):
+    structure = [*STRUCTURE[:3], {'name': 'U0', 'type': 'umi', 'max_error_rate': 0, 'indels': 0}, STRUCTURE[3]]
+    regions = get_regions(structure, WHITELISTS)
+    input_dir, output_dir, fastq_path = tmp_path / 'in', tmp_path / 'out', tmp_path / 'reads.fastq.gz'
+
+    stages = build_stages(regions, input_dir=input_dir, output_dir=output_dir, fastq_path=fastq_path, num_cores=2)
+    assert [stage.name for stage in stages] == ['0-S0', '1-C0', '2-B0', '3-U0', '4-S1']
+    assert stages[0].command[:4] == ['cutadapt', str(fastq_path), '-o', '-']
+    assert all(stage.command[:4] == ['cutadapt', '-', '-o', '-'] for stage in stages[1:])
+    assert all(stage.output is None for stage in stages)
+    command = stages[2].command
+    assert command[command.index('-g') + 1] == f'^file:{input_dir / "2-B0.fastq"}'
+    assert '--discard-untrimmed' in command and '--no-indels' in command and '--cores=2' in command
+    assert f'--json={output_dir / "2-B0.cutadapt.json"}' in command and stages[2].report is not None
+    # UMIs are cut and kept in the read name
+    assert stages[3].command[4:6] == ['--cut', '4'] and '--discard-untrimmed' not in stages[3].command
+
+    stages = build_stages(regions, input_dir=input_dir, output_dir=output_dir, fastq_path=None, num_cores=1,
+                          keep_intermediate=True, write_json_file=False)
+    assert stages[0].input is None and stages[0].command[1] == '-'
+    for previous, stage, region in zip([None, *stages], stages, regions):
+        assert stage.output == intermediate_path(output_dir, region) == output_dir / f'{region.id}.fastq.gz'
+        assert stage.input == (previous.output if previous else None)
+        assert stage.command[1:4] == [str(stage.input or '-'), '-o', str(stage.output)]
+        assert stage.report is None and not any(arg.startswith('--json') for arg in stage.command)
+
+    # resuming reads the intermediate file of the previous region
+    stages = build_stages(regions, input_dir=input_dir, output_dir=output_dir, fastq_path=fastq_path, num_cores=1,
+                          start=2, fmt='fasta')
+    assert [stage.name for stage in stages] == ['2-B0', '3-U0', '4-S1']
+    assert stages[0].input == output_dir / '1-C0.fasta.gz' and stages[0].command[1] == str(stages[0].input)
+    assert all(stage.input is None and stage.output is None for stage in stages[1:])
+
+
+@requires_cutadapt
+def test_runner(experiment, tmp_path):
+    config, expected = experiment
+    runner = Runner(config, config_path=tmp_path / 'config.yaml')
+    reads_path = runner.run(with_processing=False)
+    assert reads_path == tmp_path / 'exp' / 'demultiplex' / 'cutadapt_output_files' / 'reads_with_adapters.gz'
+    assert read_counts(reads_path) == expected
+    assert sorted(path.name for path in runner.output_dir.glob('*.cutadapt.json')) == \
+           ['0-S0.cutadapt.json', '1-C0.cutadapt.json', '2-B0.cutadapt.json', '3-S1.cutadapt.json']
+    assert not list(runner.output_dir.glob('*.fastq.gz'))
+
+    # intermediate reads allow resuming from any region
+    runner.run(with_processing=False, keep_intermediate=True)
+    assert read_counts(reads_path) == expected
+    reads_path.unlink()
+    runner.run(with_processing=False, resume_from='2-B0')
+    assert read_counts(reads_path) == expected
+    reads_path.unlink()
+    runner.run(with_processing=False, resume_from='collect')
+    assert read_counts(reads_path) == expected
+
+    runner.run(with_processing=False, collapse=True, collapse_memory_mb=0)
+    assert read_counts(reads_path) == expected
+    runner.run(with_processing=False, selections=['sel01'])
+    assert read_counts(reads_path) == {key: n for key, n in expected.items() if key[0] == (0, 1)}
+
+
+@requires_cutadapt
+def test_runner_sample(experiment, tmp_path, monkeypatch):
+    config, expected = experiment
+    # BGZF input is sampled block-wise
+    fastq_path = tmp_path / 'reads.fastq.gz'
+    data = gzip.decompress(fastq_path.read_bytes())
+    fastq_path.write_bytes(b''.join(bgzf_block(data[i:i + 500]) for i in range(0, len(data), 500)) + BGZF_EOF)
+
+    runner = Runner(config, config_path=tmp_path / 'config.yaml')
+    reads_path = runner.run(with_processing=False, sample=30, seed=1)
+    counts = read_counts(reads_path)
+    assert 0 < sum(counts.values()) <= 30 and all(n <= expected[key] for key, n in counts.items())
+
+    events = [json.loads(line) for line in runner.log_path.read_text().splitlines()]
+    sample, = [event for event in events if event['stage'] == 'sample' and event['event'] == 'end']
+    assert sample['reads_out'] == 30 and 0 < sample['bytes_read'] < fastq_path.stat().st_size
+
+    # resumed runs read the intermediate reads, the input is neither sampled nor fed
+    runner.run(with_processing=False, keep_intermediate=True)
+    num_events = len(runner.log_path.read_text().splitlines())
+    fed = []
+    monkeypatch.setattr(runner, 'feed', lambda stdin, **kwargs: fed.append(kwargs) or stdin.close())
+    runner.run(with_processing=False, resume_from='2-B0', sample=30)
+    assert not fed
+    assert read_counts(reads_path) == expected
+    events = [json.loads(line) for line in runner.log_path.read_text().splitlines()[num_events:]]
+    assert {event['stage'] for event in events} == {'2-B0', '3-S1', 'collect'}
+
+
+def test_publish(tmp_path, monkeypatch):
+    source, target = tmp_path / 'scratch' / 'a.txt', tmp_path / 'save' / 'out' / 'a.txt'
+    source.parent.mkdir()
+    source.write_text('reads')
+    publish(source, target)
+    assert target.read_text() == 'reads' and not source.exists()
+
+    # renames fail across filesystems, the file is then copied next to the target and renamed
+    replace, calls = os.replace, []
+
+    def cross_device(src, dst):
+        calls.append((Path(src), Path(dst)))
+        if len(calls) == 1:
+            raise OSError(errno.EXDEV, 'Invalid cross-device link')
+        replace(src, dst)
+
+    source.write_text('more reads')
+    monkeypatch.setattr(os, 'replace', cross_device)
+    publish(source, target)
+    assert target.read_text() == 'more reads' and not source.exists()
+    assert calls == [(source, target), (target.with_name('.a.txt.tmp'), target)]
+    assert list(target.parent.iterdir()) == [target]
+
+
+def test_check_capacity(tmp_path, monkeypatch):
+    monkeypatch.setattr(shutil, 'disk_usage', lambda path: SimpleNamespace(free=10))
+    check_capacity(tmp_path, 10, 'outputs')
+    with pytest.raises(RuntimeError, match='Not enough space for outputs'):
+        check_capacity(tmp_path, 11, 'outputs')
+
+
+def test_runner_capacity(experiment, tmp_path, monkeypatch):
+    config, _ = experiment
+    runner = Runner(config, config_path=tmp_path / 'config.yaml', scratch_dir=tmp_path / 'scratch')
+    free = {runner.work_dir: 10 ** 9, runner.output_dir: 10 ** 9}
+    monkeypatch.setattr(shutil, 'disk_usage', lambda path: SimpleNamespace(free=free[path]))
+    runner.work_dir.mkdir(parents=True)
+    runner.output_dir.mkdir(parents=True)
+
+    input_size = runner.fastq_path.stat().st_size
+    free[runner.work_dir] = 3 * input_size
+    runner.check_capacity(keep_intermediate=False, num_stages=4)
+    with pytest.raises(RuntimeError, match='scratch'):
+        runner.check_capacity(keep_intermediate=True, num_stages=4)
+    # samples are not checked
+    runner.check_capacity(keep_intermediate=True, num_stages=4, fast_dev_run=True)
+    free[runner.output_dir] = input_size - 1
+    with pytest.raises(RuntimeError, match='demultiplex outputs'):
+        runner.check_capacity(keep_intermediate=False, num_stages=4)
+
+
+@requires_cutadapt
+def test_runner_scratch(experiment, tmp_path):
+    config, expected = experiment
+    runner = Runner(config, config_path=tmp_path / 'config.yaml', scratch_dir=tmp_path / 'scratch')
+    assert runner.work_dir == tmp_path / 'scratch' / 'delt-hit-exp'
+    reads_path = runner.run(with_processing=False, keep_intermediate=True)
+    assert read_counts(reads_path) == expected
+
+    # final files are moved to save_dir, intermediate reads stay in scratch to resume from
+    published = sorted(path.name for path in runner.output_dir.iterdir())
+    assert published == ['0-S0.cutadapt.json', '0-S0.cutadapt.log', '1-C0.cutadapt.json', '1-C0.cutadapt.log',
+                         '2-B0.cutadapt.json', '2-B0.cutadapt.log', '3-S1.cutadapt.json', '3-S1.cutadapt.log',
+                         'reads_with_adapters.gz']
+    assert sorted(path.name for path in runner.work_dir.iterdir()) == \
+           ['0-S0.fastq.gz', '1-C0.fastq.gz', '2-B0.fastq.gz', '3-S1.fastq.gz']
+
+    reads_path.unlink()
+    runner.run(with_processing=False, resume_from='3-S1')
+    assert read_counts(reads_path) == expected
+    # without keep_intermediate the scratch directory is removed once the final files are published
+    assert not runner.work_dir.exists()
@@ -0,0 +1,35 @@
+import gzip
+
+from delt_hit.demultiplex.sampling import BGZF_EOF, ReadSampler, bgzf_block, bgzf_blocks, is_bgzf
+
+
+def write_bgzf(path, data: bytes, block_size: int = 1000):
+    with open(path, 'wb') as f:
+        for start in range(0, len(data), block_size):
+            f.write(bgzf_block(data[start:start + block_size]))
+        f.write(BGZF_EOF)
+
+
+def test_sampling(tmp_path):
+    # quality lines starting with @ must not be taken for read names
+    records = [(b'@r%d\n' % i, b'ACGT' * (i % 5 + 1) + b'\n', b'+\n', b'@III' * (i % 5 + 1) + b'\n')
+               for i in range(2000)]
+    data = b''.join(b''.join(record) for record in records)
+    write_bgzf(tmp_path / 'b.fastq.gz', data)
+    (tmp_path / 'g.fastq.gz').write_bytes(gzip.compress(data))
+    assert is_bgzf(tmp_path / 'b.fastq.gz') and not is_bgzf(tmp_path / 'g.fastq.gz')
+    assert len(bgzf_blocks(tmp_path / 'b.fastq.gz')) > 20
+
+    for name in ['b.fastq.gz', 'g.fastq.gz']:
+        sample = list(ReadSampler(300, seed=1).sample(tmp_path / name))
+        assert len(sample) == 300 and set(sample) <= set(records)
+        assert sample == sorted(sample, key=records.index)
+        assert sample == list(ReadSampler(300, seed=1).sample(tmp_path / name))
+        assert list(ReadSampler(5000).sample(tmp_path / name)) == records
+        assert 0 < len(list(ReadSampler(0.2, seed=2).sample(tmp_path / name))) < 1000
+
+    # only the sampled blocks of BGZF files are read
+    for name, complete in [('b.fastq.gz', False), ('g.fastq.gz', True)]:
+        sampler = ReadSampler(100, seed=1)
+        list(sampler.sample(tmp_path / name))
+        assert (sampler.bytes_read == (tmp_path / name).stat().st_size) == complete and sampler.bytes_read > 0
@@ -0,0 +1,34 @@
+from collections import Counter
+
+import numpy as np
+
+from delt_hit.demultiplex.sketch import TopKCounter
+
+
+def test_top_k_counter():
+    rng = np.random.default_rng(0)
+    keys = (rng.zipf(1.5, 50_000) % 5000).tolist()
+    counter = TopKCounter(k=20, width=2 ** 12, batch_size=1000)
+    for key in keys:
+        counter.add((0, 1), (key,), 2)
+
+    true = Counter(keys)
+    estimates = counter.counts()[(0, 1)]
+    assert len(estimates) == 20
+    assert all(estimates[(key,)] >= 2 * true[key] for (key,) in estimates)
+    assert {(key,) for key, _ in true.most_common(5)} <= set(estimates)
+
+
+def test_top_k_counter_selections():
+    counter = TopKCounter(k=2, width=2 ** 12, batch_size=7)
+    nbytes = counter.nbytes
+    for s0 in range(20):
+        for s1 in range(20):
+            counter.add((s0, s1), (s0,), 3)
+            counter.add((s0, s1), (s1 + 100,), 1)
+            counter.add((s0, s1), (s1 + 100,), 1)
+    # one sketch is shared by all selection ID combinations, each keeps its own top barcodes
+    assert counter.nbytes == nbytes
+    counts = counter.counts()
+    assert len(counts) == 400 and counts[(3, 5)].keys() == {(3,), (105,)}
+    assert all(counts[(3, 5)][key] >= true for key, true in [((3,), 3), ((105,), 2)])
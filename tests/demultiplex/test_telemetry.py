@@ -0,0 +1,23 @@
+import json
+import sys
+
+from delt_hit.demultiplex.telemetry import run_stage, summarize
+
+
+def test_run_stage(tmp_path):
+    log_path = tmp_path / 'telemetry.jsonl'
+    report_path = tmp_path / 'report.json'
+    report_path.write_text(json.dumps({'read_counts': {'input': 100, 'output': 80}}))
+    output_path = tmp_path / 'out.txt'
+
+    code = f'open({str(output_path)!r}, "w").write("x" * 1000)'
+    assert run_stage([sys.executable, '-c', code], log_path=log_path, stage='0-B0', run_id='a',
+                     outputs=[output_path], report_path=report_path) == 0
+    assert run_stage([sys.executable, '-c', 'raise SystemExit(3)'], log_path=log_path, stage='1-B1', run_id='a') == 3
+
+    stages = summarize(log_path)
+    assert [s['stage'] for s in stages] == ['0-B0', '1-B1']
+    assert [s['status'] for s in stages] == ['done', 'failed']
+    assert stages[0]['reads_in'] == 100 and stages[0]['reads_out'] == 80
+    assert stages[0]['bytes_written'] == 1000
+    assert stages[0]['peak_rss_bytes'] > 0 and stages[0]['cpu_seconds'] > 0
@@ -0,0 +1,26 @@
+import random
+
+from delt_hit.demultiplex.postprocess import extract_ids
+from delt_hit.demultiplex.umi import UmiCounter
+
+
+def test_extract_umi():
+    ids = extract_ids('@r1 count=3?0-S0.1=ACGT?1-B0.4=GGCC?2-U0=ACGTAC?3-S1.0=TTTT\n')
+    assert ids['selection_ids'] == (1, 0) and ids['barcodes'] == (5,)
+    assert ids['umi'] == 'ACGTAC' and ids['count'] == 3 and len(ids['adapters']) == 3
+    assert extract_ids('@r1?0-S0.1=ACGT')['umi'] is None
+
+
+def test_umi_counter():
+    umis = UmiCounter(4, collapse_errors=True)
+    for umi in ['AAAA', 'AAAC', 'AACC', 'TTTT', 'TTTT', 'GGGN', 'GG', None]:
+        umis.add('a', umi)
+    assert umis.molecules('a') == 2 and umis.num_invalid == 3
+
+    random.seed(0)
+    umis = UmiCounter(12, precision=10)
+    values = {''.join(random.choices('ACGT', k=12)) for _ in range(5000)}
+    for umi in [*values, *values]:
+        umis.add(((0,), (1,)), umi)
+    assert ((0,), (1,)) in umis.sketches
+    assert abs(umis.counts()[(0,)][(1,)] - len(values)) < 0.1 * len(values)
@@ -0,0 +1,33 @@
+from pathlib import Path
+
+import pandas as pd
+
+from delt_hit.demultiplex.parser import Workbook, open_workbook
+
+path = Path(__file__).parents[2] / 'templates' / 'library.xlsx'
+
+
+def test_workbook_parses_sheets_once():
+    with Workbook(path) as workbook:
+        calls = []
+        parse = workbook.file.parse
+        workbook.file.parse = lambda name: calls.append(name) or parse(name)
+
+        name = workbook.sheet_names[0]
+        first = workbook.sheet(name)
+        first.iloc[:, 0] = None
+        second = workbook.sheet(name)
+        assert calls == [name]
+        # callers get copies, changing one does not affect later reads
+        assert second is not first and not second.iloc[:, 0].isna().all()
+        pd.testing.assert_frame_equal(second, pd.read_excel(path, sheet_name=name))
+        # a workbook passed in stays open, one opened from a path is closed after use
+        with open_workbook(workbook) as wb:
+            assert wb is workbook
+        assert workbook.sheet(workbook.sheet_names[1]) is not None
+
+    with open_workbook(path) as wb:
+        closed = []
+        close = wb.file.close
+        wb.file.close = lambda: closed.append(True) or close()
+    assert closed == [True]
@@ -0,0 +1,16 @@
+import pandas as pd
+import pytest
+
+from delt_hit.library.lookup import CodeLookup, library_to_counts_codes
+
+
+@pytest.mark.parametrize('max_dense_size', [2 ** 26, 1])
+def test_annotate_counts(max_dense_size):
+    library = pd.DataFrame({'code_0': [0, 0, 1, 2], 'code_1': [0, 1, 1, 3], 'smiles': ['A', 'B', 'C', 'D']})
+    lookup = CodeLookup(library_to_counts_codes(library), max_dense_size=max_dense_size)
+
+    counts = pd.DataFrame({'code_1': [3, 1, 9], 'code_2': [4, 2, 1], 'count': [5, 4, 3]})
+    annotated = lookup.annotate(counts)
+
+    assert annotated.smiles.iloc[:2].tolist() == ['D', 'B']
+    assert annotated.smiles.isna().iloc[2]
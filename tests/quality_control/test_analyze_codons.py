@@ -0,0 +1,43 @@
+from itertools import combinations, product
+
+import numpy as np
+from Levenshtein import distance, hamming
+
+from delt_hit.demultiplex.distance import hamming_blocks
+from delt_hit.quality_control.analyze_codons import compute_overlap, distance_histogram
+
+
+def brute_force(pairs, metric):
+    return np.bincount([metric(a, b) for a, b in pairs])
+
+
+def test_distance_histogram():
+    rng = np.random.default_rng(0)
+    # more codons than fit in one block, of different lengths for Levenshtein
+    codons = [''.join(rng.choice(list('ACGT'), size=rng.integers(6, 9))) for _ in range(300)]
+    other = [''.join(rng.choice(list('ACGT'), size=7)) for _ in range(20)]
+
+    assert np.array_equal(distance_histogram(codons, metric='levenshtein'),
+                          brute_force(combinations(codons, 2), distance))
+    assert np.array_equal(distance_histogram(codons, other, metric='levenshtein'),
+                          brute_force(product(codons, other), distance))
+
+    codons = [codon[:6] for codon in codons]
+    assert np.array_equal(distance_histogram(codons, metric='hamming'),
+                          brute_force(combinations(codons, 2), hamming))
+    assert np.array_equal(distance_histogram(codons), brute_force(combinations(codons, 2), hamming))
+
+    # triangular blocks hold the columns from the block's first row on
+    for (start, block), (_, full) in zip(hamming_blocks(codons, block_size=64, triangular=True),
+                                         hamming_blocks(codons, block_size=64)):
+        assert np.array_equal(block, full[:, start:])
+
+
+def test_compute_overlap():
+    codons = {'B0': ['ACG', 'TTA\n', 'GGA'], 'B1': ['AAA', 'CAT', 'GTC', 'TCA'], 'B2': ['TTT']}
+    overlap = compute_overlap(codons)
+    for (a, b), stats in overlap.items():
+        matches = sum(x.strip()[-1] == y.strip()[0] for x, y in product(codons[a], codons[b]))
+        assert stats['number_of_matches'] == matches
+        assert stats['number_of_comparisons'] == len(codons[a]) * len(codons[b])
+    assert overlap[('B0', 'B1')]['proportion_of_matches'] == 3 / 12
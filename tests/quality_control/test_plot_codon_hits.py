@@ -0,0 +1,31 @@
+import json
+
+import numpy as np
+
+from delt_hit.quality_control.plot_codon_hits import read_report, read_reports
+
+
+def write_report(path, trimmed: dict, reads_in: int, reads_out: int):
+    adapters = [{'name': name, 'five_prime_end': {'trimmed_lengths': [{'counts': counts} for counts in lengths]}}
+                for name, lengths in trimmed.items()]
+    path.write_text(json.dumps({'adapters_read1': adapters, 'read_counts': {'input': reads_in, 'output': reads_out}}))
+    return path
+
+
+def test_read_reports(tmp_path):
+    first = write_report(tmp_path / 'a.cutadapt.json', {'2-B0.0': [[5, 1], [2]], '2-B0.1': [[3]], '2-B0.2': []},
+                         reads_in=20, reads_out=11)
+    second = write_report(tmp_path / 'b.cutadapt.json', {'2-B0.2': [[1, 1, 4]]}, reads_in=9, reads_out=6)
+    empty = write_report(tmp_path / 'c.cutadapt.json', {'1-C0.0': []}, reads_in=5, reads_out=0)
+
+    report = read_report(first)
+    assert report['region_id'] == '2-B0' and (report['reads_in'], report['reads_out']) == (20, 11)
+    assert np.array_equal(report['errors'], [[7, 1], [3, 0]])
+    assert read_report(empty) is None
+
+    for processes in [1, 2]:
+        regions = read_reports([first, second, empty], processes=processes)
+        assert list(regions) == ['2-B0']
+        merged = regions['2-B0']
+        assert np.array_equal(merged['errors'], [[7, 1, 0], [3, 0, 0], [1, 1, 4]])
+        assert (merged['reads_in'], merged['reads_out']) == (29, 17)
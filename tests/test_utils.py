@@ -0,0 +1,49 @@
+import datetime
+import json
+import os
+from pathlib import Path
+
+from delt_hit.demultiplex import config_from_excel
+from delt_hit.utils import LazyTables, read_config, read_yaml, write_config_tables, write_yaml
+
+template = Path(__file__).parents[1] / 'templates' / 'library.xlsx'
+
+
+def dump(config) -> str:
+    """Serialize a config with its lazy tables, NaN compares equal in this form."""
+    def default(value):
+        return dict(value) if isinstance(value, LazyTables) else str(value)
+    return json.dumps(config, default=default, sort_keys=True)
+
+
+def test_config_tables(tmp_path):
+    path = tmp_path / 'config.yaml'
+    write_yaml(config_from_excel(template), path)
+    assert read_config(path) == read_yaml(path)
+
+    save_dir = write_config_tables(read_yaml(path), path)
+    assert (save_dir / 'header.json').exists()
+    config = read_config(path)
+    assert isinstance(config['whitelists'], LazyTables) and isinstance(config['catalog'], LazyTables)
+    assert list(config) == list(read_yaml(path))
+    assert dump(config) == dump(read_yaml(path))
+
+    # editing the YAML makes the copy stale
+    stat = path.stat()
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+    assert not isinstance(read_config(path)['whitelists'], LazyTables)
+
+    # a missing copy falls back to the YAML
+    write_config_tables(read_yaml(path), path)
+    assert isinstance(read_config(path)['whitelists'], LazyTables)
+    (save_dir / 'header.json').unlink()
+    assert dump(read_config(path)) == dump(read_yaml(path))
+
+
+def test_config_tables_dates(tmp_path):
+    path = tmp_path / 'config.yaml'
+    config = config_from_excel(template)
+    config['experiment']['date'] = datetime.date(2024, 5, 17)
+    write_yaml(config, path)
+    write_config_tables(read_yaml(path), path)
+    assert read_config(path)['experiment']['date'] == '2024-05-17'